@@ -0,0 +1,184 @@
+"""
+ASSETS STATIQUES — Likoo
+Page, feuilles de style et scripts : empreinte de contenu, variantes précompressées, index en mémoire
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : variantes gzip seulement
+    brotli = None
+
+# Un an : une URL à empreinte ne change jamais de contenu
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Page et URL sans empreinte : toujours revalidées (304 si inchangées)
+REVALIDATE = 'no-cache'
+# Encodages proposés, par ordre de préférence à qualité égale
+ENCODINGS = ('br', 'gzip')
+# En dessous, la compression ne vaut pas l'en-tête Content-Encoding
+MIN_COMPRESS_SIZE = 512
+
+
+class Asset:
+    """Un fichier servi : variantes {encodage: octets} et leurs ETag"""
+
+    __slots__ = ('name', 'url', 'content_type', 'cache_control', 'digest', 'variants', 'etags', 'mtime')
+
+    def __init__(self, name, url, content_type, cache_control, digest, variants, mtime):
+        self.name = name
+        self.url = url
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = digest
+        self.variants = variants
+        # Un ETag fort par représentation ; toutes désignent le même contenu
+        self.etags = {encoding: digest if encoding == 'identity' else f'{digest}-{encoding}'
+                      for encoding in variants}
+        self.mtime = mtime
+
+
+class AssetIndex:
+    """Assets construits au démarrage, servis depuis la mémoire.
+
+    Chaque fichier reçoit une URL à empreinte (style.css -> /style.<sha>.css,
+    Cache-Control immutable) ; les références de la page (href / src) sont
+    réécrites vers ces URL avant de calculer l'empreinte de la page. La page
+    elle-même et les anciennes URL sans empreinte restent servies avec
+    revalidation. Variantes gzip (et brotli si le module est installé)
+    calculées une fois ; le client reçoit la plus petite qu'il accepte.
+
+    Aucun accès disque par requête ; en mode debug, rebuild_if_changed()
+    reconstruit l'index quand un fichier a été modifié.
+    """
+
+    def __init__(self, root, page, assets):
+        self.root = root
+        self.page = page
+        self.assets = tuple(assets)
+        self._by_url = {}
+        self._lock = threading.Lock()
+        self.stats = {'builds': 0, 'hits': 0, 'not_modified': 0, 'bytes_sent': 0,
+                      'encodings': dict.fromkeys(ENCODINGS + ('identity',), 0)}
+
+    def build(self):
+        by_url = {}
+        urls = {}
+        for name in self.assets:
+            path = self.root / name
+            data = path.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            stem, dot, ext = name.rpartition('.')
+            url = f'/{stem}.{digest}.{ext}' if dot else f'/{name}.{digest}'
+            asset = self._asset(name, url, data, digest, IMMUTABLE, path.stat().st_mtime)
+            by_url[url] = asset
+            # Ancienne URL (page en cache chez un client) : même contenu, revalidé
+            by_url[f'/{name}'] = self._with_cache(asset, f'/{name}', REVALIDATE)
+            urls[name] = url
+        path = self.root / self.page
+        html = path.read_text(encoding='utf-8')
+        for name, url in urls.items():
+            html = re.sub(r'''((?:href|src)=["'])/?%s(["'])''' % re.escape(name), rf'\g<1>{url}\g<2>', html)
+        data = html.encode('utf-8')
+        page = self._asset(self.page, '/', data, hashlib.sha256(data).hexdigest()[:16], REVALIDATE,
+                           path.stat().st_mtime)
+        by_url['/'] = page
+        by_url[f'/{self.page}'] = self._with_cache(page, f'/{self.page}', REVALIDATE)
+        with self._lock:
+            self._by_url = by_url
+            self.stats['builds'] += 1
+        return urls
+
+    def rebuild_if_changed(self):
+        """Mode debug : reconstruit si un fichier source a changé (un stat par fichier)"""
+        mtimes = {asset.name: asset.mtime for asset in self._by_url.values()}
+        for name, mtime in mtimes.items():
+            try:
+                if (self.root / name).stat().st_mtime != mtime:
+                    self.build()
+                    return True
+            except OSError:
+                return False
+        return False
+
+    def get(self, url):
+        return self._by_url.get(url)
+
+    def select(self, asset, accept_encoding, if_none_match):
+        """(statut, encodage, octets) : 304 si l'ETag du client correspond,
+        sinon la plus petite variante acceptée"""
+        accepted = parse_accept_encoding(accept_encoding)
+        candidates = [e for e in asset.variants if e == 'identity' or accepted.get(e, 0) > 0]
+        encoding = min(candidates, key=lambda e: len(asset.variants[e]))
+        with self._lock:
+            self.stats['hits'] += 1
+            if if_none_match and matches(if_none_match, asset.etags.values()):
+                self.stats['not_modified'] += 1
+                return 304, encoding, b''
+            body = asset.variants[encoding]
+            self.stats['encodings'][encoding] += 1
+            self.stats['bytes_sent'] += len(body)
+        return 200, encoding, body
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats,
+                        encodings=dict(self.stats['encodings']),
+                        brotli=brotli is not None,
+                        files={asset.name: {enc: len(body) for enc, body in asset.variants.items()}
+                               for asset in self._by_url.values()})
+
+    @staticmethod
+    def _asset(name, url, data, digest, cache_control, mtime):
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'text/javascript'):
+            content_type += '; charset=utf-8'
+        variants = {'identity': data}
+        if len(data) >= MIN_COMPRESS_SIZE:
+            compressed = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli:
+                compressed['br'] = brotli.compress(data, quality=11)
+            for encoding, body in compressed.items():
+                if len(body) < len(data):
+                    variants[encoding] = body
+        return Asset(name, url, content_type, cache_control, digest, variants, mtime)
+
+    @staticmethod
+    def _with_cache(asset, url, cache_control):
+        return Asset(asset.name, url, asset.content_type, cache_control, asset.digest, asset.variants,
+                     asset.mtime)
+
+
+def parse_accept_encoding(header):
+    """'gzip, br;q=0.8, *;q=0' -> {'gzip': 1.0, 'br': 0.8, ...}"""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    wildcard = accepted.pop('*', None)
+    if wildcard is not None:
+        for encoding in ENCODINGS:
+            accepted.setdefault(encoding, wildcard)
+    return accepted
+
+
+def matches(if_none_match, etags):
+    """If-None-Match (liste d'ETag, éventuellement faibles, ou '*') contre nos ETag"""
+    if if_none_match.strip() == '*':
+        return True
+    tags = {tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')}
+    return any(etag in tags for etag in etags)
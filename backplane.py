@@ -0,0 +1,397 @@
+"""
+BACKPLANE — Likoo
+Hub local (TCP) reliant les workers : pub/sub Socket.IO, état partagé et réplication
+"""
+
+import base64
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from socketio.pubsub_manager import PubSubManager
+
+from shared_store import MemoryStore, STORE_OPERATIONS
+
+# Trame : type (1 octet) + longueur (4 octets) + charge utile (JSON, voir
+# encode). Aucune trame ne peut exécuter de code : un pair qui atteint le
+# port ne peut qu'émettre des événements et lire / écrire le magasin partagé,
+# d'où l'écoute sur la boucle locale par défaut.
+_HEADER = struct.Struct('>cI')
+SUBSCRIBE = b'S'
+PUBLISH = b'P'
+MESSAGE = b'M'
+REQUEST = b'K'
+RESPONSE = b'R'
+
+
+def parse_address(url):
+    """'tcp://127.0.0.1:5600' -> ('127.0.0.1', 5600)"""
+    host, _, port = url.split('://', 1)[-1].rstrip('/').rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+# Clés des balises ; un dict reçu d'un client qui en utilise une est lui-même
+# balisé (__dict__), pour ne jamais être pris pour une balise au décodage
+_TAGS = frozenset(('__dict__', '__tuple__', '__set__', '__bytes__'))
+
+
+def encode(obj):
+    """Charge utile JSON ; octets, tuples, ensembles et dicts à clés non
+    textuelles (ou réservées aux balises) sont balisés pour être restitués
+    à l'identique"""
+    return json.dumps(_tag(obj), separators=(',', ':')).encode()
+
+
+def decode(payload):
+    return json.loads(payload, object_hook=_untag)
+
+
+def _tag(obj):
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, dict):
+        if all(isinstance(key, str) and key not in _TAGS for key in obj):
+            return {key: _tag(value) for key, value in obj.items()}
+        return {'__dict__': [[_tag(key), _tag(value)] for key, value in obj.items()]}
+    if isinstance(obj, list):
+        return [_tag(item) for item in obj]
+    if isinstance(obj, tuple):
+        return {'__tuple__': [_tag(item) for item in obj]}
+    if isinstance(obj, (set, frozenset)):
+        return {'__set__': [_tag(item) for item in obj]}
+    if isinstance(obj, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(obj).decode('ascii')}
+    raise TypeError(f'Type non transmissible par le backplane: {type(obj).__name__}')
+
+
+def _untag(obj):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if key == '__tuple__':
+            return tuple(value)
+        if key == '__set__':
+            return set(value)
+        if key == '__bytes__':
+            return base64.b64decode(value)
+        if key == '__dict__':
+            return {_hashable(k): v for k, v in value}
+    return obj
+
+
+def _hashable(key):
+    # Un tuple décodé est déjà un tuple ; une liste ne peut pas être une clé
+    return tuple(key) if isinstance(key, list) else key
+
+
+def send_frame(sock, kind, payload=b''):
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def read_frame(reader):
+    """(type, charge utile), ou None si la connexion est fermée"""
+    header = reader.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    kind, length = _HEADER.unpack(header)
+    payload = reader.read(length)
+    if len(payload) < length:
+        return None
+    return kind, payload
+
+
+# ═══════════════════════════════════════════════════
+# HUB
+# ═══════════════════════════════════════════════════
+
+class _Subscriber:
+    """Worker abonné : les messages lui sont écrits par un thread dédié, pour
+    qu'un worker lent ne bloque pas la diffusion vers les autres"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.pending = []
+        self.cond = threading.Condition()
+        self.closed = False
+        threading.Thread(target=self._write, daemon=True).start()
+
+    def push(self, frame):
+        with self.cond:
+            self.pending.append(frame)
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def _write(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                frames, self.pending = self.pending, []
+            try:
+                self.sock.sendall(b''.join(frames))
+            except OSError:
+                return
+
+
+class _HubHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        hub = self.server.hub
+        subscriber = None
+        try:
+            while True:
+                frame = read_frame(self.rfile)
+                if frame is None:
+                    return
+                kind, payload = frame
+                if kind == PUBLISH:
+                    hub.broadcast(payload)
+                elif kind == REQUEST:
+                    send_frame(self.request, RESPONSE, hub.execute(payload))
+                elif kind == SUBSCRIBE and subscriber is None:
+                    subscriber = hub.subscribe(self.request)
+        except OSError:
+            pass
+        finally:
+            if subscriber:
+                hub.unsubscribe(subscriber)
+
+
+class _HubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class BackplaneHub:
+    """Relais entre workers : diffuse chaque message publié à tous les abonnés
+    et sert le magasin partagé (MemoryStore) aux requêtes des workers.
+
+    Lancé par cluster.py dans le processus superviseur, ou dans un thread pour
+    les tests et benchmarks (port=0 : port libre, voir address).
+    """
+
+    def __init__(self, host='127.0.0.1', port=5600):
+        self.store = MemoryStore()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._server = _HubServer((host, port), _HubHandler)
+        self._server.hub = self
+        self.address = self._server.server_address
+        self.stats = {'published': 0, 'delivered': 0, 'requests': 0}
+
+    @property
+    def url(self):
+        return f'tcp://{self.address[0]}:{self.address[1]}'
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='backplane-hub', daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def subscribe(self, sock):
+        subscriber = _Subscriber(sock)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def broadcast(self, payload):
+        # La trame est construite une fois et réutilisée pour chaque abonné
+        frame = _HEADER.pack(MESSAGE, len(payload)) + payload
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.stats['published'] += 1
+            self.stats['delivered'] += len(subscribers)
+        for subscriber in subscribers:
+            subscriber.push(frame)
+
+    def execute(self, payload):
+        self.stats['requests'] += 1
+        try:
+            op, args, kwargs = decode(payload)
+            result = [True, self.store.execute(op, args, kwargs)]
+        except Exception as e:
+            result = [False, repr(e)]
+        try:
+            return encode(result)
+        except TypeError as e:
+            return encode([False, repr(e)])
+
+
+# ═══════════════════════════════════════════════════
+# CÔTÉ WORKER
+# ═══════════════════════════════════════════════════
+
+class LocalSocketManager(PubSubManager):
+    """Client manager Socket.IO dont le pub/sub passe par le hub local.
+
+    Les emits vers une room ou un sid sont publiés au hub et rejoués par chaque
+    worker pour ses propres sockets (comme le RedisManager de python-socketio,
+    sans service externe). Les messages 'app' ne concernent pas Socket.IO :
+    ils sont transmis au ClusterBus (réplication des caches entre workers).
+    """
+    name = 'localsocket'
+
+    def __init__(self, url='tcp://127.0.0.1:5600', channel='socketio', write_only=False,
+                 logger=None, bus=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.address = parse_address(url)
+        self.bus = bus
+        if bus:
+            bus.attach(self)
+        self._pub_sock = None
+        self._pub_lock = threading.Lock()
+
+    def publish_app(self, message):
+        self._publish(dict(message, method='app', host_id=self.host_id))
+
+    def _publish(self, data):
+        payload = encode(data)
+        with self._pub_lock:
+            for attempt in (1, 2):
+                try:
+                    if self._pub_sock is None:
+                        self._pub_sock = socket.create_connection(self.address)
+                    send_frame(self._pub_sock, PUBLISH, payload)
+                    return
+                except OSError:
+                    self._pub_sock = None
+                    if attempt == 2:
+                        raise
+
+    def _listen(self):
+        delay = 0.1
+        while True:
+            try:
+                sock = socket.create_connection(self.address)
+                send_frame(sock, SUBSCRIBE)
+                reader = sock.makefile('rb')
+                delay = 0.1
+                while True:
+                    frame = read_frame(reader)
+                    if frame is None:
+                        break
+                    try:
+                        message = decode(frame[1])
+                    except Exception as e:
+                        # Trame invalide : ignorée, l'écoute continue
+                        self._get_logger().error(f'Trame du backplane illisible ignorée: {e!r}')
+                        continue
+                    if message.get('method') == 'app':
+                        if message.get('host_id') != self.host_id and self.bus:
+                            self.bus.dispatch(message)
+                        continue
+                    yield message
+            except OSError as e:
+                self._get_logger().warning(f'Backplane indisponible ({e}), reconnexion')
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+
+
+class SocketStore:
+    """Magasin partagé servi par le hub : même interface que MemoryStore"""
+
+    def __init__(self, url):
+        self.address = parse_address(url)
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _call(self, op, *args, **kwargs):
+        payload = encode([op, args, kwargs])
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._sock = socket.create_connection(self.address)
+                        self._reader = self._sock.makefile('rb')
+                    send_frame(self._sock, REQUEST, payload)
+                    frame = read_frame(self._reader)
+                    if frame is None:
+                        raise ConnectionError('Hub déconnecté')
+                    break
+                except OSError:
+                    self._sock = self._reader = None
+                    if attempt == 2:
+                        raise
+        ok, result = decode(frame[1])
+        if not ok:
+            raise RuntimeError(f'Erreur du magasin partagé: {result}')
+        return result
+
+
+for _op in STORE_OPERATIONS:
+    setattr(SocketStore, _op, lambda self, *args, _op=_op, **kwargs: self._call(_op, *args, **kwargs))
+
+
+class ClusterBus:
+    """Réplique entre workers les appels qui modifient un état local.
+
+    replicate(name, obj, *methods) remplace les méthodes de l'instance : l'appel
+    s'exécute localement puis est publié, et chaque autre worker rejoue la
+    méthode d'origine sur son propre objet. Seul l'appel le plus externe est
+    publié : ce qu'il déclenche (callbacks, invalidations) est recalculé par
+    chaque worker. Arguments et résultats restent des types simples (voir encode).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._manager = None
+        self._targets = {}  # 'nom.méthode' -> méthode d'origine
+        self._local = threading.local()
+        self.stats = {'published': 0, 'applied': 0, 'errors': 0}
+
+    def attach(self, manager):
+        self._manager = manager
+
+    def replicate(self, name, obj, *methods):
+        for method in methods:
+            key = f'{name}.{method}'
+            original = self._targets[key] = getattr(obj, method)
+            setattr(obj, method, self._wrap(key, original))
+
+    def _wrap(self, key, original):
+        def replicated(*args, **kwargs):
+            depth = getattr(self._local, 'depth', 0)
+            self._local.depth = depth + 1
+            try:
+                result = original(*args, **kwargs)
+            finally:
+                self._local.depth = depth
+            if depth == 0 and self._manager:
+                self._manager.publish_app({'call': key, 'args': args, 'kwargs': kwargs})
+                self.stats['published'] += 1
+            return result
+        return replicated
+
+    def dispatch(self, message):
+        target = self._targets.get(message.get('call'))
+        if target is None:
+            return
+        self._local.depth = 1  # rejeu : rien n'est republié
+        try:
+            with self.app.app_context():
+                target(*message['args'], **message['kwargs'])
+            self.stats['applied'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"[CLUSTER] Erreur de réplication {message.get('call')}: {e}")
+        finally:
+            self._local.depth = 0
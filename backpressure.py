@@ -0,0 +1,111 @@
+"""
+CONSOMMATEURS LENTS — Likoo
+File de sortie bornée par socket : au-delà, événements abandonnés ou socket déconnecté
+"""
+
+import threading
+
+from engineio import packet as eio_packet
+from socketio import packet as sio_packet
+
+POLICIES = ('drop', 'disconnect')
+
+
+class SlowConsumerGuard:
+    """Surveille la file de sortie Engine.IO de chaque socket.
+
+    Chaque paquet d'événement passe par server._send_eio_packet ; si la file
+    du destinataire (paquets pas encore écrits sur sa connexion : long polling
+    non relevé, websocket bloqué par TCP) dépasse limit, alors :
+      - 'drop' : l'événement n'est pas mis en file (avec ses pièces jointes
+        binaires) ; quand la file est redescendue, le client reçoit d'abord
+        'events_dropped' {count} et recharge la vue ouverte ;
+      - 'disconnect' : le socket est fermé (le client se reconnecte et
+        recharge tout), sans bloquer l'émetteur.
+    Les paquets de contrôle (connect, ack, ping) ne sont jamais retenus.
+    """
+
+    def __init__(self, server, limit=512, policy='disconnect'):
+        self._server = server
+        self.limit = limit
+        self.policy = policy if policy in POLICIES else 'disconnect'
+        self._dropped = {}  # eio_sid -> événements abandonnés non signalés
+        self._skip_binary = {}  # eio_sid -> pièces jointes restant à abandonner
+        self._lock = threading.Lock()
+        self._send = None
+        self.stats = {'dropped': 0, 'disconnected': 0, 'notified': 0, 'max_queue': 0}
+
+    def install(self):
+        """Interpose le contrôle devant l'envoi des paquets d'événements"""
+        if self._send is None and self.limit > 0:
+            self._send = self._server._send_eio_packet
+            self._server._send_eio_packet = self.send
+
+    def send(self, eio_sid, pkt):
+        data = pkt.data
+        if isinstance(data, bytes):
+            # Pièce jointe binaire : suit toujours son paquet texte
+            if self._skip_binary.get(eio_sid):
+                with self._lock:
+                    self._skip_binary[eio_sid] -= 1
+                    if not self._skip_binary[eio_sid]:
+                        del self._skip_binary[eio_sid]
+                return
+            return self._send(eio_sid, pkt)
+        if not isinstance(data, str) or data[:1] not in ('2', '5'):  # EVENT, BINARY_EVENT
+            return self._send(eio_sid, pkt)
+        socket = self._server.eio.sockets.get(eio_sid)
+        queued = socket.queue.qsize() if socket is not None else 0
+        if queued > self.stats['max_queue']:
+            self.stats['max_queue'] = queued
+        if queued >= self.limit:
+            self._overflow(eio_sid, socket, data)
+            return
+        if eio_sid in self._dropped:
+            self._notify(eio_sid)
+        return self._send(eio_sid, pkt)
+
+    def _overflow(self, eio_sid, socket, data):
+        if self.policy == 'disconnect':
+            if not socket.closing and not socket.closed:
+                with self._lock:
+                    self.stats['disconnected'] += 1
+                print(f"[BACKPRESSURE] File pleine ({self.limit}), déconnexion de {eio_sid}")
+                # close() déclenche le handler 'disconnect' : hors du thread émetteur
+                self._server.start_background_task(socket.close, wait=False, abort=True)
+            return
+        with self._lock:
+            self.stats['dropped'] += 1
+            self._dropped[eio_sid] = self._dropped.get(eio_sid, 0) + 1
+            attachments = binary_attachments(data)
+            if attachments:
+                self._skip_binary[eio_sid] = self._skip_binary.get(eio_sid, 0) + attachments
+
+    def _notify(self, eio_sid):
+        with self._lock:
+            count = self._dropped.pop(eio_sid, 0)
+            self.stats['notified'] += 1
+        encoded = sio_packet.Packet(sio_packet.EVENT, data=['events_dropped', {'count': count}]).encode()
+        self._send(eio_sid, eio_packet.Packet(eio_packet.MESSAGE, encoded))
+
+    def prune(self):
+        """Oublie les sockets fermés"""
+        sockets = self._server.eio.sockets
+        with self._lock:
+            for table in (self._dropped, self._skip_binary):
+                for eio_sid in [s for s in table if s not in sockets]:
+                    del table[eio_sid]
+
+    def snapshot(self):
+        self.prune()
+        with self._lock:
+            return dict(self.stats, enabled=self._send is not None, limit=self.limit, policy=self.policy,
+                        lagging=len(self._dropped))
+
+
+def binary_attachments(data):
+    """Nombre de pièces jointes binaires annoncées par un paquet BINARY_EVENT ('5<n>-...')"""
+    if not data.startswith('5'):
+        return 0
+    count, _, _ = data[1:].partition('-')
+    return int(count) if count.isdigit() else 0
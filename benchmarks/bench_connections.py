@@ -0,0 +1,175 @@
+"""
+BENCHMARK — Connexions simultanées selon le mode de service
+Lance server.py dans chaque mode disponible (ASYNC_MODE), ouvre N sessions
+Socket.IO (transport polling, une requête longue en attente par session, comme
+un vrai client) puis mesure : sessions établies, échecs, threads et mémoire du
+serveur, latence de /health sous charge.
+
+    python benchmarks/bench_connections.py [--modes threading,eventlet,gevent] [--clients 1000,3000]
+
+Le serveur utilise une base SQLite jetable (DATABASE_URL), supprimée à la fin.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = '127.0.0.1'
+
+
+async def http(port, method, path, body=b''):
+    """Requête HTTP/1.0 minimale (une connexion par requête) : corps de la réponse"""
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(f'{method} {path} HTTP/1.0\r\nHost: {HOST}\r\nContent-Type: text/plain\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    if not head.startswith(b'HTTP/1.') or b' 200 ' not in head.split(b'\r\n', 1)[0]:
+        raise ConnectionError(head.split(b'\r\n', 1)[0].decode(errors='replace'))
+    if b'transfer-encoding: chunked' in head.lower():
+        content = dechunk(content)
+    return content
+
+
+def dechunk(data):
+    body = b''
+    while data:
+        size, _, data = data.partition(b'\r\n')
+        size = int(size, 16)
+        if not size:
+            break
+        body, data = body + data[:size], data[size + 2:]
+    return body
+
+
+async def open_session(port, held):
+    """Handshake Engine.IO, connexion au namespace, puis requête longue laissée ouverte"""
+    content = await http(port, 'GET', '/socket.io/?EIO=4&transport=polling')
+    sid = json.loads(content[content.index(b'{'):])['sid']
+    path = f'/socket.io/?EIO=4&transport=polling&sid={sid}'
+    await http(port, 'POST', path, b'40')
+    await http(port, 'GET', path)  # réponse immédiate au connect
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(f'GET {path} HTTP/1.0\r\nHost: {HOST}\r\n\r\n'.encode())
+    await writer.drain()
+    held.append(writer)
+
+
+async def load(port, clients, concurrency, hold):
+    held = []
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = []
+
+    async def one():
+        async with semaphore:
+            try:
+                await asyncio.wait_for(open_session(port, held), 30)
+            except Exception as e:
+                failures.append(type(e).__name__)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    # Latence d'une requête ordinaire pendant que les sessions sont ouvertes
+    latencies = []
+    for _ in range(20):
+        t = time.perf_counter()
+        try:
+            await asyncio.wait_for(http(port, 'GET', '/health'), 10)
+            latencies.append((time.perf_counter() - t) * 1000)
+        except Exception:
+            failures.append('health')
+    await asyncio.sleep(hold)
+    for writer in held:
+        writer.close()
+    return len(held), failures, elapsed, latencies
+
+
+def process_stats(pid):
+    """Threads et mémoire résidente (Linux, /proc)"""
+    stats = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Threads', 'VmRSS'):
+                    stats[key] = value.strip()
+    except OSError:
+        pass
+    return stats
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://{HOST}:{port}/health', timeout=2):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def run(mode, clients, port, concurrency, hold):
+    database = tempfile.TemporaryDirectory()
+    env = dict(os.environ, ASYNC_MODE=mode, PORT=str(port), DEBUG='false',
+               DATABASE_URL=f"sqlite:///{os.path.join(database.name, 'likoo_bench.db')}")
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py')], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_ready(port):
+            return None
+        opened, failures, elapsed, latencies = asyncio.run(load(port, clients, concurrency, hold))
+        stats = process_stats(server.pid)
+        return {
+            'opened': opened,
+            'failures': len(failures),
+            'elapsed': elapsed,
+            'health_ms': statistics.median(latencies) if latencies else None,
+            'threads': stats.get('Threads', '?'),
+            'rss': stats.get('VmRSS', '?'),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+        database.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='threading,eventlet,gevent')
+    parser.add_argument('--clients', default='500,2000')
+    parser.add_argument('--port', type=int, default=5090)
+    parser.add_argument('--concurrency', type=int, default=200, help="ouvertures simultanées")
+    parser.add_argument('--hold', type=float, default=1.0, help="secondes avec toutes les sessions ouvertes")
+    args = parser.parse_args()
+
+    print(f"{'mode':>10} {'clients':>8} {'ouvertes':>9} {'échecs':>7} {'durée (s)':>10} "
+          f"{'/health (ms)':>13} {'threads':>8} {'RSS':>12}")
+    for mode in args.modes.split(','):
+        if mode != 'threading' and importlib.util.find_spec(mode) is None:
+            print(f"{mode:>10}  non installé (pip install {mode})")
+            continue
+        for clients in (int(c) for c in args.clients.split(',')):
+            result = run(mode, clients, args.port, args.concurrency, args.hold)
+            if result is None:
+                print(f"{mode:>10} {clients:>8}  le serveur n'a pas démarré")
+                continue
+            health = f"{result['health_ms']:.1f}" if result['health_ms'] is not None else '-'
+            print(f"{mode:>10} {clients:>8} {result['opened']:>9} {result['failures']:>7} "
+                  f"{result['elapsed']:>10.2f} {health:>13} {result['threads']:>8} {result['rss']:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+BENCHMARK — Fan-out multi-workers
+Débit de livraison d'un emit de room selon le nombre de workers reliés par le
+hub local (backplane.py). Les clients (--clients au total) sont répartis entre
+les workers ; chaque worker encode et « envoie » le paquet à ses propres sockets.
+
+    python benchmarks/bench_fanout.py [--workers 1,2,4] [--clients 2000] [--messages 200]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio  # noqa: E402
+
+from backplane import BackplaneHub, LocalSocketManager  # noqa: E402
+
+ROOM = 'bench'
+
+
+def worker(url, clients, messages, results):
+    server = socketio.Server(client_manager=LocalSocketManager(url))
+    counts = {'warmup': 0, 'message': 0}
+    expected = clients * messages
+
+    def send_eio_packet(eio_sid, eio_pkt):
+        # Remplace l'envoi réseau : encodage par socket, comme engine.io
+        encoded = eio_pkt.encode()
+        event = 'warmup' if '"warmup"' in encoded[:12] else 'message'
+        counts[event] += 1
+        if event == 'warmup' and counts['warmup'] == 1:
+            results.put(('ready', os.getpid(), None))
+        elif event == 'message' and counts['message'] == expected:
+            results.put(('done', os.getpid(), time.perf_counter()))
+
+    server._send_eio_packet = send_eio_packet
+    for i in range(clients):
+        sid = server.manager.connect(f'eio-{i}', '/')
+        server.manager.enter_room(sid, '/', ROOM)
+    server.manager.initialize()
+    while True:
+        time.sleep(1)
+
+
+def run(url, workers, clients, messages):
+    results = multiprocessing.Queue()
+    per_worker = clients // workers
+    processes = [multiprocessing.Process(target=worker, args=(url, per_worker, messages, results), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    publisher = socketio.Server(client_manager=LocalSocketManager(url, write_only=True))
+    ready = set()
+    while len(ready) < workers:
+        publisher.emit('warmup', {}, room=ROOM)
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline and len(ready) < workers:
+            try:
+                kind, pid, _ = results.get(timeout=0.05)
+                ready.add(pid)
+            except Exception:
+                pass
+    time.sleep(0.2)  # derniers warmups livrés
+
+    payload = {'id': 1, 'channel_id': 1, 'content': 'x' * 120, 'author_id': 42,
+               'timestamp': '2024-01-01T00:00:00'}
+    start = time.perf_counter()
+    for i in range(messages):
+        publisher.emit('new_message', dict(payload, id=i), room=ROOM)
+    finished = [results.get(timeout=120)[2] for _ in range(workers)]
+    elapsed = max(finished) - start
+
+    for process in processes:
+        process.terminate()
+    return per_worker * workers * messages / elapsed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=200)
+    args = parser.parse_args()
+
+    hub = BackplaneHub(port=0).start()
+    print(f"{args.clients} clients, {args.messages} messages par room, hub {hub.url}")
+    print(f"{'workers':>8} {'livraisons/s':>14} {'durée (s)':>10}")
+    for workers in (int(w) for w in args.workers.split(',')):
+        rate, elapsed = run(hub.url, workers, args.clients, args.messages)
+        print(f"{workers:>8} {rate:>14,.0f} {elapsed:>10.2f}")
+    print(f"hub : {hub.stats}")
+    hub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+BENCHMARK — Débit de la route des médias (/avatars, /server_icons)
+Lance server.py, écrit un fichier de test dans avatars/ puis mesure, pour
+plusieurs niveaux de concurrence : requêtes par seconde, Mo/s et latences
+(p50 / p99) d'un téléchargement complet, d'une revalidation (304) et d'une
+requête Range.
+
+    python benchmarks/bench_media.py [--size-kb 512] [--concurrency 1,16,64] [--requests 400]
+
+Le fichier de test et la base SQLite jetable (DATABASE_URL) sont supprimés à la fin.
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = '127.0.0.1'
+FILENAME = 'bench_media.gif'
+
+
+async def fetch(port, path, headers):
+    """Requête HTTP/1.0 (une connexion par requête) : (statut, octets reçus)"""
+    reader, writer = await asyncio.open_connection(HOST, port)
+    extra = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+    writer.write(f'GET {path} HTTP/1.0\r\nHost: {HOST}\r\n{extra}\r\n'.encode())
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1]), len(content)
+
+
+async def load(port, path, headers, expected, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = []
+    received = 0
+
+    async def one():
+        nonlocal received
+        async with semaphore:
+            t = time.perf_counter()
+            try:
+                status, size = await asyncio.wait_for(fetch(port, path, headers), 30)
+            except Exception as e:
+                failures.append(type(e).__name__)
+                return
+            if status != expected:
+                failures.append(status)
+                return
+            latencies.append((time.perf_counter() - t) * 1000)
+            received += size
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return latencies, failures, received, elapsed
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://{HOST}:{port}/health', timeout=2):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-kb', type=int, default=512, help="taille du fichier servi")
+    parser.add_argument('--concurrency', default='1,16,64')
+    parser.add_argument('--requests', type=int, default=400, help="requêtes par mesure")
+    parser.add_argument('--port', type=int, default=5091)
+    args = parser.parse_args()
+
+    directory = os.path.join(ROOT, 'avatars')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, FILENAME)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(args.size_kb * 1024))
+
+    database = tempfile.TemporaryDirectory()
+    env = dict(os.environ, PORT=str(args.port), DEBUG='false',
+               DATABASE_URL=f"sqlite:///{os.path.join(database.name, 'likoo_bench.db')}")
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py')], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_ready(args.port):
+            print("le serveur n'a pas démarré")
+            return
+        url = f'/avatars/{FILENAME}'
+        with urllib.request.urlopen(f'http://{HOST}:{args.port}{url}') as response:
+            etag = response.headers['ETag']
+        cases = [
+            ('complet', {}, 200),
+            ('304', {'If-None-Match': etag}, 304),
+            ('range 64K', {'Range': 'bytes=0-65535'}, 206),
+        ]
+        print(f"fichier : {args.size_kb} Ko")
+        print(f"{'requête':>10} {'conc.':>6} {'req/s':>9} {'Mo/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'échecs':>7}")
+        for name, headers, expected in cases:
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                latencies, failures, received, elapsed = asyncio.run(
+                    load(args.port, url, headers, expected, args.requests, concurrency))
+                p50, p99 = (f"{percentile(latencies, p):.2f}" if latencies else '-' for p in (50, 99))
+                print(f"{name:>10} {concurrency:>6} {len(latencies) / elapsed:>9.0f} "
+                      f"{received / elapsed / 1e6:>9.1f} {p50:>9} {p99:>9} {len(failures):>7}")
+    finally:
+        server.terminate()
+        server.wait()
+        os.remove(path)
+        database.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+BENCHMARK — Permissions
+Coût d'un contrôle de permission : JSON du rôle parcouru à chaque appel
+contre champ de bits en cache par (utilisateur, serveur).
+
+    python benchmarks/bench_permissions.py [--users 1000] [--servers 50] [--checks 1000000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from permissions import PermissionResolver, SEND_MESSAGES, MANAGE_CHANNELS  # noqa: E402
+
+ROLE_JSON = json.dumps({
+    'manage_server': False, 'manage_roles': False, 'manage_channels': True,
+    'manage_members': False, 'send_messages': True, 'send_files': True,
+    'mention_everyone': False, 'manage_messages': False, 'mute_members': False
+})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--servers', type=int, default=50)
+    parser.add_argument('--checks', type=int, default=1000000)
+    args = parser.parse_args()
+
+    loads = [0]
+
+    def load(user_id, server_id):
+        # Remplace la requête SQL : compte les chargements
+        loads[0] += 1
+        return False, True, json.loads(ROLE_JSON)
+
+    rng = random.Random(42)
+    pairs = [(f'u{rng.randrange(args.users)}', f's{rng.randrange(args.servers)}')
+             for _ in range(args.checks)]
+
+    # Référence : parsing JSON + lecture du dict à chaque contrôle
+    start = time.perf_counter()
+    for _ in pairs:
+        allowed = json.loads(ROLE_JSON).get('send_messages', False)
+    naive = time.perf_counter() - start
+
+    resolver = PermissionResolver(load)
+    start = time.perf_counter()
+    for user_id, server_id in pairs:
+        allowed = resolver.has(user_id, server_id, SEND_MESSAGES)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for user_id, server_id in pairs:
+        allowed = resolver.has(user_id, server_id, SEND_MESSAGES | MANAGE_CHANNELS)
+    warm = time.perf_counter() - start
+    assert allowed
+
+    n = args.checks
+    print(f'{n} contrôles, {args.users} utilisateurs x {args.servers} serveurs')
+    print(f'  JSON à chaque appel   : {naive / n * 1e6:8.2f} µs/contrôle')
+    print(f'  bits, premier passage : {cold / n * 1e6:8.2f} µs/contrôle ({loads[0]} chargements)')
+    print(f'  bits, cache chaud     : {warm / n * 1e6:8.2f} µs/contrôle (0 chargement)')
+    print(f'  stats : {resolver.snapshot()}')
+
+
+if __name__ == '__main__':
+    main()
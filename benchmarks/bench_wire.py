@@ -0,0 +1,105 @@
+"""
+BENCHMARK — Format des payloads Socket.IO
+Octets par événement (trame Socket.IO complète) et coût d'encodage / décodage
+de new_message, new_dm et user_status_changed : JSON complet, JSON compact,
+packed (MessagePack ; encodeur intégré si la bibliothèque msgpack manque).
+
+    python benchmarks/bench_wire.py [--iterations 20000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from socketio import packet  # noqa: E402
+
+from models import User, Message, DirectMessage  # noqa: E402
+import wire  # noqa: E402
+from wire import RefTable, message_fields, dm_fields, presence_fields  # noqa: E402
+
+
+def frame_size(event, data):
+    """Taille de la trame Socket.IO (paquet texte + pièces jointes binaires)"""
+    encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    if isinstance(encoded, list):
+        return sum(len(part) if isinstance(part, bytes) else len(part.encode()) for part in encoded)
+    return len(encoded.encode())
+
+
+def packed(refs, fields):
+    """Payload packed pour un socket de référence"""
+    return refs.encode(fields, ['bench'])[0][0]
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    author = User(id=str(uuid.uuid4()), username='alice', email='alice@example.com', avatar='/avatars/a.png',
+                  color='#f59e0b', status='online', tag='0042', created_at=datetime.utcnow())
+    friend_id = str(uuid.uuid4())
+    message = Message(id=str(uuid.uuid4()), content='Salut tout le monde, on se retrouve à 20h ?',
+                      author_id=author.id, channel_id=str(uuid.uuid4()), created_at=datetime.utcnow())
+    dm = DirectMessage(id=str(uuid.uuid4()), content='Tu as vu le dernier épisode ?', sender_id=author.id,
+                       receiver_id=friend_id, created_at=datetime.utcnow())
+    refs = RefTable()
+    # Premier envoi au socket : les définitions des refs partent avec le payload
+    first = {
+        'new_message': packed(refs, message_fields(message, author)),
+        'new_dm': packed(refs, dm_fields(dm, author)),
+        'user_status_changed': packed(refs, presence_fields(author.id, 'away')),
+    }
+
+    cases = {
+        'new_message': {
+            'full': lambda: message.to_dict(author),
+            'compact': lambda: {'message': message.to_compact_dict(), 'users': {author.id: author.to_public_dict()}},
+            'packed': lambda: packed(refs, message_fields(message, author)),
+        },
+        'new_dm': {
+            'full': lambda: dm.to_dict(author),
+            'compact': lambda: {'message': dm.to_compact_dict(), 'users': {author.id: author.to_public_dict()}},
+            'packed': lambda: packed(refs, dm_fields(dm, author)),
+        },
+        'user_status_changed': {
+            'full': lambda: {'user_id': author.id, 'status': 'away'},
+            'compact': lambda: {'user_id': author.id, 'status': 'away'},
+            'packed': lambda: packed(refs, presence_fields(author.id, 'away')),
+        },
+    }
+
+    print(f"encodeur MessagePack : {'msgpack' if wire.msgpack else 'intégré (pur Python)'}")
+    print(f"{'événement':<20} {'format':<8} {'octets':>7} {'1er envoi':>10} {'encodage (µs)':>14} {'décodage (µs)':>14}")
+    for event, formats in cases.items():
+        for fmt, build in formats.items():
+            payload = build()
+            if fmt == 'packed':
+                encode = build
+                decode = lambda: wire.unpackb(payload)  # noqa: E731
+                first_size = frame_size(event, first[event])
+            else:
+                encode = lambda: json.dumps(build(), separators=(',', ':'))  # noqa: E731
+                text = encode()
+                decode = lambda: json.loads(text)  # noqa: E731
+                first_size = None
+            size = frame_size(event, payload)
+            print(f"{event:<20} {fmt:<8} {size:>7} {first_size or '':>10} "
+                  f"{timed(encode, args.iterations):>14.2f} {timed(decode, args.iterations):>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
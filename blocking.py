@@ -0,0 +1,96 @@
+"""
+MODE DE SERVICE — Likoo
+Mode async (eventlet / gevent) et pool borné pour le travail bloquant
+"""
+
+import os
+import threading
+import time
+
+ASYNC_MODES = ('threading', 'eventlet', 'gevent')
+
+
+def monkey_patch(mode, pool_size=8):
+    """À appeler avant tout autre import du serveur : en mode eventlet ou
+    gevent, la bibliothèque standard (sockets, threads, sleep) devient
+    coopérative. Retourne le mode retenu."""
+    if mode not in ASYNC_MODES:
+        raise ValueError(f"ASYNC_MODE inconnu: {mode} (attendu: {', '.join(ASYNC_MODES)})")
+    if mode == 'eventlet':
+        # Taille des vrais threads de eventlet.tpool, lue à son premier import
+        os.environ.setdefault('EVENTLET_THREADPOOL_SIZE', str(pool_size))
+        import eventlet
+        eventlet.monkey_patch()
+    elif mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    return mode
+
+
+class BlockingPool:
+    """Exécute du travail bloquant (SQLite, hachage de mot de passe, écriture
+    de fichiers) dans au plus max_workers vrais threads.
+
+    En mode eventlet / gevent, un appel bloquant en C (sqlite3, hashlib)
+    gèle la boucle et toutes les connexions : run() le déporte dans un
+    thread système et ne suspend que la greenlet appelante. En mode
+    threading, le pool borne le nombre de hachages et d'écritures simultanés.
+    """
+
+    def __init__(self, mode='threading', max_workers=8):
+        self.mode = mode
+        self.max_workers = max_workers
+        if mode == 'eventlet':
+            from eventlet import tpool
+            from eventlet.semaphore import Semaphore
+            self._slots = Semaphore(max_workers)
+            self._submit = lambda fn, args, kwargs: tpool.execute(fn, *args, **kwargs)
+        elif mode == 'gevent':
+            from gevent.threadpool import ThreadPool
+            pool = ThreadPool(max_workers)
+            self._slots = None
+            self._submit = lambda fn, args, kwargs: pool.apply(fn, args, kwargs)
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            executor = ThreadPoolExecutor(max_workers, thread_name_prefix='blocking')
+            self._slots = None
+            self._submit = lambda fn, args, kwargs: executor.submit(fn, *args, **kwargs).result()
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'errors': 0, 'active': 0, 'peak': 0, 'busy_ms': 0.0}
+
+    @property
+    def cooperative(self):
+        """True en mode eventlet / gevent (une seule boucle à ne pas bloquer)"""
+        return self.mode != 'threading'
+
+    def run(self, fn, *args, **kwargs):
+        """Appelle fn(*args, **kwargs) dans le pool et retourne son résultat
+        (les exceptions sont propagées à l'appelant)"""
+        if self._slots:
+            self._slots.acquire()
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['active'] += 1
+            self.stats['peak'] = max(self.stats['peak'], self.stats['active'])
+        started = time.perf_counter()
+        try:
+            return self._submit(fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self.stats['active'] -= 1
+                self.stats['busy_ms'] += (time.perf_counter() - started) * 1000
+            if self._slots:
+                self._slots.release()
+
+    def snapshot(self):
+        with self._lock:
+            calls = self.stats['calls']
+            return dict(self.stats,
+                        mode=self.mode,
+                        max_workers=self.max_workers,
+                        busy_ms=round(self.stats['busy_ms'], 1),
+                        avg_ms=round(self.stats['busy_ms'] / calls, 2) if calls else None)
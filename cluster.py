@@ -0,0 +1,81 @@
+"""
+CLUSTER — Likoo
+Lance le hub local (backplane) et plusieurs workers server.py
+
+    python cluster.py --workers 4 --port 5001 --hub 127.0.0.1:5600
+
+Le worker i écoute sur port + i. Un répartiteur devant les workers doit garder
+chaque client sur le même worker (sessions collantes, ex. nginx ip_hash) :
+le transport long-polling de Socket.IO fait plusieurs requêtes par session.
+"""
+
+import argparse
+import os
+import secrets
+import subprocess
+import sys
+import time
+import urllib.request
+
+from backplane import BackplaneHub
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_ready(port, timeout=60):
+    """Attend que /health réponde (base créée, purges reprises)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=2):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--hub', default='127.0.0.1:5600')
+    args = parser.parse_args()
+
+    host, _, hub_port = args.hub.rpartition(':')
+    hub = BackplaneHub(host or '127.0.0.1', int(hub_port)).start()
+    print(f"[CLUSTER] Hub {hub.url}")
+
+    env = dict(os.environ,
+               SOCKETIO_MESSAGE_QUEUE=hub.url,
+               SHARED_STORE_URL=hub.url,
+               # Même clé de session pour tous les workers
+               SECRET_KEY=os.getenv('SECRET_KEY') or secrets.token_hex(32),
+               DEBUG='false')
+    workers = []
+    try:
+        for index in range(args.workers):
+            port = args.port + index
+            worker_env = dict(env, PORT=str(port), LIKOO_WORKER_INDEX=str(index))
+            workers.append(subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py')],
+                                            cwd=ROOT, env=worker_env))
+            if index == 0 and not wait_ready(port):
+                # Le worker principal crée le schéma : les autres attendent
+                print("[CLUSTER] Le worker principal ne répond pas")
+                return 1
+            print(f"[CLUSTER] Worker {index} : http://127.0.0.1:{port}")
+        while all(worker.poll() is None for worker in workers):
+            time.sleep(1)
+        print("[CLUSTER] Un worker s'est arrêté, arrêt du cluster")
+        return 1
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+        hub.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+REGROUPEMENT DES ÉMISSIONS — Likoo
+Événements d'une même room regroupés sur quelques millisecondes en une seule trame
+"""
+
+import threading
+import time
+
+# Tailles de lots comptées par tranche (dernière tranche : au-delà)
+SIZE_BUCKETS = (1, 4, 16, 64)
+
+
+class EventBatcher:
+    """Regroupe par room les événements émis pendant window secondes.
+
+    Un lot de plusieurs événements part en un seul emit 'batch'
+    [[event, data], ...] : encodé une fois, une trame par destinataire au
+    lieu d'une par événement. Un lot d'un seul événement est émis tel quel.
+    Un lot est envoyé au plus tard au tick suivant (latence ajoutée ≤ window
+    environ) ou dès qu'il atteint max_batch événements.
+
+    Les événements de immediate (signalisation WebRTC) et les emits avec
+    skip_sid ne sont jamais retardés : le lot en attente de la room part
+    d'abord, pour garder l'ordre. window = 0 désactive le regroupement.
+
+    send(event, data, room, **options) : emit Socket.IO ; les options
+    (ignore_queue…) font partie de la clé du lot.
+    """
+
+    def __init__(self, send, start_task, sleep, window=0.005, max_batch=64, immediate=()):
+        self._send = send
+        self._start_task = start_task
+        self._sleep = sleep
+        self.window = window
+        self.max_batch = max_batch
+        self.immediate = frozenset(immediate)
+        self._pending = {}  # (room, options) -> [(event, data)], premier ajout
+        self._first_at = {}  # (room, options) -> time.monotonic() du premier événement
+        self._lock = threading.Lock()
+        self._started = False
+        self.stats = {'events': 0, 'immediate': 0, 'batches': 0, 'batched_events': 0,
+                      'max_batch': 0, 'delay_ms': 0.0, 'max_delay_ms': 0.0}
+        self.sizes = dict.fromkeys(SIZE_BUCKETS + ('more',), 0)
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def start(self):
+        if self.enabled and not self._started:
+            self._started = True
+            self._start_task(self._run)
+
+    def emit(self, event, data, room, skip_sid=None, **options):
+        key = (room, tuple(sorted(options.items())))
+        if not self.enabled or skip_sid is not None or event in self.immediate:
+            self.flush_room(room)
+            with self._lock:
+                self.stats['events'] += 1
+                self.stats['immediate'] += 1
+            self._send(event, data, room, skip_sid=skip_sid, **options)
+            return
+        with self._lock:
+            self.stats['events'] += 1
+            events = self._pending.get(key)
+            if events is None:
+                events = self._pending[key] = []
+                self._first_at[key] = time.monotonic()
+            events.append((event, data))
+            full = len(events) >= self.max_batch
+        if full:
+            self._flush_key(key)
+
+    def flush(self):
+        """Envoie tous les lots en attente"""
+        with self._lock:
+            keys = list(self._pending)
+        for key in keys:
+            self._flush_key(key)
+
+    def flush_room(self, room):
+        """Envoie les lots en attente de room, quelles que soient leurs options
+        (avant un envoi immédiat, ou avant qu'un socket la rejoigne : il ne
+        reçoit pas les événements émis avant son arrivée)"""
+        with self._lock:
+            keys = [key for key in self._pending if key[0] == room]
+        for key in keys:
+            self._flush_key(key)
+
+    def _flush_key(self, key):
+        with self._lock:
+            events = self._pending.pop(key, None)
+            first_at = self._first_at.pop(key, None)
+            if not events:
+                return
+            self._record(len(events), (time.monotonic() - first_at) * 1000)
+        room, options = key
+        if len(events) == 1:
+            event, data = events[0]
+            self._send(event, data, room, **dict(options))
+        else:
+            self._send('batch', [[event, data] for event, data in events], room, **dict(options))
+
+    def _record(self, size, delay_ms):
+        """Verrou déjà pris"""
+        self.stats['batches'] += 1
+        self.stats['batched_events'] += size
+        self.stats['max_batch'] = max(self.stats['max_batch'], size)
+        self.stats['delay_ms'] += delay_ms
+        self.stats['max_delay_ms'] = max(self.stats['max_delay_ms'], delay_ms)
+        for bucket in SIZE_BUCKETS:
+            if size <= bucket:
+                self.sizes[bucket] += 1
+                break
+        else:
+            self.sizes['more'] += 1
+
+    def _run(self):
+        while True:
+            self._sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[BATCH] Erreur d'envoi: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            batches = self.stats['batches']
+            return dict(self.stats,
+                        enabled=self.enabled,
+                        pending_rooms=len(self._pending),
+                        delay_ms=round(self.stats['delay_ms'], 1),
+                        max_delay_ms=round(self.stats['max_delay_ms'], 2),
+                        avg_batch=round(self.stats['batched_events'] / batches, 2) if batches else None,
+                        avg_delay_ms=round(self.stats['delay_ms'] / batches, 2) if batches else None,
+                        sizes={f'<={b}' if b != 'more' else f'>{SIZE_BUCKETS[-1]}': n
+                               for b, n in self.sizes.items()})
@@ -0,0 +1,155 @@
+"""
+MÉDIAS — Likoo
+Avatars et icônes de serveurs : index des métadonnées en mémoire, requêtes conditionnelles, Range
+"""
+
+import mimetypes
+import os
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+
+# Un fichier envoyé ne change jamais de contenu (nom unique par upload)
+MEDIA_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Taille des blocs lus pour une réponse partielle
+CHUNK_SIZE = 64 * 1024
+
+
+class MediaFile:
+    """Métadonnées d'un fichier servi (aucun stat par requête)"""
+
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'last_modified', 'content_type')
+
+    def __init__(self, path, size, mtime):
+        self.path = path
+        self.size = size
+        self.mtime = int(mtime)
+        # Comme nginx : taille et date, sans relire le contenu
+        self.etag = f'{self.mtime:x}-{size:x}'
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+class MediaIndex:
+    """URL (/avatars/<fichier>, /server_icons/<fichier>) -> MediaFile.
+
+    Les dossiers sont parcourus au démarrage ; un upload ajoute son fichier
+    (add). Une URL absente de l'index est cherchée une fois sur le disque
+    (fichier écrit par un autre worker) ; un fichier supprimé entre-temps
+    (purge d'un serveur) est retiré de l'index à l'ouverture.
+    """
+
+    def __init__(self, root, dirs):
+        self.root = root
+        self.dirs = tuple(dirs)
+        self._files = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'not_found': 0, 'not_modified': 0,
+                      'partial': 0, 'full': 0, 'bytes_sent': 0}
+
+    def scan(self):
+        files = {}
+        for name in self.dirs:
+            directory = self.root / name
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory):
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[f'/{name}/{entry.name}'] = MediaFile(entry.path, stat.st_size, stat.st_mtime)
+        with self._lock:
+            self._files = files
+        return len(files)
+
+    def add(self, path):
+        """Fichier qui vient d'être écrit dans l'un des dossiers"""
+        path = str(path)
+        stat = os.stat(path)
+        url = f'/{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)}'
+        with self._lock:
+            self._files[url] = MediaFile(path, stat.st_size, stat.st_mtime)
+
+    def discard(self, url):
+        with self._lock:
+            self._files.pop(url, None)
+
+    def lookup(self, directory, filename):
+        url = f'/{directory}/{filename}'
+        media = self._files.get(url)
+        if media is not None:
+            self.record('hits')
+            return media
+        self.record('misses')
+        # Pas de sous-dossier ni de chemin relatif
+        if directory not in self.dirs or os.path.basename(filename) != filename or filename.startswith('.'):
+            return None
+        path = self.root / directory / filename
+        try:
+            stat = path.stat()
+        except OSError:
+            self.record('not_found')
+            return None
+        media = MediaFile(str(path), stat.st_size, stat.st_mtime)
+        with self._lock:
+            self._files[url] = media
+        return media
+
+    def record(self, key, sent=0):
+        with self._lock:
+            self.stats[key] += 1
+            self.stats['bytes_sent'] += sent
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, files=len(self._files),
+                        bytes_indexed=sum(media.size for media in self._files.values()))
+
+
+def not_modified(media, if_none_match, if_modified_since):
+    """Requête conditionnelle satisfaite (If-None-Match prioritaire sur If-Modified-Since)"""
+    if if_none_match:
+        tags = {tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')}
+        return '*' in tags or media.etag in tags
+    if if_modified_since:
+        try:
+            return int(parsedate_to_datetime(if_modified_since).timestamp()) >= media.mtime
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header, size, if_range=None, media=None):
+    """(début, fin incluse) pour un en-tête 'bytes=a-b' à une seule plage ;
+    None : réponse complète (pas de Range, plusieurs plages, If-Range périmé) ;
+    False : plage impossible (416)"""
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    if if_range and media is not None and if_range.strip().strip('"') != media.etag \
+            and if_range.strip() != media.last_modified:
+        return None
+    start, _, end = header[6:].strip().partition('-')
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def read_range(f, start, end):
+    """Itère sur les octets [start, end] du fichier ouvert f, puis le ferme"""
+    with f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
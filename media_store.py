@@ -0,0 +1,336 @@
+"""
+STOCKAGE DES MÉDIAS — Likoo
+Avatars et icônes adressés par contenu : dédoublonnage, miniatures en arrière-plan, ramasse-miettes
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+import uuid
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # dépendance optionnelle : originaux seulement, sans miniatures
+    Image = None
+
+# Dossier (sous la racine du projet) et préfixe d'URL des blobs
+MEDIA_DIR = 'media'
+URL_PREFIX = f'/{MEDIA_DIR}'
+# Miniatures carrées générées pour chaque image (pixels)
+THUMBNAIL_SIZES = (64, 128)
+# Taille servie selon l'usage : listes (membres, messages, vocal, amis) et icônes de serveurs
+LIST_SIZE = 64
+ICON_SIZE = 128
+# Première image d'un GIF, en taille réelle
+STATIC = 'static'
+
+# Signatures des formats acceptés -> extension
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+EXTENSIONS = ('png', 'jpg', 'gif', 'webp')
+
+
+def sniff(data):
+    """Extension d'après le contenu (et non le nom envoyé), None si non supporté"""
+    for signature, ext in SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def parse_name(name):
+    """'<digest>.<ext>' -> (digest, None, ext) ; '<digest>-<variante>.png' ->
+    (digest, variante, 'png') ; None pour tout autre nom"""
+    stem, dot, ext = name.partition('.')
+    digest, _, variant = stem.partition('-')
+    if not dot or not digest or name.startswith('.'):
+        return None
+    return digest, variant or None, ext
+
+
+def variant_url(url, size):
+    """URL de la variante size (pixels ou STATIC) d'un blob ; l'URL telle quelle
+    pour un emoji, un ancien fichier, size=None ou sans miniatures (Pillow absent)"""
+    if Image is None or size is None or not isinstance(url, str) or not url.startswith(URL_PREFIX + '/'):
+        return url
+    parsed = parse_name(url[len(URL_PREFIX) + 1:])
+    if parsed is None or parsed[1] is not None:
+        return url
+    digest, _, ext = parsed
+    if size == STATIC:
+        return f'{URL_PREFIX}/{digest}-{STATIC}.png' if ext == 'gif' else url
+    return f'{URL_PREFIX}/{digest}-{size}.png'
+
+
+def url_digest(url):
+    """Empreinte désignée par une URL de blob ou de variante, sinon None"""
+    if not isinstance(url, str) or not url.startswith(URL_PREFIX + '/'):
+        return None
+    parsed = parse_name(url[len(URL_PREFIX) + 1:])
+    return parsed[0] if parsed else None
+
+
+class MediaStore:
+    """Blobs nommés par l'empreinte SHA-256 de leur contenu : /media/<sha>.<ext>.
+
+    Un même fichier envoyé deux fois (par le même utilisateur ou par un
+    autre) n'est écrit qu'une fois. Après chaque écriture, des miniatures
+    carrées (THUMBNAIL_SIZES, PNG, depuis la première image pour un GIF) et,
+    pour un GIF, sa première image en taille réelle sont générées par un pool
+    de workers : /media/<sha>-64.png, /media/<sha>-static.png. Tant qu'une
+    variante n'existe pas, original() permet de servir l'original à sa place.
+
+    Le ramasse-miettes supprime les blobs et variantes qu'aucun avatar ni
+    icône ne référence plus (references() : URL en base), passé un délai de
+    grâce qui couvre l'intervalle entre l'écriture et le commit, ainsi que les
+    fichiers temporaires (.<nom>.<hex>.tmp) d'écritures interrompues.
+    offload(fn, *args) exécute génération et collecte hors de la boucle en mode async.
+    """
+
+    def __init__(self, root, references, index=None, workers=2, gc_interval=3600, grace=3600, offload=None):
+        self.root = str(root)
+        self._references = references
+        self._index = index
+        self.workers = workers
+        self.gc_interval = gc_interval
+        self.grace = grace
+        self._offload = offload or (lambda fn, *args: fn(*args))
+        self._queue = queue.Queue()
+        self._pending = set()  # empreintes en file de génération
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        self.stats = {'stored': 0, 'deduplicated': 0, 'bytes_stored': 0, 'bytes_saved': 0,
+                      'generated': 0, 'errors': 0, 'collections': 0, 'collected': 0, 'bytes_collected': 0,
+                      'stale_tmp': 0}
+
+    # ── Cycle de vie ────────────────────────────────
+
+    def start(self):
+        if self._threads:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        if Image is not None:
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'media-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        if self.gc_interval > 0:
+            thread = threading.Thread(target=self._collect_loop, name='media-gc', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # ── API ─────────────────────────────────────────
+
+    def put(self, data):
+        """Enregistre une image (octets) ; URL de l'original, ou None si le
+        format n'est pas supporté. Appel bloquant (hachage, écriture)."""
+        ext = sniff(data)
+        if ext is None:
+            return None
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        path = os.path.join(self.root, f'{digest}.{ext}')
+        if self._touch(path):
+            with self._lock:
+                self.stats['deduplicated'] += 1
+                self.stats['bytes_saved'] += len(data)
+        else:
+            os.makedirs(self.root, exist_ok=True)
+            self._write(path, data)
+            with self._lock:
+                self.stats['stored'] += 1
+                self.stats['bytes_stored'] += len(data)
+        if self._index is not None:
+            self._index.add(path)
+        self.schedule(digest, ext)
+        return f'{URL_PREFIX}/{digest}.{ext}'
+
+    def variants(self, url):
+        """{'64': URL, ...} des miniatures d'un blob (et STATIC pour un GIF)"""
+        sizes = THUMBNAIL_SIZES + ((STATIC,) if url_digest(url) and url.endswith('.gif') else ())
+        return {str(size): variant_url(url, size) for size in sizes}
+
+    def original(self, name):
+        """Nom de fichier de l'original d'une variante pas encore générée
+        (sa génération est relancée), ou None"""
+        parsed = parse_name(name)
+        if parsed is None or parsed[1] is None:
+            return None
+        digest = parsed[0]
+        ext = self._find(digest)
+        if ext is None:
+            return None
+        self.schedule(digest, ext)
+        return f'{digest}.{ext}'
+
+    def canonical(self, url):
+        """URL de l'original pour une URL de variante (profil renvoyé par un client)"""
+        digest = url_digest(url)
+        if digest is None or parse_name(url[len(URL_PREFIX) + 1:])[1] is None:
+            return url
+        ext = self._find(digest)
+        return f'{URL_PREFIX}/{digest}.{ext}' if ext else url
+
+    def schedule(self, digest, ext):
+        """Met en file la génération des variantes manquantes"""
+        if Image is None or not self._threads or not self._missing(digest, ext):
+            return
+        with self._lock:
+            if digest in self._pending:
+                return
+            self._pending.add(digest)
+        self._queue.put((digest, ext))
+
+    def collect(self):
+        """Supprime blobs et variantes non référencés plus anciens que grace ;
+        nombre de fichiers supprimés"""
+        referenced = {url_digest(url) for url in self._references()}
+        cutoff = time.time() - self.grace
+        removed = freed = 0
+        for entry in os.scandir(self.root):
+            if entry.name.startswith('.'):
+                # Fichier temporaire d'une écriture interrompue : jamais un blob
+                if entry.name.endswith('.tmp'):
+                    self._remove_stale_tmp(entry, cutoff)
+                continue
+            parsed = parse_name(entry.name)
+            if parsed is None or parsed[0] in referenced or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+                if stat.st_mtime > cutoff:
+                    continue
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            if self._index is not None:
+                self._index.discard(f'{URL_PREFIX}/{entry.name}')
+            removed += 1
+            freed += stat.st_size
+        with self._lock:
+            self.stats['collections'] += 1
+            self.stats['collected'] += removed
+            self.stats['bytes_collected'] += freed
+        if removed:
+            print(f"[MEDIA] {removed} fichier(s) non référencé(s) supprimé(s) ({freed // 1024} Ko)")
+        return removed
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, thumbnails=Image is not None, sizes=list(THUMBNAIL_SIZES),
+                        pending=len(self._pending))
+
+    # ── Workers ─────────────────────────────────────
+
+    @staticmethod
+    def _touch(path):
+        """Blob déjà présent : rafraîchi pour que le ramasse-miettes attende le
+        commit ; False s'il n'existe pas (ou vient d'être collecté)"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _remove_stale_tmp(self, entry, cutoff):
+        try:
+            if entry.is_file() and entry.stat().st_mtime <= cutoff:
+                os.remove(entry.path)
+                with self._lock:
+                    self.stats['stale_tmp'] += 1
+        except FileNotFoundError:
+            pass
+
+    def _find(self, digest):
+        """Extension de l'original présent sur le disque"""
+        for ext in EXTENSIONS:
+            if os.path.exists(os.path.join(self.root, f'{digest}.{ext}')):
+                return ext
+        return None
+
+    def _variant_names(self, digest, ext):
+        names = [f'{digest}-{size}.png' for size in THUMBNAIL_SIZES]
+        if ext == 'gif':
+            names.append(f'{digest}-{STATIC}.png')
+        return names
+
+    def _missing(self, digest, ext):
+        return [name for name in self._variant_names(digest, ext)
+                if not os.path.exists(os.path.join(self.root, name))]
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job = self._queue.get()
+            if job is None:
+                continue
+            digest, ext = job
+            try:
+                self._offload(self._generate, digest, ext)
+            except Exception as e:
+                with self._lock:
+                    self.stats['errors'] += 1
+                print(f"[MEDIA] Miniatures de {digest}.{ext} impossibles: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(digest)
+
+    def _generate(self, digest, ext):
+        with Image.open(os.path.join(self.root, f'{digest}.{ext}')) as image:
+            image.seek(0)
+            frame = image.convert('RGBA')
+        outputs = {}
+        if ext == 'gif':
+            outputs[f'{digest}-{STATIC}.png'] = frame
+        for size in THUMBNAIL_SIZES:
+            outputs[f'{digest}-{size}.png'] = ImageOps.fit(frame, (size, size), Image.LANCZOS)
+        for name, picture in outputs.items():
+            path = os.path.join(self.root, name)
+            self._write(path, picture)
+            if self._index is not None:
+                self._index.add(path)
+        with self._lock:
+            self.stats['generated'] += 1
+
+    @staticmethod
+    def _write(path, content):
+        """Écriture atomique : un lecteur ne voit jamais un fichier partiel"""
+        directory, name = os.path.split(path)
+        tmp = os.path.join(directory, f'.{name}.{uuid.uuid4().hex}.tmp')
+        try:
+            if isinstance(content, bytes):
+                with open(tmp, 'wb') as f:
+                    f.write(content)
+            else:
+                content.save(tmp, 'PNG', optimize=True)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _collect_loop(self):
+        while not self._stopping.wait(self.gc_interval):
+            try:
+                self._offload(self.collect)
+            except Exception as e:
+                with self._lock:
+                    self.stats['errors'] += 1
+                print(f"[MEDIA] Erreur du ramasse-miettes: {e}")
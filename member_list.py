@@ -0,0 +1,240 @@
+"""
+LISTE DES MEMBRES — Likoo
+Liste triée des membres d'un serveur, servie par plages et synchronisée par diff
+"""
+
+import bisect
+import difflib
+import threading
+from collections import OrderedDict
+
+MAX_RANGE_SIZE = 100
+MAX_RANGES = 3
+
+
+class MemberList:
+    """Membres d'un serveur triés : en ligne d'abord, puis par rôle, puis par nom.
+
+    entries[i] est l'item sérialisé à la position i ; keys[i] sa clé de tri
+    (maintenue en parallèle pour bisect).
+    """
+
+    def __init__(self, server_id, members, role_ranks, role_names=None):
+        self.server_id = server_id
+        self.role_ranks = role_ranks  # role_id -> rang (ordre de création des rôles)
+        self.role_names = role_names or {}  # role_id -> nom affiché de la section
+        pairs = sorted((self._key(m), m) for m in members)
+        self.keys = [k for k, _ in pairs]
+        self.entries = [m for _, m in pairs]
+        self.index = {m['user_id']: k for k, m in pairs}  # user_id -> clé actuelle
+        self.subscribers = {}  # sid -> [(start, end), ...]
+
+    def _key(self, member):
+        offline = member['status'] in (None, 'offline')
+        rank = self.role_ranks.get(member['role_id'], len(self.role_ranks))
+        return (offline, rank, (member['username'] or '').lower(), member['user_id'])
+
+    def position(self, user_id):
+        key = self.index.get(user_id)
+        return None if key is None else bisect.bisect_left(self.keys, key)
+
+    def window(self, start, end):
+        return self.entries[start:end + 1]
+
+    def groups(self):
+        """Effectif de chaque section (en ligne par rôle, puis hors ligne) :
+        bornes trouvées par bisect sur les clés, sans parcourir les membres"""
+        role_ids = {rank: role_id for role_id, rank in self.role_ranks.items()}
+        groups = []
+        lo = 0
+        for rank in range(len(self.role_ranks) + 1):
+            hi = bisect.bisect_left(self.keys, (False, rank + 1))
+            if hi > lo:
+                role_id = role_ids.get(rank)
+                groups.append({'id': role_id or 'online', 'name': self.role_names.get(role_id),
+                               'count': hi - lo})
+            lo = hi
+        if len(self.keys) > lo:
+            groups.append({'id': 'offline', 'name': None, 'count': len(self.keys) - lo})
+        return groups
+
+    def online_count(self):
+        return bisect.bisect_left(self.keys, (True,))
+
+    # ── Mutations : retournent la plage d'index touchée (lo, hi) ──
+
+    def upsert(self, member):
+        old = self.position(member['user_id'])
+        if old is not None:
+            del self.keys[old]
+            del self.entries[old]
+        key = self._key(member)
+        new = bisect.bisect_left(self.keys, key)
+        self.keys.insert(new, key)
+        self.entries.insert(new, member)
+        self.index[member['user_id']] = key
+        if old is None:
+            return new, None  # insertion : toutes les plages suivantes se décalent
+        return min(old, new), max(old, new)
+
+
+class MemberListRegistry:
+    """Listes de membres chargées en mémoire et abonnements par socket.
+
+    Un socket s'abonne à quelques plages visibles d'un seul serveur à la fois.
+    Après chaque changement, chaque abonné dont une plage est touchée reçoit
+    uniquement le diff de sa plage (DELETE / INSERT / UPDATE, index absolus)
+    et l'effectif à jour de chaque section ; un changement qui ne touche que
+    les effectifs est envoyé à tous les abonnés, sans opération.
+
+    load(server_id) -> (members, role_ranks, role_names) ou None ; emit(sid, event, data).
+    """
+
+    def __init__(self, load, emit, max_idle_lists=64):
+        self._load = load
+        self._emit = emit
+        self.max_idle_lists = max_idle_lists
+        self._lists = OrderedDict()  # server_id -> MemberList
+        self._sid_server = {}  # sid -> server_id
+        self._lock = threading.RLock()
+
+    def get(self, server_id):
+        with self._lock:
+            member_list = self._lists.get(server_id)
+            if member_list is None:
+                loaded = self._load(server_id)
+                if loaded is None:
+                    return None
+                member_list = self._lists[server_id] = MemberList(server_id, *loaded)
+                self._trim()
+            self._lists.move_to_end(server_id)
+            return member_list
+
+    def sync_payload(self, member_list, ranges):
+        return {
+            'server_id': member_list.server_id,
+            'total': len(member_list.entries),
+            'online': member_list.online_count(),
+            'groups': member_list.groups(),
+            'ranges': [{'range': [s, e], 'items': member_list.window(s, e)} for s, e in ranges]
+        }
+
+    # ── Abonnements ─────────────────────────────────
+
+    def subscribe(self, sid, server_id, ranges):
+        """Abonne sid aux plages données ; retourne le payload de synchronisation"""
+        ranges = normalize_ranges(ranges)
+        with self._lock:
+            self.unsubscribe(sid)
+            member_list = self.get(server_id)
+            if member_list is None:
+                return None
+            member_list.subscribers[sid] = ranges
+            self._sid_server[sid] = server_id
+            return self.sync_payload(member_list, ranges)
+
+    def unsubscribe(self, sid):
+        with self._lock:
+            server_id = self._sid_server.pop(sid, None)
+            member_list = self._lists.get(server_id)
+            if member_list:
+                member_list.subscribers.pop(sid, None)
+                self._trim()
+
+    # ── Changements ─────────────────────────────────
+
+    def upsert_member(self, server_id, member):
+        """Ajout ou mise à jour d'un membre (nouveau membre, statut, pseudo, avatar)"""
+        with self._lock:
+            member_list = self._lists.get(server_id)
+            if member_list:
+                self._apply(member_list, lambda: member_list.upsert(member), member['user_id'])
+
+    def update_user(self, user_id, **fields):
+        """Profil ou statut modifié : mis à jour dans toutes les listes chargées"""
+        with self._lock:
+            for member_list in list(self._lists.values()):
+                pos = member_list.position(user_id)
+                if pos is not None:
+                    member = dict(member_list.entries[pos], **fields)
+                    self._apply(member_list, lambda: member_list.upsert(member), user_id)
+
+    def drop(self, server_id):
+        """Liste périmée (rôles modifiés, serveur supprimé) : rechargée à la demande"""
+        with self._lock:
+            member_list = self._lists.pop(server_id, None)
+            if member_list:
+                for sid in member_list.subscribers:
+                    self._sid_server.pop(sid, None)
+                    self._emit(sid, 'member_list_invalidated', {'server_id': server_id})
+
+    # ── Interne ─────────────────────────────────────
+
+    def _apply(self, member_list, mutate, user_id):
+        if not member_list.subscribers:
+            mutate()
+            return
+        before = {sid: [[m['user_id'] for m in member_list.window(s, e)] for s, e in ranges]
+                  for sid, ranges in member_list.subscribers.items()}
+        groups_before = member_list.groups()
+        touched = mutate()
+        if touched is None:
+            return
+        lo, hi = touched
+        groups = member_list.groups()
+        for sid, ranges in member_list.subscribers.items():
+            updates = []
+            for (start, end), old_ids in zip(ranges, before[sid]):
+                if end < lo or (hi is not None and start > hi):
+                    continue  # plage non touchée (un déplacement ne décale que [lo, hi])
+                ops = window_ops(start, old_ids, member_list.window(start, end), user_id)
+                if ops:
+                    updates.append({'range': [start, end], 'ops': ops})
+            # Effectifs modifiés hors des plages : envoyés sans opération
+            if updates or groups != groups_before:
+                self._emit(sid, 'member_list_update', {
+                    'server_id': member_list.server_id,
+                    'total': len(member_list.entries),
+                    'online': member_list.online_count(),
+                    'groups': groups,
+                    'updates': updates
+                })
+
+    def _trim(self):
+        idle = [sid for sid, ml in self._lists.items() if not ml.subscribers]
+        for server_id in idle[:max(0, len(idle) - self.max_idle_lists)]:
+            del self._lists[server_id]
+
+
+def normalize_ranges(ranges):
+    """Plages [start, end] inclusives, bornées en taille et en nombre"""
+    result = []
+    for r in (ranges or [])[:MAX_RANGES]:
+        start = max(0, int(r[0]))
+        end = min(int(r[1]), start + MAX_RANGE_SIZE - 1)
+        if end >= start:
+            result.append((start, end))
+    return result or [(0, MAX_RANGE_SIZE - 1)]
+
+
+def window_ops(start, old_ids, new_items, changed_id):
+    """Opérations transformant l'ancienne plage en la nouvelle (index absolus).
+
+    Générées de la fin vers le début, pour que chaque index reste valide
+    lorsque le client les applique dans l'ordre.
+    """
+    new_ids = [m['user_id'] for m in new_items]
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_ids, new_ids, autojunk=False)
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == 'equal':
+            if changed_id in new_ids[j1:j2]:
+                k = new_ids.index(changed_id)
+                # Les blocs précédents ne sont pas encore appliqués : coordonnées anciennes
+                ops.append({'op': 'UPDATE', 'index': start + i1 + k - j1, 'item': new_items[k]})
+            continue
+        for _ in range(i1, i2):
+            ops.append({'op': 'DELETE', 'index': start + i1})
+        for j in range(j2 - 1, j1 - 1, -1):
+            ops.append({'op': 'INSERT', 'index': start + i1, 'item': new_items[j]})
+    return ops
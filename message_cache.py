@@ -0,0 +1,182 @@
+"""
+CACHE DES MESSAGES RÉCENTS — Likoo
+Tampon circulaire en mémoire des derniers messages de chaque canal
+"""
+
+import threading
+from collections import OrderedDict, deque
+
+
+class _ChannelBuffer:
+    """Derniers messages d'un canal, du plus ancien au plus récent.
+
+    complete = True si le canal ne contient aucun message plus ancien que le tampon.
+    """
+    __slots__ = ('messages', 'complete')
+
+    def __init__(self, maxlen):
+        self.messages = deque(maxlen=maxlen)
+        self.complete = False
+
+
+class RecentMessageCache:
+    """Cache des N derniers messages sérialisés par canal.
+
+    Les messages sont stockés au format compact (author_id) ; les profils
+    d'auteurs sont partagés entre canaux et comptés par référence, ce qui permet
+    de servir les deux formats de l'historique sans requête et de mettre à jour
+    un auteur en O(1). Les canaux sont évincés en LRU dès que la taille estimée
+    dépasse budget_bytes.
+
+    Chaque message envoyé est ajouté au tampon de son canal, même s'il n'est
+    pas encore en base (write-behind) : la fusion avec une page lue en base
+    (fill) reste donc exacte.
+    """
+
+    def __init__(self, per_channel=100, budget_bytes=64 * 1024 * 1024, status_of=None):
+        self.per_channel = per_channel
+        self.budget_bytes = budget_bytes
+        self._status_of = status_of  # statut effectif, lu à chaque page compacte
+        self._channels = OrderedDict()  # channel_id -> _ChannelBuffer (ordre LRU)
+        self._authors = {}  # user_id -> [full_dict, public_dict, refcount]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    # ── Lecture ─────────────────────────────────────
+
+    def newest_page(self, channel_id, limit, compact=False, record=True):
+        """Page la plus récente servie depuis le cache, ou None (miss).
+
+        Retourne (payload, has_before) au même format que get_messages.
+        record=False : relecture juste après fill, hors compteurs hit/miss.
+        """
+        with self._lock:
+            buf = self._channels.get(channel_id)
+            if buf is None or (len(buf.messages) < limit and not buf.complete):
+                if record:
+                    self.stats['misses'] += 1
+                return None
+            self._channels.move_to_end(channel_id)
+            if record:
+                self.stats['hits'] += 1
+            messages = list(buf.messages)[-limit:]
+            has_before = len(buf.messages) > limit or not buf.complete
+            if compact:
+                users = {m['author_id']: self._public(m['author_id']) for m in messages}
+                payload = {'messages': messages, 'users': users}
+            else:
+                payload = {'messages': [self._expand(m) for m in messages]}
+            return payload, has_before
+
+    def _public(self, user_id):
+        public = self._authors[user_id][1]
+        return dict(public, status=self._status_of(user_id)) if self._status_of else public
+
+    def _expand(self, message):
+        full = {k: v for k, v in message.items() if k != 'author_id'}
+        full['author'] = self._authors[message['author_id']][0]
+        return full
+
+    # ── Écriture ────────────────────────────────────
+
+    def append(self, channel_id, message, author):
+        """Ajoute un message envoyé (Message + User) en tête du tampon du canal"""
+        self.push(channel_id, message.to_compact_dict(), author.to_dict(), author.to_public_dict())
+
+    def push(self, channel_id, compact, author_full, author_public):
+        """append() à partir de dicts (rejouable sur un autre worker)"""
+        with self._lock:
+            buf = self._channels.get(channel_id)
+            if buf is None:
+                buf = self._channels[channel_id] = _ChannelBuffer(self.per_channel)
+            self._channels.move_to_end(channel_id)
+            self._push(buf, compact, (author_full, author_public))
+            self._enforce_budget()
+
+    def fill(self, channel_id, messages, complete):
+        """Complète le tampon avec une page la plus récente lue en base.
+
+        messages : Message (auteurs chargés) triés du plus ancien au plus récent.
+        complete : la page contient le début du canal.
+        """
+        with self._lock:
+            old = self._channels.pop(channel_id, None)
+            pending = list(old.messages) if old else []
+            known = {m['id'] for m in pending}
+            rows = [(m.to_compact_dict(), m.author) for m in messages if m.id not in known]
+            # Les messages envoyés (éventuellement pas encore en base) sont les plus récents
+            rows += [(m, None) for m in pending]
+            rows.sort(key=lambda r: (r[0]['created_at'], r[0]['id']))
+            buf = self._channels[channel_id] = _ChannelBuffer(self.per_channel)
+            for compact, author in rows[-self.per_channel:]:
+                self._push(buf, compact, author)
+            buf.complete = complete and len(rows) <= self.per_channel
+            if old:
+                # Après les push : les auteurs encore référencés restent en cache
+                self._drop(old)
+            self._enforce_budget()
+
+    def update_author(self, user):
+        """Profil modifié (pseudo, avatar) : mis à jour pour tous les canaux en cache"""
+        self.set_author(user.id, user.to_dict(), user.to_public_dict())
+
+    def set_author(self, user_id, author_full, author_public):
+        with self._lock:
+            entry = self._authors.get(user_id)
+            if entry:
+                entry[0], entry[1] = author_full, author_public
+
+    def invalidate_channel(self, channel_id):
+        with self._lock:
+            buf = self._channels.pop(channel_id, None)
+            if buf:
+                self._drop(buf)
+
+    def snapshot(self):
+        """Compteurs pour dimensionner le cache"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats,
+                        channels=len(self._channels),
+                        authors=len(self._authors),
+                        bytes=self._bytes,
+                        budget_bytes=self.budget_bytes,
+                        hit_ratio=round(self.stats['hits'] / lookups, 3) if lookups else None)
+
+    # ── Interne (verrou déjà pris) ──────────────────
+
+    def _push(self, buf, compact, author):
+        if len(buf.messages) == buf.messages.maxlen:
+            self._release(buf.messages[0])
+            buf.complete = False
+        buf.messages.append(compact)
+        self._bytes += _estimate(compact)
+        entry = self._authors.get(compact['author_id'])
+        if entry is None:
+            # author : User, ou (dict complet, dict public) pour un message rejoué
+            full, public = author if isinstance(author, tuple) else (author.to_dict(), author.to_public_dict())
+            entry = self._authors[compact['author_id']] = [full, public, 0]
+        entry[2] += 1
+
+    def _release(self, compact):
+        self._bytes -= _estimate(compact)
+        entry = self._authors[compact['author_id']]
+        entry[2] -= 1
+        if not entry[2]:
+            del self._authors[compact['author_id']]
+
+    def _drop(self, buf):
+        for compact in buf.messages:
+            self._release(compact)
+
+    def _enforce_budget(self):
+        while self._bytes > self.budget_bytes and len(self._channels) > 1:
+            _, buf = self._channels.popitem(last=False)
+            self._drop(buf)
+            self.stats['evictions'] += 1
+
+
+def _estimate(compact):
+    """Taille approximative d'un message en mémoire (octets)"""
+    return len(compact['content'].encode('utf-8')) + 400
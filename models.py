@@ -4,12 +4,56 @@ Utilise SQLite avec SQLAlchemy
 """
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
 from werkzeug.security import generate_password_hash, check_password_hash
+from contextlib import contextmanager
 from datetime import datetime
 import uuid
 
+from media_store import variant_url, LIST_SIZE, ICON_SIZE
+
 db = SQLAlchemy()
 
+def ensure_indexes():
+    """Crée les index manquants sur une base existante (create_all ne le fait
+    pas pour les tables déjà présentes)"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def ensure_columns():
+    """Ajoute les colonnes nullables manquantes sur une base existante
+    (create_all ne modifie pas les tables déjà présentes)"""
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    col_type = column.type.compile(dialect=db.engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+@contextmanager
+def count_queries():
+    """Compte les requêtes SQL exécutées dans le bloc (budgets de requêtes en test)
+
+        with count_queries() as counter:
+            client.get('/api/servers')
+        assert counter['count'] <= SERVERS_FULL_QUERY_BUDGET
+    """
+    counter = {'count': 0}
+    
+    def on_execute(*args):
+        counter['count'] += 1
+    
+    event.listen(db.engine, 'before_cursor_execute', on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', on_execute)
+
 # ═══════════════════════════════════════════════════
 # MODÈLES DE DONNÉES
 # ═══════════════════════════════════════════════════
@@ -40,18 +84,31 @@ class User(db.Model):
         """Vérifie le mot de passe"""
         return check_password_hash(self.password_hash, password)
     
-    def to_dict(self):
-        """Convertit en dictionnaire"""
+    def to_dict(self, avatar_size=LIST_SIZE):
+        """Convertit en dictionnaire ; avatar_size=None : avatar original (profil
+        de l'utilisateur connecté), sinon miniature (auteur, ami, demande)"""
         return {
             'id': self.id,
             'username': self.username,
             'email': self.email,
-            'avatar': self.avatar,
+            'avatar': variant_url(self.avatar, avatar_size),
             'color': self.color,
             'status': self.status,
             'tag': self.tag,
             'created_at': self.created_at.isoformat()
         }
+    
+    def to_public_dict(self, status_of=None):
+        """Profil public (sans email) utilisé dans les payloads compacts ;
+        status_of(user_id) : statut effectif (présence en mémoire)"""
+        return {
+            'id': self.id,
+            'username': self.username,
+            'avatar': variant_url(self.avatar, LIST_SIZE),
+            'color': self.color,
+            'status': status_of(self.id) if status_of else self.status,
+            'tag': self.tag
+        }
 
 
 class Server(db.Model):
@@ -65,25 +122,48 @@ class Server(db.Model):
     owner_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
     description = db.Column(db.String(500), default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)  # Tombstone : purge en cours
     
     # Relations
     owner = db.relationship('User', backref='owned_servers')
     channels = db.relationship('Channel', backref='server', lazy=True, cascade='all, delete-orphan')
     roles = db.relationship('Role', backref='server', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
+    @classmethod
+    def get_live(cls, server_id):
+        """Serveur non supprimé (un serveur en cours de purge est invisible)"""
+        return cls.query.filter_by(id=server_id, deleted_at=None).first()
+    
+    def to_dict(self, status_of=None):
+        """status_of(user_id) : statut effectif des membres (présence en
+        mémoire) ; sans lui, le statut en base, mis à jour périodiquement"""
         return {
             'id': self.id,
             'name': self.name,
             'icon': self.icon,
-            'icon_image': self.icon_image,
+            'icon_image': variant_url(self.icon_image, ICON_SIZE),
             'owner_id': self.owner_id,
             'description': self.description,
             'channels': [ch.to_dict() for ch in self.channels],
             'roles': [r.to_dict() for r in self.roles],
-            'members': [m.to_dict() for m in self.memberships],
+            'members': [m.to_dict(status_of) for m in self.memberships],
             'created_at': self.created_at.isoformat()
         }
+    
+    def to_summary_dict(self, member_count=0, role_count=0):
+        """Version légère pour la liste des serveurs : pas de membres ni de rôles"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'icon': self.icon,
+            'icon_image': variant_url(self.icon_image, ICON_SIZE),
+            'owner_id': self.owner_id,
+            'description': self.description,
+            'channels': [ch.to_dict() for ch in self.channels],
+            'member_count': member_count,
+            'channel_count': len(self.channels),
+            'role_count': role_count
+        }
 
 
 class Channel(db.Model):
@@ -100,6 +180,12 @@ class Channel(db.Model):
     # Relations
     messages = db.relationship('Message', backref='channel', lazy=True, cascade='all, delete-orphan')
     
+    @classmethod
+    def get_live(cls, channel_id):
+        """Canal dont le serveur n'est pas supprimé"""
+        return cls.query.join(Server, Server.id == cls.server_id)\
+            .filter(cls.id == channel_id, Server.deleted_at.is_(None)).first()
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -155,12 +241,12 @@ class ServerMember(db.Model):
     user = db.relationship('User', backref='server_memberships')
     server = db.relationship('Server', backref='memberships')
     
-    def to_dict(self):
+    def to_dict(self, status_of=None):
         return {
             'user_id': self.user_id,
             'username': self.user.username,
-            'avatar': self.user.avatar,
-            'status': self.user.status,
+            'avatar': variant_url(self.user.avatar, LIST_SIZE),
+            'status': status_of(self.user_id) if status_of else self.user.status,
             'role_id': self.role_id,
             'joined_at': self.joined_at.isoformat()
         }
@@ -170,6 +256,10 @@ class ServerMember(db.Model):
 class Message(db.Model):
     """Modèle message"""
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Index composite pour la pagination par curseur (keyset) de l'historique
+        db.Index('ix_messages_channel_created_id', 'channel_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     content = db.Column(db.Text, nullable=False)
@@ -178,11 +268,23 @@ class Message(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     edited_at = db.Column(db.DateTime)
     
-    def to_dict(self):
+    def to_dict(self, author=None):
+        """author : User déjà chargé (message pas encore en base, write-behind)"""
+        return {
+            'id': self.id,
+            'content': self.content,
+            'author': (author or self.author).to_dict(),
+            'channel_id': self.channel_id,
+            'created_at': self.created_at.isoformat(),
+            'edited_at': self.edited_at.isoformat() if self.edited_at else None
+        }
+    
+    def to_compact_dict(self):
+        """Comme to_dict mais l'auteur n'est référencé que par son id"""
         return {
             'id': self.id,
             'content': self.content,
-            'author': self.author.to_dict(),
+            'author_id': self.author_id,
             'channel_id': self.channel_id,
             'created_at': self.created_at.isoformat(),
             'edited_at': self.edited_at.isoformat() if self.edited_at else None
@@ -201,13 +303,23 @@ class DirectMessage(db.Model):
 
     sender = db.relationship('User', foreign_keys=[sender_id])
 
-    def to_dict(self):
+    def to_dict(self, sender=None):
+        return {
+            'id': self.id,
+            'content': self.content,
+            'sender_id': self.sender_id,
+            'receiver_id': self.receiver_id,
+            'author': (sender or self.sender).to_dict(),
+            'created_at': self.created_at.isoformat()
+        }
+
+    def to_compact_dict(self):
+        """Comme to_dict mais l'auteur n'est référencé que par sender_id"""
         return {
             'id': self.id,
             'content': self.content,
             'sender_id': self.sender_id,
             'receiver_id': self.receiver_id,
-            'author': self.sender.to_dict(),
             'created_at': self.created_at.isoformat()
         }
 
@@ -262,3 +374,18 @@ class ServerInvite(db.Model):
             'expires_at': self.expires_at.isoformat() if self.expires_at else None,
             'created_at': self.created_at.isoformat()
         }
+
+
+def compact_history(messages, author_key='author_id', status_of=None):
+    """Format compact d'une liste de messages (Message ou DirectMessage).
+
+    Les auteurs sont chargés en une seule requête et dédupliqués dans une
+    table 'users' indexée par id ; chaque message ne porte que l'id de son auteur.
+    status_of(user_id) : statut effectif des auteurs, comme pour les membres.
+    """
+    author_ids = {getattr(m, author_key) for m in messages}
+    users = User.query.filter(User.id.in_(author_ids)).all() if author_ids else []
+    return {
+        'messages': [m.to_compact_dict() for m in messages],
+        'users': {u.id: u.to_public_dict(status_of) for u in users}
+    }
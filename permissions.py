@@ -0,0 +1,120 @@
+"""
+PERMISSIONS — Likoo
+Permissions des rôles compilées en champs de bits, mises en cache par (utilisateur, serveur)
+"""
+
+import threading
+
+# Ordre figé : la position d'un nom est son bit. Ajouter à la fin uniquement.
+PERMISSION_NAMES = (
+    'manage_server',
+    'manage_roles',
+    'manage_channels',
+    'manage_members',
+    'send_messages',
+    'send_files',
+    'mention_everyone',
+    'manage_messages',
+    'mute_members',
+)
+FLAGS = {name: 1 << bit for bit, name in enumerate(PERMISSION_NAMES)}
+
+MANAGE_SERVER = FLAGS['manage_server']
+MANAGE_ROLES = FLAGS['manage_roles']
+MANAGE_CHANNELS = FLAGS['manage_channels']
+MANAGE_MEMBERS = FLAGS['manage_members']
+SEND_MESSAGES = FLAGS['send_messages']
+SEND_FILES = FLAGS['send_files']
+MENTION_EVERYONE = FLAGS['mention_everyone']
+MANAGE_MESSAGES = FLAGS['manage_messages']
+MUTE_MEMBERS = FLAGS['mute_members']
+
+ALL = (1 << len(PERMISSION_NAMES)) - 1
+NONE = 0
+# Membre sans rôle : mêmes droits que le rôle par défaut de Role.permissions
+DEFAULT_MEMBER = SEND_MESSAGES | SEND_FILES
+
+
+def compile_permissions(permissions):
+    """Dict JSON {nom: bool} d'un rôle -> entier ; les noms inconnus sont ignorés"""
+    bits = 0
+    for name, allowed in (permissions or {}).items():
+        if allowed:
+            bits |= FLAGS.get(name, 0)
+    return bits
+
+
+def effective_permissions(is_owner, is_member, role_permissions):
+    if is_owner:
+        return ALL
+    if not is_member:
+        return NONE
+    if role_permissions is None:
+        return DEFAULT_MEMBER
+    return compile_permissions(role_permissions)
+
+
+class PermissionResolver:
+    """Permissions effectives par (user_id, server_id), calculées une seule fois.
+
+    load(user_id, server_id) -> (is_owner, is_member, role_permissions) ou None
+    si le serveur n'existe pas. Un contrôle en cache est une lecture de dict et
+    un ET binaire, sans requête ni parsing JSON.
+
+    À invalider quand un rôle change (invalidate_server), quand un membre
+    rejoint, quitte ou change de rôle (invalidate_member).
+    """
+
+    def __init__(self, load, max_entries=100000):
+        self._load = load
+        self.max_entries = max_entries
+        self._cache = {}  # (user_id, server_id) -> bits (None : serveur inexistant)
+        self._by_server = {}  # server_id -> user_ids en cache
+        self._generation = 0  # incrémenté à chaque invalidation
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def permissions(self, user_id, server_id):
+        """Champ de bits effectif, ou None si le serveur n'existe pas"""
+        key = (user_id, server_id)
+        try:
+            bits = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            self.stats['hits'] += 1
+            return bits
+        self.stats['misses'] += 1
+        generation = self._generation
+        loaded = self._load(user_id, server_id)
+        bits = None if loaded is None else effective_permissions(*loaded)
+        with self._lock:
+            if generation != self._generation:
+                return bits  # invalidé pendant le chargement : résultat non mis en cache
+            if len(self._cache) >= self.max_entries:
+                self._cache.clear()
+                self._by_server.clear()
+            self._cache[key] = bits
+            self._by_server.setdefault(server_id, set()).add(user_id)
+        return bits
+
+    def has(self, user_id, server_id, flag):
+        bits = self.permissions(user_id, server_id)
+        return bits is not None and bits & flag == flag
+
+    def invalidate_server(self, server_id):
+        with self._lock:
+            for user_id in self._by_server.pop(server_id, ()):
+                self._cache.pop((user_id, server_id), None)
+            self._generation += 1
+            self.stats['invalidations'] += 1
+
+    def invalidate_member(self, user_id, server_id):
+        with self._lock:
+            self._cache.pop((user_id, server_id), None)
+            self._generation += 1
+            self.stats['invalidations'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._cache))
@@ -0,0 +1,314 @@
+"""
+PRÉSENCE — Likoo
+Statuts en mémoire (sessions + heartbeats) et diffusion aux seuls utilisateurs concernés
+"""
+
+import threading
+import time
+
+# Statuts choisis par l'utilisateur ; 'offline' = invisible
+CHOSEN_STATUSES = ('online', 'away', 'dnd', 'offline')
+
+
+class PresenceIndex:
+    """Appartenances serveurs et amitiés en mémoire, pour calculer l'audience d'un utilisateur.
+
+    Chargées à la demande (une requête par utilisateur ou serveur inconnu),
+    puis tenues à jour par les routes qui les modifient. Les loaders
+    retournent des itérables d'ids et sont appelés dans un contexte d'app.
+    """
+
+    def __init__(self, load_user_servers, load_server_members, load_friends):
+        self._load_user_servers = load_user_servers
+        self._load_server_members = load_server_members
+        self._load_friends = load_friends
+        self._user_servers = {}  # user_id -> {server_id}
+        self._server_members = {}  # server_id -> {user_id}
+        self._friends = {}  # user_id -> {user_id}
+        self._lock = threading.RLock()
+
+    def audience(self, user_id):
+        """Utilisateurs qui partagent un serveur avec user_id ou sont ses amis"""
+        with self._lock:
+            users = set(self._friends_of(user_id))
+            for server_id in self._servers_of(user_id):
+                users |= self._members_of(server_id)
+            users.discard(user_id)
+            return users
+
+    def servers_of(self, user_id):
+        with self._lock:
+            return set(self._servers_of(user_id))
+
+    def _servers_of(self, user_id):
+        servers = self._user_servers.get(user_id)
+        if servers is None:
+            servers = self._user_servers[user_id] = set(self._load_user_servers(user_id))
+        return servers
+
+    def _members_of(self, server_id):
+        members = self._server_members.get(server_id)
+        if members is None:
+            members = self._server_members[server_id] = set(self._load_server_members(server_id))
+        return members
+
+    def _friends_of(self, user_id):
+        friends = self._friends.get(user_id)
+        if friends is None:
+            friends = self._friends[user_id] = set(self._load_friends(user_id))
+        return friends
+
+    # ── Mises à jour (seules les entrées déjà chargées sont modifiées) ──
+
+    def add_member(self, server_id, user_id):
+        with self._lock:
+            if server_id in self._server_members:
+                self._server_members[server_id].add(user_id)
+            if user_id in self._user_servers:
+                self._user_servers[user_id].add(server_id)
+
+    def remove_server(self, server_id):
+        with self._lock:
+            for user_id in self._server_members.pop(server_id, ()):
+                if user_id in self._user_servers:
+                    self._user_servers[user_id].discard(server_id)
+            # Membres non chargés côté serveur mais chargés côté utilisateur
+            for servers in self._user_servers.values():
+                servers.discard(server_id)
+
+    def add_friendship(self, user_a, user_b):
+        with self._lock:
+            if user_a in self._friends:
+                self._friends[user_a].add(user_b)
+            if user_b in self._friends:
+                self._friends[user_b].add(user_a)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'users': len(self._user_servers),
+                'servers': len(self._server_members),
+                'friend_lists': len(self._friends)
+            }
+
+
+class PresenceFanout:
+    """Regroupe les changements de statut et les diffuse par fenêtres de window secondes.
+
+    Plusieurs changements d'un même utilisateur dans la fenêtre n'en font
+    qu'un (le dernier statut). Chaque changement est émis une fois, vers les
+    rooms personnelles de son audience (le manager Socket.IO dédoublonne les
+    sockets et n'encode le paquet qu'une fois).
+
+    emit(event, data, rooms) ; start_task / sleep : primitives Socket.IO
+    (compatibles avec le mode async).
+    """
+
+    def __init__(self, app, index, emit, start_task, sleep, window=0.25):
+        self.app = app
+        self.index = index
+        self._emit = emit
+        self._start_task = start_task
+        self._sleep = sleep
+        self.window = window
+        self._pending = {}  # user_id -> dernier statut
+        self._lock = threading.Lock()
+        self._started = False
+        self.stats = {'published': 0, 'coalesced': 0, 'emitted': 0, 'recipients': 0}
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self._start_task(self._run)
+
+    def publish(self, user_id, status):
+        with self._lock:
+            self.stats['published'] += 1
+            if user_id in self._pending:
+                self.stats['coalesced'] += 1
+            self._pending[user_id] = status
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with self.app.app_context():
+            for user_id, status in pending.items():
+                audience = self.index.audience(user_id)
+                # L'utilisateur lui-même (ses autres appareils) reçoit aussi son statut
+                rooms = [f'user_{uid}' for uid in audience] + [f'user_{user_id}']
+                self._emit('user_status_changed', {'user_id': user_id, 'status': status}, rooms)
+                self.stats['emitted'] += 1
+                self.stats['recipients'] += len(rooms)
+
+    def _run(self):
+        while True:
+            self._sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[PRESENCE] Erreur de diffusion: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, pending=len(self._pending), index=self.index.snapshot())
+
+
+class PresenceStore:
+    """Statut effectif des utilisateurs, dérivé de leurs sockets connectés.
+
+    Chaque socket identifié est une session ; le client envoie un heartbeat
+    périodique ({active}) : une session sans heartbeat depuis ttl secondes est
+    expirée (onglet figé, réseau coupé sans déconnexion propre).
+
+    Statut effectif : 'offline' sans session ; sinon le statut choisi s'il
+    vaut 'dnd', 'away' ou 'offline' (invisible) ; sinon 'away' si aucune
+    session n'a été active depuis idle_after secondes ; sinon 'online'.
+
+    Chaque changement de statut effectif appelle on_change(user_id, status) et
+    marque l'utilisateur à écrire : sweep() expire les sessions, recalcule les
+    statuts et écrit les statuts modifiés en base en un seul lot, via
+    flush(rows) (rows = [{'id', 'status'}]) ; flush=None sur les workers
+    secondaires (un seul worker écrit).
+    """
+
+    def __init__(self, on_change, flush, ttl=75, idle_after=300):
+        self._on_change = on_change
+        self._flush = flush
+        self.ttl = ttl
+        self.idle_after = idle_after
+        self._sessions = {}  # user_id -> {sid: [last_seen, last_active]}
+        self._sid_user = {}  # sid -> user_id
+        self._chosen = {}  # user_id -> statut choisi (si différent de 'online')
+        self._status = {}  # user_id -> dernier statut effectif publié (absent = offline)
+        self._dirty = {}  # user_id -> statut à écrire en base
+        self._lock = threading.Lock()
+        self.stats = {'heartbeats': 0, 'expired': 0, 'changes': 0, 'flushed': 0, 'flushes': 0}
+
+    # ── Lecture ─────────────────────────────────────
+
+    def status(self, user_id):
+        return self._status.get(user_id, 'offline')
+
+    def chosen(self, user_id):
+        """Statut choisi par l'utilisateur (affiché dans son propre profil)"""
+        return self._chosen.get(user_id, 'online')
+
+    # ── Sessions ────────────────────────────────────
+
+    def connect(self, sid, user_id):
+        now = time.monotonic()
+        with self._lock:
+            previous = self._sid_user.get(sid)
+            if previous and previous != user_id:
+                self._remove_sid(sid)
+            self._sid_user[sid] = user_id
+            self._sessions.setdefault(user_id, {})[sid] = [now, now]
+            changed = self._refresh(user_id, now)
+        self._notify(changed)
+
+    def heartbeat(self, sid, active=True):
+        now = time.monotonic()
+        with self._lock:
+            user_id = self._sid_user.get(sid)
+            if user_id is None:
+                return False  # session expirée : le client doit se réidentifier
+            session = self._sessions[user_id][sid]
+            session[0] = now
+            if active:
+                session[1] = now
+            self.stats['heartbeats'] += 1
+            changed = self._refresh(user_id, now)
+        self._notify(changed)
+        return True
+
+    def disconnect(self, sid):
+        with self._lock:
+            user_id = self._remove_sid(sid)
+            changed = self._refresh(user_id, time.monotonic()) if user_id else []
+        self._notify(changed)
+
+    def set_status(self, user_id, status):
+        """Statut choisi par l'utilisateur (online, away, dnd, offline = invisible)"""
+        if status not in CHOSEN_STATUSES:
+            return False
+        with self._lock:
+            if status == 'online':
+                self._chosen.pop(user_id, None)
+            else:
+                self._chosen[user_id] = status
+            changed = self._refresh(user_id, time.monotonic())
+        self._notify(changed)
+        return True
+
+    # ── Maintenance périodique ──────────────────────
+
+    def sweep(self):
+        """Expire les sessions muettes, passe les inactifs en 'away', écrit en base"""
+        now = time.monotonic()
+        changed = []
+        with self._lock:
+            for user_id, sessions in list(self._sessions.items()):
+                for sid, (last_seen, _) in list(sessions.items()):
+                    if now - last_seen > self.ttl:
+                        self._remove_sid(sid)
+                        self.stats['expired'] += 1
+                changed += self._refresh(user_id, now)
+            dirty, self._dirty = self._dirty, {}
+        self._notify(changed)
+        if dirty and self._flush:
+            try:
+                self._flush([{'id': uid, 'status': st} for uid, st in dirty.items()])
+            except Exception:
+                with self._lock:
+                    # Les changements plus récents restent prioritaires
+                    self._dirty = dict(dirty, **self._dirty)
+                raise
+            self.stats['flushed'] += len(dirty)
+            self.stats['flushes'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats,
+                        users=len(self._sessions),
+                        sessions=len(self._sid_user),
+                        pending_writes=len(self._dirty))
+
+    # ── Interne (verrou déjà pris) ──────────────────
+
+    def _remove_sid(self, sid):
+        user_id = self._sid_user.pop(sid, None)
+        sessions = self._sessions.get(user_id)
+        if sessions is not None:
+            sessions.pop(sid, None)
+            if not sessions:
+                del self._sessions[user_id]
+        return user_id
+
+    def _derive(self, user_id, now):
+        sessions = self._sessions.get(user_id)
+        if not sessions:
+            return 'offline'
+        chosen = self._chosen.get(user_id, 'online')
+        if chosen != 'online':
+            return chosen
+        if all(now - last_active > self.idle_after for _, last_active in sessions.values()):
+            return 'away'
+        return 'online'
+
+    def _refresh(self, user_id, now):
+        status = self._derive(user_id, now)
+        if status == self._status.get(user_id, 'offline'):
+            return []
+        if status == 'offline':
+            self._status.pop(user_id, None)
+        else:
+            self._status[user_id] = status
+        self._dirty[user_id] = status
+        self.stats['changes'] += 1
+        return [(user_id, status)]
+
+    def _notify(self, changed):
+        for user_id, status in changed:
+            self._on_change(user_id, status)
@@ -0,0 +1,98 @@
+"""
+LIMITATION DE DÉBIT — Likoo
+Seaux à jetons par utilisateur et par événement, en mémoire, avec expiration
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+# Refus : politique épuisée, secondes avant le prochain jeton, premier refus
+# depuis la dernière requête acceptée (pour ne prévenir le client qu'une fois)
+Throttled = namedtuple('Throttled', 'policy retry_after first')
+
+
+def parse_policies(text):
+    """'send_message=10/5,typing=6/5' -> {'send_message': (10, 5.0), ...} :
+    capacité du seau (rafale autorisée) / secondes pour la remplir"""
+    policies = {}
+    for item in text.split(','):
+        name, _, spec = item.strip().partition('=')
+        if not name or not spec:
+            continue
+        capacity, _, period = spec.partition('/')
+        policies[name] = (int(capacity), float(period or 1))
+    return policies
+
+
+class RateLimiter:
+    """Seaux à jetons (capacité, période) par (politique, clé).
+
+    check(clé, *politiques) consomme un jeton dans chaque seau, ou aucun si
+    l'un d'eux est vide : on combine ainsi un seau par événement et un seau
+    global par utilisateur. Un seau resté inactif assez longtemps pour être
+    de nouveau plein est équivalent à un seau absent : il est supprimé au
+    passage suivant du balayage (au plus une fois par sweep_interval), ce qui
+    borne la mémoire au nombre d'utilisateurs actifs.
+
+    Les seaux sont locaux au worker (un socket reste sur son worker).
+    """
+
+    def __init__(self, policies, sweep_interval=60.0, clock=time.monotonic):
+        self.policies = dict(policies)
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._buckets = {}  # (politique, clé) -> [jetons, mis à jour, refus en cours]
+        self._lock = threading.Lock()
+        self._next_sweep = clock() + sweep_interval
+        self.stats = {name: {'allowed': 0, 'throttled': 0} for name in self.policies}
+        self.expired = 0
+
+    def check(self, key, *names):
+        """None si autorisé (jetons consommés), sinon Throttled"""
+        names = [name for name in names if name in self.policies]
+        now = self._clock()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            buckets = []
+            for name in names:
+                capacity, period = self.policies[name]
+                bucket = self._buckets.get((name, key))
+                if bucket is None:
+                    bucket = self._buckets[(name, key)] = [float(capacity), now, False]
+                else:
+                    bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * capacity / period)
+                    bucket[1] = now
+                if bucket[0] < 1:
+                    self.stats[name]['throttled'] += 1
+                    first = not bucket[2]
+                    bucket[2] = True
+                    return Throttled(name, (1 - bucket[0]) * period / capacity, first)
+                buckets.append(bucket)
+            for name, bucket in zip(names, buckets):
+                bucket[0] -= 1
+                bucket[2] = False
+                self.stats[name]['allowed'] += 1
+        return None
+
+    def _sweep(self, now):
+        """Verrou déjà pris : supprime les seaux redevenus pleins"""
+        full = []
+        for (name, key), (tokens, updated, _) in self._buckets.items():
+            capacity, period = self.policies[name]
+            if tokens + (now - updated) * capacity / period >= capacity:
+                full.append((name, key))
+        for bucket_key in full:
+            del self._buckets[bucket_key]
+        self.expired += len(full)
+        self._next_sweep = now + self.sweep_interval
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'policies': {name: {'capacity': capacity, 'period': period, **self.stats[name]}
+                             for name, (capacity, period) in self.policies.items()},
+                'buckets': len(self._buckets),
+                'expired': self.expired,
+            }
@@ -0,0 +1,227 @@
+"""
+RECHERCHE PLEIN TEXTE — Likoo
+Index SQLite FTS5 sur Message.content et DirectMessage.content
+"""
+
+import time
+
+from sqlalchemy import text
+
+# Table source -> table FTS5. Les clés primaires des messages sont des UUID
+# (TEXT) et leur rowid implicite peut changer au VACUUM : chaque index a une
+# table <fts>_ids (docid INTEGER PRIMARY KEY, id) dont le docid, stable, sert
+# de rowid FTS.
+INDEXES = {
+    'messages': 'messages_fts',
+    'direct_messages': 'direct_messages_fts',
+}
+
+
+def ensure_fts(session):
+    """Crée les tables FTS5, les triggers de synchronisation et l'état de backfill.
+
+    Sur une base existante, un index créé ici ne couvre que les nouveaux
+    messages : les anciens sont indexés par backfill() (commande search-rebuild).
+    """
+    session.execute(text(
+        'CREATE TABLE IF NOT EXISTS search_backfill ('
+        " name TEXT PRIMARY KEY, cursor TEXT NOT NULL DEFAULT '', done INTEGER NOT NULL DEFAULT 0)"
+    ))
+    for source, fts in INDEXES.items():
+        exists = session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :fts"
+        ), {'fts': fts}).first()
+        if not exists:
+            _create_index(session, source, fts)
+    session.commit()
+
+
+def _drop_index(session, fts):
+    for suffix in ('ai', 'ad', 'au'):
+        session.execute(text(f'DROP TRIGGER IF EXISTS {fts}_{suffix}'))
+    session.execute(text(f'DROP TABLE IF EXISTS {fts}'))
+    session.execute(text(f'DROP TABLE IF EXISTS {fts}_ids'))
+
+
+def _create_index(session, source, fts):
+    ids = f'{fts}_ids'
+    session.execute(text(
+        f'CREATE TABLE {ids} (docid INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE)'
+    ))
+    # unicode61 + remove_diacritics : « eleve » trouve « élève »
+    session.execute(text(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5(content, tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+    session.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN
+            INSERT INTO {ids}(id) VALUES (new.id);
+            INSERT INTO {fts}(rowid, content)
+            VALUES ((SELECT docid FROM {ids} WHERE id = new.id), new.content);
+        END"""))
+    session.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN
+            DELETE FROM {fts} WHERE rowid = (SELECT docid FROM {ids} WHERE id = old.id);
+            DELETE FROM {ids} WHERE id = old.id;
+        END"""))
+    # Une ligne pas encore indexée par le backfill n'a pas de docid : rien à mettre à jour
+    session.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF content ON {source} BEGIN
+            DELETE FROM {fts} WHERE rowid = (SELECT docid FROM {ids} WHERE id = old.id);
+            INSERT INTO {fts}(rowid, content)
+            SELECT docid, new.content FROM {ids} WHERE id = new.id;
+        END"""))
+    # Les lignes déjà présentes restent à indexer par backfill
+    existing = session.execute(text(f'SELECT COUNT(*) FROM {source}')).scalar()
+    session.execute(text(
+        "INSERT OR REPLACE INTO search_backfill (name, cursor, done) VALUES (:name, '', :done)"
+    ), {'name': fts, 'done': int(not existing)})
+    if existing:
+        print(f"[SEARCH] Index {fts} créé : {existing} lignes à indexer (flask --app server search-rebuild)")
+
+
+def rebuild(session, batch_size=2000, pause=0.05, log=print):
+    """Reconstruit les index : supprime puis recrée, et réindexe tout par lots"""
+    for source, fts in INDEXES.items():
+        _drop_index(session, fts)
+        _create_index(session, source, fts)
+        session.commit()
+    backfill(session, batch_size, pause, log)
+
+
+def backfill(session, batch_size=2000, pause=0.05, log=print):
+    """Indexe les lignes antérieures à la création de l'index, par lots.
+
+    Parcourt la table source dans l'ordre des id. Chaque lot est une
+    transaction courte suivie d'une pause, pour ne pas bloquer les écritures
+    (SQLite n'a qu'un écrivain à la fois). Reprend là où un backfill
+    interrompu s'est arrêté.
+    """
+    for source, fts in INDEXES.items():
+        ids = f'{fts}_ids'
+        state = session.execute(text(
+            'SELECT cursor, done FROM search_backfill WHERE name = :name'
+        ), {'name': fts}).first()
+        if not state or state.done:
+            continue
+        cursor, indexed = state.cursor, 0
+        while True:
+            page = session.execute(text(
+                f'SELECT id FROM {source} WHERE id > :cursor ORDER BY id LIMIT :limit'
+            ), {'cursor': cursor, 'limit': batch_size}).scalars().all()
+            if page:
+                # Les lignes insérées depuis la création de l'index ont déjà un docid (trigger)
+                before = session.execute(text(f'SELECT COALESCE(MAX(docid), 0) FROM {ids}')).scalar()
+                session.execute(text(f"""
+                    INSERT INTO {ids}(id)
+                    SELECT s.id FROM {source} s
+                    WHERE s.id > :lo AND s.id <= :hi
+                      AND NOT EXISTS (SELECT 1 FROM {ids} i WHERE i.id = s.id)
+                """), {'lo': cursor, 'hi': page[-1]})
+                added = session.execute(text(f"""
+                    INSERT INTO {fts}(rowid, content)
+                    SELECT i.docid, s.content FROM {ids} i JOIN {source} s ON s.id = i.id
+                    WHERE i.docid > :before
+                """), {'before': before}).rowcount
+                indexed += max(added, 0)
+                cursor = page[-1]
+            done = len(page) < batch_size
+            session.execute(text(
+                'UPDATE search_backfill SET cursor = :cursor, done = :done WHERE name = :name'
+            ), {'cursor': cursor, 'done': int(done), 'name': fts})
+            session.commit()
+            log(f'[SEARCH] {fts}: {indexed} lignes indexées')
+            if done:
+                break
+            time.sleep(pause)
+
+
+def index_complete(session):
+    """True si tous les index couvrent l'historique complet"""
+    pending = session.execute(text('SELECT COUNT(*) FROM search_backfill WHERE done = 0')).scalar()
+    return not pending
+
+
+def match_query(raw):
+    """Transforme la saisie utilisateur en requête FTS5 sûre.
+
+    Chaque mot devient un terme entre guillemets (ET implicite) ; le dernier
+    est recherché en préfixe pour la recherche au fil de la frappe.
+    """
+    terms = [t.replace('"', '""') for t in raw.split() if t.strip('"')]
+    if not terms:
+        return None
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _sql_datetime(value):
+    """Format de stockage des DateTime SQLAlchemy sous SQLite (comparable en texte)"""
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def search_messages(session, query, user_id, server_id=None, channel_id=None,
+                    author_id=None, since=None, until=None, limit=25, offset=0):
+    """Messages de canaux correspondant à query, classés par pertinence (bm25).
+
+    Limité aux serveurs dont user_id est membre. Retourne limit + 1 lignes au
+    plus pour détecter la page suivante.
+    """
+    clauses = [
+        'messages_fts MATCH :q',
+        'c.server_id IN (SELECT server_id FROM server_members WHERE user_id = :me)'
+    ]
+    params = {'q': query, 'me': user_id, 'limit': limit + 1, 'offset': offset}
+    if server_id:
+        clauses.append('c.server_id = :server_id')
+        params['server_id'] = server_id
+    if channel_id:
+        clauses.append('m.channel_id = :channel_id')
+        params['channel_id'] = channel_id
+    if author_id:
+        clauses.append('m.author_id = :author_id')
+        params['author_id'] = author_id
+    if since:
+        clauses.append('m.created_at >= :since')
+        params['since'] = _sql_datetime(since)
+    if until:
+        clauses.append('m.created_at < :until')
+        params['until'] = _sql_datetime(until)
+    return session.execute(text(f"""
+        SELECT m.id, m.author_id, m.channel_id, c.server_id, m.created_at,
+               snippet(messages_fts, 0, '**', '**', '…', 12) AS snippet
+        FROM messages_fts
+        JOIN messages_fts_ids i ON i.docid = messages_fts.rowid
+        JOIN messages m ON m.id = i.id
+        JOIN channels c ON c.id = m.channel_id
+        JOIN servers s ON s.id = c.server_id AND s.deleted_at IS NULL
+        WHERE {' AND '.join(clauses)}
+        ORDER BY bm25(messages_fts)
+        LIMIT :limit OFFSET :offset
+    """), params).mappings().all()
+
+
+def search_direct_messages(session, query, user_id, friend_id=None, since=None,
+                           until=None, limit=25, offset=0):
+    """Messages privés de user_id correspondant à query, classés par pertinence"""
+    clauses = ['direct_messages_fts MATCH :q', '(d.sender_id = :me OR d.receiver_id = :me)']
+    params = {'q': query, 'me': user_id, 'limit': limit + 1, 'offset': offset}
+    if friend_id:
+        clauses.append('(d.sender_id = :friend OR d.receiver_id = :friend)')
+        params['friend'] = friend_id
+    if since:
+        clauses.append('d.created_at >= :since')
+        params['since'] = _sql_datetime(since)
+    if until:
+        clauses.append('d.created_at < :until')
+        params['until'] = _sql_datetime(until)
+    return session.execute(text(f"""
+        SELECT d.id, d.sender_id, d.receiver_id, d.created_at,
+               snippet(direct_messages_fts, 0, '**', '**', '…', 12) AS snippet
+        FROM direct_messages_fts
+        JOIN direct_messages_fts_ids i ON i.docid = direct_messages_fts.rowid
+        JOIN direct_messages d ON d.id = i.id
+        WHERE {' AND '.join(clauses)}
+        ORDER BY bm25(direct_messages_fts)
+        LIMIT :limit OFFSET :offset
+    """), params).mappings().all()
@@ -3,73 +3,373 @@ LIKOO SERVER v2 — Flask + SQLAlchemy + WebSocket + Auth
 Serveur moderne avec base de données et chat temps réel
 """
 
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Mode de service : eventlet / gevent doivent patcher la bibliothèque
+# standard avant tout autre import
+from blocking import monkey_patch, BlockingPool
+ASYNC_MODE = monkey_patch(os.getenv('ASYNC_MODE', 'threading'),
+                          pool_size=int(os.getenv('BLOCKING_POOL_SIZE', 8)))
+
 from flask import Flask, render_template, jsonify, request, session
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit, join_room, leave_room
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from werkzeug.middleware.proxy_fix import ProxyFix
+from flask_socketio import SocketIO, ConnectionRefusedError, emit, join_room, leave_room
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
 from datetime import datetime, timedelta
 from functools import wraps
-import os
 from pathlib import Path
+import math
 import secrets
 import string
 import uuid
 import json
+import atexit
+import click
 from google.oauth2 import id_token
 from google.auth.transport import requests
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
 
-from models import db, User, Server, Channel, Message, FriendRequest, DirectMessage, ServerMember, Role, ServerInvite
-
-# Track voice channel members: {channel_id: [user_id, ...]}
-voice_channel_members = {}
-
-# Track user session IDs for WebRTC routing: {user_id: sid}
-user_sessions = {}
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+
+from models import db, ensure_indexes, ensure_columns, compact_history, User, Server, Channel, Message, FriendRequest, DirectMessage, ServerMember, Role, ServerInvite
+from write_behind import WriteBehindWriter, WriteBehindFull
+from message_cache import RecentMessageCache
+from server_cache import ServerSnapshotCache
+from member_list import MemberListRegistry, MAX_RANGE_SIZE, normalize_ranges
+from server_purge import ServerPurger
+from typing_indicator import TypingTracker
+from event_batcher import EventBatcher
+from rate_limit import RateLimiter, parse_policies
+from backpressure import SlowConsumerGuard
+from backplane import LocalSocketManager, ClusterBus
+from shared_store import create_store
+from socket_sessions import SocketSessions
+from voice_state import VoiceState
+from signaling import IceCoalescer, SignalingMetrics
+from assets import AssetIndex
+from media import MediaIndex, MEDIA_CACHE_CONTROL, not_modified, parse_range, read_range
+from media_store import MediaStore, MEDIA_DIR, LIST_SIZE, ICON_SIZE, variant_url
+from wire import RefTable, PackedFanout, message_fields, dm_fields, presence_fields
+from presence import PresenceIndex, PresenceFanout, PresenceStore
+from permissions import PermissionResolver, MANAGE_CHANNELS, MANAGE_MEMBERS, SEND_MESSAGES
+from search import ensure_fts, backfill, rebuild, index_complete, match_query, search_messages, search_direct_messages
 
 # ═══════════════════════════════════════════════════
 # CONFIGURATION
 # ═══════════════════════════════════════════════════
 
 BASE_DIR = Path(__file__).resolve().parent
-# set template and static directories to project root so html/css/js are found
+# Templates à la racine du projet ; la page, le CSS et les scripts sont servis
+# par l'index d'assets (voir assets.py), avatars et icônes par serve_media ; rien d'autre
 app = Flask(
     __name__,
     template_folder=str(BASE_DIR),
-    static_folder=str(BASE_DIR),
-    static_url_path='',
+    static_folder=None,
     instance_path=str(BASE_DIR / 'instance')
 )
 
 # Config Database
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{BASE_DIR}/likoo.db'
+# Base du projet par défaut ; DATABASE_URL pour une autre (tests, benchmarks)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', f'sqlite:///{BASE_DIR}/likoo.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Config JWT
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET', 'dev-secret-key-change-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
 
-# Config Session
-app.config['SECRET_KEY'] = secrets.token_hex(32)
+# Config Session (partagée entre workers si SECRET_KEY est fournie)
+app.config['SECRET_KEY'] = os.getenv('SECRET_KEY') or secrets.token_hex(32)
+
+# Config write-behind (persistance groupée des messages WebSocket)
+app.config['WRITE_BEHIND_FLUSH_INTERVAL'] = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', 0.05))
+app.config['WRITE_BEHIND_BATCH_SIZE'] = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 500))
+app.config['WRITE_BEHIND_QUEUE_SIZE'] = int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', 10000))
+app.config['WRITE_BEHIND_MAX_RETRIES'] = int(os.getenv('WRITE_BEHIND_MAX_RETRIES', 5))
+app.config['WRITE_BEHIND_SEGMENT_SIZE'] = int(os.getenv('WRITE_BEHIND_SEGMENT_SIZE', 5000))
+
+# Config cache des messages récents (par canal, budget mémoire global)
+app.config['MESSAGE_CACHE_PER_CHANNEL'] = int(os.getenv('MESSAGE_CACHE_PER_CHANNEL', 100))
+app.config['MESSAGE_CACHE_BUDGET_MB'] = int(os.getenv('MESSAGE_CACHE_BUDGET_MB', 64))
+
+# Config cache des instantanés de serveurs (ETag / 304)
+app.config['SERVER_CACHE_BUDGET_MB'] = int(os.getenv('SERVER_CACHE_BUDGET_MB', 32))
+
+# Config purge des serveurs supprimés (lots courts, pause entre deux transactions)
+app.config['SERVER_PURGE_BATCH_SIZE'] = int(os.getenv('SERVER_PURGE_BATCH_SIZE', 1000))
+app.config['SERVER_PURGE_PAUSE'] = float(os.getenv('SERVER_PURGE_PAUSE', 0.05))
+
+# Config présence : fenêtre de regroupement des changements de statut (secondes)
+app.config['PRESENCE_FANOUT_WINDOW'] = float(os.getenv('PRESENCE_FANOUT_WINDOW', 0.25))
+# Session expirée sans heartbeat après TTL s ; 'away' après IDLE_AFTER s d'inactivité ;
+# expiration et écriture groupée des statuts en base toutes les SWEEP_INTERVAL s
+app.config['PRESENCE_HEARTBEAT_TTL'] = float(os.getenv('PRESENCE_HEARTBEAT_TTL', 75))
+app.config['PRESENCE_IDLE_AFTER'] = float(os.getenv('PRESENCE_IDLE_AFTER', 300))
+app.config['PRESENCE_SWEEP_INTERVAL'] = float(os.getenv('PRESENCE_SWEEP_INTERVAL', 5))
+
+# Config indicateur de frappe : une mise à jour par canal par intervalle, expiration (secondes)
+app.config['TYPING_INTERVAL'] = float(os.getenv('TYPING_INTERVAL', 1.0))
+app.config['TYPING_TTL'] = float(os.getenv('TYPING_TTL', 6.0))
+
+# Config regroupement des émissions par room : fenêtre (secondes, 0 = désactivé),
+# taille maximale d'un lot, événements jamais retardés
+app.config['EVENT_BATCH_WINDOW'] = float(os.getenv('EVENT_BATCH_WINDOW', 0.005))
+app.config['EVENT_BATCH_MAX'] = int(os.getenv('EVENT_BATCH_MAX', 64))
+app.config['EVENT_BATCH_IMMEDIATE'] = [e for e in os.getenv(
+    'EVENT_BATCH_IMMEDIATE', 'webrtc_offer,webrtc_answer'
+).split(',') if e]
+
+# Config signalisation WebRTC : fenêtre de regroupement des candidats ICE par
+# paire (secondes, 0 = désactivé), candidats max par trame, pairs max par canal vocal (0 = illimité)
+app.config['ICE_COALESCE_WINDOW'] = float(os.getenv('ICE_COALESCE_WINDOW', 0.02))
+app.config['ICE_COALESCE_MAX'] = int(os.getenv('ICE_COALESCE_MAX', 32))
+app.config['VOICE_MAX_PEERS'] = int(os.getenv('VOICE_MAX_PEERS', 10))
+
+# Config limitation de débit : seaux à jetons 'politique=capacité/secondes'
+# (par utilisateur et par événement ; 'user' = tous les événements limités d'un utilisateur ;
+# 'auth' = inscription et connexion, par adresse IP)
+app.config['RATE_LIMITS'] = parse_policies(os.getenv(
+    'RATE_LIMITS',
+    'user=300/10,send_message=10/5,send_dm=10/5,typing=6/10,webrtc_ice_candidate=200/5,'
+    'upload=5/60,rest_write=30/60,auth=10/60'
+))
+# Proxys de confiance devant l'application (nginx : 1) ; leur X-Forwarded-For
+# donne l'adresse du client (limite 'auth' par IP). 0 : connexion directe
+app.config['TRUSTED_PROXIES'] = int(os.getenv('TRUSTED_PROXIES', 0))
+# Consommateurs lents : paquets en attente par socket avant 'drop' ou 'disconnect' (0 = illimité)
+app.config['SOCKET_BUFFER_LIMIT'] = int(os.getenv('SOCKET_BUFFER_LIMIT', 512))
+app.config['SLOW_CONSUMER_POLICY'] = os.getenv('SLOW_CONSUMER_POLICY', 'disconnect')
+
+# Config assets statiques : page principale et fichiers à empreinte de contenu
+app.config['STATIC_PAGE'] = 'likoo.html'
+app.config['STATIC_ASSETS'] = [a for a in os.getenv('STATIC_ASSETS', 'style.css,resize.js').split(',') if a]
+
+# Config médias (avatars, icônes) : dossiers servis ; préfixe interne nginx
+# (X-Accel-Redirect) pour déléguer l'envoi au proxy, vide = envoi par l'application
+app.config['MEDIA_DIRS'] = ['avatars', 'server_icons', MEDIA_DIR]
+app.config['MEDIA_ACCEL_REDIRECT'] = os.getenv('MEDIA_ACCEL_REDIRECT', '')
+# Stockage adressé par contenu : workers de génération des miniatures,
+# passage du ramasse-miettes (secondes, 0 = désactivé) et âge minimal d'un
+# fichier non référencé avant suppression
+app.config['MEDIA_STORE_WORKERS'] = int(os.getenv('MEDIA_STORE_WORKERS', 2))
+app.config['MEDIA_GC_INTERVAL'] = float(os.getenv('MEDIA_GC_INTERVAL', 3600))
+app.config['MEDIA_GC_GRACE'] = float(os.getenv('MEDIA_GC_GRACE', 3600))
+
+# Config multi-workers (voir cluster.py) : backplane des emits Socket.IO
+# ('tcp://hôte:port' = hub local, ou une URL redis:// / amqp:// gérée par Flask-SocketIO),
+# magasin partagé ('tcp://hôte:port' ou mémoire) et index du worker (0 = principal)
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+app.config['SHARED_STORE_URL'] = os.getenv('SHARED_STORE_URL', '')
+app.config['WORKER_INDEX'] = int(os.getenv('LIKOO_WORKER_INDEX', 0))
+PRIMARY_WORKER = app.config['WORKER_INDEX'] == 0
+
+# Config mode de service : threading (Werkzeug, un thread par connexion),
+# eventlet ou gevent (greenlets) ; threads du pool pour le travail bloquant
+app.config['ASYNC_MODE'] = ASYNC_MODE
+app.config['BLOCKING_POOL_SIZE'] = int(os.getenv('BLOCKING_POOL_SIZE', 8))
 
 # Initialisation
 db.init_app(app)
 jwt = JWTManager(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
 CORS(app)
 
+# Avec le hub local, les caches et états en mémoire sont répliqués entre workers
+cluster_bus = None
+queue_url = app.config['SOCKETIO_MESSAGE_QUEUE']
+if queue_url.startswith('tcp://'):
+    cluster_bus = ClusterBus(app)
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE,
+                        client_manager=LocalSocketManager(queue_url, bus=cluster_bus))
+elif queue_url:
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, message_queue=queue_url)
+else:
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE)
+
+# Derrière un proxy, remote_addr et le schéma viennent des en-têtes X-Forwarded-*
+# (posés après SocketIO pour couvrir aussi les connexions Socket.IO)
+if app.config['TRUSTED_PROXIES'] > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'],
+                            x_proto=app.config['TRUSTED_PROXIES'])
+
+# File de sortie bornée par socket (clients qui ne lisent plus assez vite)
+slow_consumers = SlowConsumerGuard(socketio.server,
+                                   limit=app.config['SOCKET_BUFFER_LIMIT'],
+                                   policy=app.config['SLOW_CONSUMER_POLICY'])
+slow_consumers.install()
+
+rate_limiter = RateLimiter(app.config['RATE_LIMITS'])
+
+# Hachage de mots de passe, écritures de fichiers et requêtes SQLite lourdes
+blocking_pool = BlockingPool(ASYNC_MODE, max_workers=app.config['BLOCKING_POOL_SIZE'])
+# Les threads d'arrière-plan ne sont des greenlets qu'en mode async : leur
+# travail SQLite passe alors aussi par le pool
+background_offload = blocking_pool.run if blocking_pool.cooperative else None
+
+def run_db(fn, *args, **kwargs):
+    """fn(*args, **kwargs) dans le pool, avec son propre contexte d'app (et
+    donc sa propre session) : le résultat doit être détaché de la session"""
+    def call():
+        with app.app_context():
+            return fn(*args, **kwargs)
+    return blocking_pool.run(call)
+
+# Membres des canaux vocaux, sid WebRTC par utilisateur, jetons OAuth en attente
+shared_store = create_store(app.config['SHARED_STORE_URL'])
+# Ids internés du format 'packed' (propres au worker, définis par socket)
+ref_table = RefTable()
+# Occupants des canaux vocaux (par canal et par serveur) et routage WebRTC
+voice_state = VoiceState(shared_store)
+
+def emit_from_local_state(event, data, to):
+    """Emit calculé à partir d'un état répliqué sur chaque worker (listes de
+    membres, présence, frappe) : chaque worker ne sert que ses propres sockets"""
+    socketio.emit(event, data, to=to, ignore_queue=cluster_bus is not None)
+
+# Messages, frappe, départs vocaux et signalisation passent par les lots de room
+event_batcher = EventBatcher(
+    send=lambda event, data, room, **options: socketio.emit(event, data, to=room, **options),
+    start_task=socketio.start_background_task,
+    sleep=socketio.sleep,
+    window=app.config['EVENT_BATCH_WINDOW'],
+    max_batch=app.config['EVENT_BATCH_MAX'],
+    immediate=app.config['EVENT_BATCH_IMMEDIATE']
+)
+event_batcher.start()
+
+# Format packed : encodé par socket, seulement s'il y a des sockets packed ici
+packed_fanout = PackedFanout(
+    ref_table,
+    room_sids=lambda room: socket_sessions.room_sids(room),
+    send=lambda event, data, sid: event_batcher.emit(event, data, sid, ignore_queue=cluster_bus is not None)
+)
+
+# Signalisation WebRTC : candidats ICE regroupés par paire, trafic par canal
+signaling_metrics = SignalingMetrics()
+
+def send_ice_frame(target_sid, channel_id, payload):
+    socketio.emit('webrtc_ice_candidates', payload, to=target_sid)
+    signaling_metrics.record(channel_id, 'frames')
+
+ice_coalescer = IceCoalescer(
+    send=send_ice_frame,
+    start_task=socketio.start_background_task,
+    sleep=socketio.sleep,
+    window=app.config['ICE_COALESCE_WINDOW'],
+    max_candidates=app.config['ICE_COALESCE_MAX']
+)
+ice_coalescer.start()
+
+# Un journal par worker, en segments <journal>.000001... : chacun rejoue et vide
+# le sien (après la mise à jour du schéma, voir before_request) ; lignes
+# refusées dans <journal>.dead.jsonl
+journal_name = 'write_behind.journal' if PRIMARY_WORKER else f"write_behind.{app.config['WORKER_INDEX']}.journal"
+write_behind = WriteBehindWriter(
+    app, db,
+    models={'message': Message, 'dm': DirectMessage},
+    journal_path=Path(app.instance_path) / journal_name,
+    flush_interval=app.config['WRITE_BEHIND_FLUSH_INTERVAL'],
+    batch_size=app.config['WRITE_BEHIND_BATCH_SIZE'],
+    max_queue=app.config['WRITE_BEHIND_QUEUE_SIZE'],
+    max_retries=app.config['WRITE_BEHIND_MAX_RETRIES'],
+    segment_size=app.config['WRITE_BEHIND_SEGMENT_SIZE'],
+    offload=background_offload
+)
+write_behind.start()
+# Vider la file d'écriture avant de quitter
+atexit.register(write_behind.stop)
+
+server_purger = ServerPurger(
+    app, db,
+    icons_dir=BASE_DIR / 'server_icons',
+    batch_size=app.config['SERVER_PURGE_BATCH_SIZE'],
+    pause=app.config['SERVER_PURGE_PAUSE'],
+    drain=write_behind.flush,
+    offload=background_offload
+)
+server_purger.start()
+atexit.register(server_purger.stop)
+
+message_cache = RecentMessageCache(
+    per_channel=app.config['MESSAGE_CACHE_PER_CHANNEL'],
+    budget_bytes=app.config['MESSAGE_CACHE_BUDGET_MB'] * 1024 * 1024,
+    status_of=lambda user_id: presence_store.status(user_id)
+)
+
+# Page, CSS et scripts précompressés, en mémoire
+static_assets = AssetIndex(BASE_DIR, app.config['STATIC_PAGE'], app.config['STATIC_ASSETS'])
+static_assets.build()
+
+# Métadonnées des avatars et icônes (taille, date, ETag), sans stat par requête
+media_index = MediaIndex(BASE_DIR, app.config['MEDIA_DIRS'])
+media_index.scan()
+
+def media_references():
+    """URL des blobs encore utilisés (avatars, icônes de serveurs)"""
+    with app.app_context():
+        return set(db.session.execute(text(
+            f"SELECT avatar FROM users WHERE avatar LIKE '/{MEDIA_DIR}/%' "
+            f"UNION SELECT icon_image FROM servers WHERE icon_image LIKE '/{MEDIA_DIR}/%'"
+        )).scalars())
+
+media_store = MediaStore(
+    BASE_DIR / MEDIA_DIR, media_references,
+    index=media_index,
+    workers=app.config['MEDIA_STORE_WORKERS'],
+    gc_interval=app.config['MEDIA_GC_INTERVAL'],
+    grace=app.config['MEDIA_GC_GRACE'],
+    offload=background_offload
+)
+media_store.start()
+atexit.register(media_store.stop)
+
+server_snapshots = ServerSnapshotCache(budget_bytes=app.config['SERVER_CACHE_BUDGET_MB'] * 1024 * 1024)
+
 # ═══════════════════════════════════════════════════
 # CONTEXT INITIALIZATION
 # ═══════════════════════════════════════════════════
 
+_schema_ready = False
+
 @app.before_request
 def before_request():
-    """Crée les tables si elles n'existent pas"""
+    """Crée les tables et index s'ils n'existent pas (une seule fois)"""
+    global _schema_ready
+    if _schema_ready:
+        return
     with app.app_context():
         db.create_all()
+        ensure_columns()
+        ensure_indexes()
+        ensure_fts(db.session)
+        # Schéma à jour : le journal peut être rejoué
+        write_behind.ready()
+        if PRIMARY_WORKER:
+            # Statuts hérités du processus précédent : personne n'est encore connecté
+            User.query.filter(User.status != 'offline').update({'status': 'offline'})
+            db.session.commit()
+            server_purger.resume()
+    _schema_ready = True
+
+@app.cli.command('search-rebuild')
+@click.option('--batch-size', default=2000, help='Lignes indexées par transaction')
+@click.option('--pause', default=0.05, help='Pause entre deux lots (secondes)')
+@click.option('--full', is_flag=True, help='Supprime et reconstruit entièrement les index')
+def search_rebuild_command(batch_size, pause, full):
+    """Indexe l'historique existant pour la recherche plein texte (par lots)"""
+    db.create_all()
+    ensure_fts(db.session)
+    if full:
+        rebuild(db.session, batch_size, pause, log=click.echo)
+    else:
+        backfill(db.session, batch_size, pause, log=click.echo)
+    click.echo('[SEARCH] Index à jour')
 
 # ═══════════════════════════════════════════════════
 # UTILITAIRES
@@ -80,12 +380,230 @@ def generate_tag():
     import random
     return ''.join(random.choices(string.digits, k=4))
 
+def serve_server_snapshot(server_id, view, build):
+    """Répond avec l'instantané en cache d'une vue de serveur (ETag / 304).
+
+    build() renvoie les données à sérialiser, ou None si le serveur n'existe pas ;
+    il est exécuté par run_db. Un If-None-Match à jour reçoit un 304 sans corps
+    ni requête en base.
+    """
+    version = server_snapshots.version(server_id, view)
+    etag = server_snapshots.etag(server_id, view, version)
+    if request.if_none_match.contains(etag):
+        server_snapshots.record_not_modified()
+        response = app.response_class(status=304)
+    else:
+        cached = server_snapshots.get(server_id, view)
+        if cached:
+            version, body = cached
+            etag = server_snapshots.etag(server_id, view, version)
+        else:
+            data = run_db(build)
+            if data is None:
+                return jsonify({'error': 'Serveur non trouvé'}), 404
+            body = app.json.dumps(data).encode('utf-8')
+            server_snapshots.put(server_id, view, version, body)
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def member_item(member):
+    """Entrée de la liste des membres synchronisée par plages"""
+    return {
+        'user_id': member.user_id,
+        'username': member.user.username,
+        'avatar': variant_url(member.user.avatar, LIST_SIZE),
+        'status': presence_store.status(member.user_id),
+        'role_id': member.role_id
+    }
+
+def load_member_list(server_id):
+    """Chargement d'une liste de membres : deux requêtes quel que soit l'effectif"""
+    if not Server.get_live(server_id):
+        return None
+    members = ServerMember.query.filter_by(server_id=server_id)\
+        .options(selectinload(ServerMember.user)).all()
+    roles = Role.query.filter_by(server_id=server_id).order_by(Role.created_at).all()
+    return ([member_item(m) for m in members], {r.id: rank for rank, r in enumerate(roles)},
+            {r.id: r.name for r in roles})
+
+member_lists = MemberListRegistry(
+    load=lambda server_id: run_db(load_member_list, server_id),
+    emit=lambda sid, event, data: emit_from_local_state(event, data, sid)
+)
+
+# Identité de chaque socket, vérifiée une fois à la connexion
+socket_sessions = SocketSessions()
+
+def load_server_permissions(user_id, server_id):
+    """(propriétaire ?, membre ?, permissions JSON du rôle) en une requête"""
+    row = db.session.query(Server.owner_id, ServerMember.user_id, Role.permissions)\
+        .outerjoin(ServerMember, (ServerMember.server_id == Server.id) & (ServerMember.user_id == user_id))\
+        .outerjoin(Role, Role.id == ServerMember.role_id)\
+        .filter(Server.id == server_id, Server.deleted_at.is_(None)).first()
+    if row is None:
+        return None
+    owner_id, member_id, role_permissions = row
+    return owner_id == user_id, member_id is not None, role_permissions
+
+# Chargements (cache manquant) dans le pool : jamais de SQLite sur la boucle
+server_permissions = PermissionResolver(
+    load=lambda user_id, server_id: run_db(load_server_permissions, user_id, server_id)
+)
+
+def load_user_servers(user_id):
+    rows = db.session.query(ServerMember.server_id)\
+        .join(Server, Server.id == ServerMember.server_id)\
+        .filter(ServerMember.user_id == user_id, Server.deleted_at.is_(None)).all()
+    return [server_id for server_id, in rows]
+
+def load_server_members(server_id):
+    rows = db.session.query(ServerMember.user_id).filter(ServerMember.server_id == server_id).all()
+    return [user_id for user_id, in rows]
+
+def load_friends(user_id):
+    rows = db.session.query(FriendRequest.sender_id, FriendRequest.receiver_id).filter(
+        ((FriendRequest.sender_id == user_id) | (FriendRequest.receiver_id == user_id)),
+        FriendRequest.status == 'accepted'
+    ).all()
+    return [receiver if sender == user_id else sender for sender, receiver in rows]
+
+presence_index = PresenceIndex(
+    lambda user_id: run_db(load_user_servers, user_id),
+    lambda server_id: run_db(load_server_members, server_id),
+    lambda user_id: run_db(load_friends, user_id)
+)
+def emit_presence(event, data, rooms):
+    """Changement de statut dans chaque format : JSON (full, compact) ou binaire (packed)"""
+    emit_from_local_state(event, data, [f'{room}:{fmt}' for room in rooms for fmt in ('full', 'compact')])
+    packed_fanout.emit(event, presence_fields(data['user_id'], data['status']), rooms)
+
+presence_fanout = PresenceFanout(
+    app, presence_index,
+    emit=emit_presence,
+    start_task=socketio.start_background_task,
+    sleep=socketio.sleep,
+    window=app.config['PRESENCE_FANOUT_WINDOW']
+)
+presence_fanout.start()
+
+# Vues en cache qui contiennent le statut des membres
+PRESENCE_VIEWS = ('server', 'members')
+
+def on_presence_change(user_id, status):
+    """Statut effectif modifié : listes de membres, vues qui l'embarquent et abonnés"""
+    member_lists.update_user(user_id, status=status)
+    server_snapshots.invalidate_views(presence_index.servers_of(user_id), PRESENCE_VIEWS)
+    presence_fanout.publish(user_id, status)
+
+def write_presence(rows):
+    try:
+        db.session.execute(db.update(User), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def flush_presence(rows):
+    """Écrit les statuts modifiés depuis le dernier passage, en une transaction"""
+    if blocking_pool.cooperative:
+        run_db(write_presence, rows)
+    else:
+        write_presence(rows)
+
+presence_store = PresenceStore(
+    on_change=on_presence_change,
+    flush=flush_presence if PRIMARY_WORKER else None,
+    ttl=app.config['PRESENCE_HEARTBEAT_TTL'],
+    idle_after=app.config['PRESENCE_IDLE_AFTER']
+)
+
+def presence_sweep_loop():
+    while True:
+        socketio.sleep(app.config['PRESENCE_SWEEP_INTERVAL'])
+        try:
+            with app.app_context():
+                presence_store.sweep()
+        except Exception as e:
+            print(f"[PRESENCE] Erreur lors du passage périodique: {e}")
+
+socketio.start_background_task(presence_sweep_loop)
+
+typing_tracker = TypingTracker(
+    emit=lambda channel_id, data: event_batcher.emit('typing_update', data, f'channel_{channel_id}',
+                                                     ignore_queue=cluster_bus is not None),
+    start_task=socketio.start_background_task,
+    sleep=socketio.sleep,
+    interval=app.config['TYPING_INTERVAL'],
+    ttl=app.config['TYPING_TTL']
+)
+typing_tracker.start()
+
+if cluster_bus:
+    # Appels rejoués sur les autres workers (état en mémoire de chaque processus)
+    cluster_bus.replicate('messages', message_cache, 'push', 'set_author', 'invalidate_channel')
+    cluster_bus.replicate('snapshots', server_snapshots, 'invalidate')
+    cluster_bus.replicate('permissions', server_permissions, 'invalidate_server', 'invalidate_member')
+    cluster_bus.replicate('member_lists', member_lists, 'upsert_member', 'update_user', 'drop')
+    cluster_bus.replicate('presence_index', presence_index, 'add_member', 'remove_server', 'add_friendship')
+    cluster_bus.replicate('presence', presence_store, 'connect', 'heartbeat', 'disconnect', 'set_status')
+    cluster_bus.replicate('typing', typing_tracker, 'typing', 'stop')
+    cluster_bus.replicate('sessions', socket_sessions, 'update_profile', 'forget_server')
+    cluster_bus.replicate('packed', packed_fanout, 'publish')
+
+def permission_denied(user_id, server_id, flag, message='Accès refusé'):
+    """Réponse d'erreur (404 / 403) si user_id n'a pas la permission, sinon None"""
+    bits = server_permissions.permissions(user_id, server_id)
+    if bits is None:
+        return jsonify({'error': 'Serveur non trouvé'}), 404
+    if bits & flag != flag:
+        return jsonify({'error': message}), 403
+    return None
+
+def invalidate_user_servers(user_id):
+    """Profil modifié : invalide les instantanés des serveurs dont il est membre"""
+    rows = db.session.query(ServerMember.server_id).filter_by(user_id=user_id).all()
+    server_snapshots.invalidate(*[r.server_id for r in rows])
+
+def throttled_response(throttled):
+    """429 avec le délai avant la prochaine requête acceptée"""
+    retry_after = math.ceil(throttled.retry_after)
+    response = jsonify({'error': 'Trop de requêtes, réessayez plus tard', 'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def rate_limited_route(policy):
+    """Limite une route authentifiée (sous @jwt_required) par utilisateur"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            throttled = rate_limiter.check(get_jwt_identity(), policy)
+            if throttled:
+                return throttled_response(throttled)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def rate_limited_ip(policy):
+    """Limite une route publique (sans JWT) par adresse IP du client"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            throttled = rate_limiter.check(request.remote_addr, policy)
+            if throttled:
+                return throttled_response(throttled)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # ═══════════════════════════════════════════════════
 # AUTHENTIFICATION - ROUTES
 # ═══════════════════════════════════════════════════
 
 # (before_request already defined above)
 @app.route('/api/auth/register', methods=['POST'])
+@rate_limited_ip('auth')
 def register():
     """Crée un nouvel utilisateur"""
     data = request.json
@@ -110,17 +628,8 @@ def register():
             import base64, re
             m = re.match(r'data:(image/[^;]+);base64', header)
             if m:
-                mime = m.group(1)
-                ext = mime.split('/')[-1]
-                if ext == 'jpeg':
-                    ext = 'jpg'
-                filename = f"{uuid.uuid4()}.{ext}"
-                avatars_dir = BASE_DIR / 'avatars'
-                avatars_dir.mkdir(exist_ok=True)
-                file_path = avatars_dir / filename
-                with open(file_path, 'wb') as f:
-                    f.write(base64.b64decode(b64))
-                avatar_val = f"/avatars/{filename}"
+                # Format reconnu d'après le contenu ; None -> avatar par défaut
+                avatar_val = blocking_pool.run(media_store.put, base64.b64decode(b64)) or '👤'
         except Exception as ex:
             # if anything goes wrong we just fall back to default
             avatar_val = '👤'
@@ -130,7 +639,7 @@ def register():
         avatar=avatar_val,
         tag=generate_tag()
     )
-    user.set_password(data['password'])
+    blocking_pool.run(user.set_password, data['password'])
     
     db.session.add(user)
     db.session.commit()
@@ -140,11 +649,12 @@ def register():
     
     return jsonify({
         'message': 'Utilisateur créé',
-        'user': user.to_dict(),
+        'user': dict(user.to_dict(avatar_size=None), status=presence_store.chosen(user.id)),
         'access_token': access_token
     }), 201
 
 @app.route('/api/auth/login', methods=['POST'])
+@rate_limited_ip('auth')
 def login():
     """Authentifie un utilisateur"""
     data = request.json
@@ -154,18 +664,14 @@ def login():
     
     user = User.query.filter_by(username=data['username']).first()
     
-    if not user or not user.check_password(data['password']):
+    if not user or not blocking_pool.run(user.check_password, data['password']):
         return jsonify({'error': 'Identifiants incorrects'}), 401
     
-    # Update status
-    user.status = 'online'
-    db.session.commit()
-    
     access_token = create_access_token(identity=user.id)
     
     return jsonify({
         'message': 'Connecté',
-        'user': user.to_dict(),
+        'user': dict(user.to_dict(avatar_size=None), status=presence_store.chosen(user.id)),
         'access_token': access_token
     }), 200
 
@@ -173,8 +679,9 @@ def login():
 # GOOGLE OAUTH LOGIN
 # ─────────────────────────────────────────────
 
-# Temporary OAuth token storage (use Redis in production)
-oauth_tokens = {}
+# Jetons OAuth en attente de récupération : magasin partagé (le callback et le
+# polling du client peuvent arriver sur deux workers différents)
+OAUTH_TOKEN_TTL = 300
 
 @app.route('/oauth/google/callback')
 def oauth_callback():
@@ -212,7 +719,7 @@ def oauth_callback():
         if response.status_code == 200:
             data = response.json()
             id_token = data.get('id_token')
-            oauth_tokens[state] = id_token
+            shared_store.set(f'oauth:{state}', id_token, ttl=OAUTH_TOKEN_TTL)
             print(f"[OAuth] Token stored for state: {state}")
             
             return '''
@@ -240,9 +747,8 @@ def get_oauth_token():
     if not state:
         return jsonify({'error': 'State missing'}), 400
     
-    token = oauth_tokens.get(state)
+    token = shared_store.pop(f'oauth:{state}')
     if token:
-        del oauth_tokens[state]
         return jsonify({'token': token})
     
     return jsonify({'waiting': True})
@@ -320,21 +826,17 @@ def google_login():
                 tag=generate_tag()
             )
             # Les utilisateurs Google n'ont pas de mot de passe
-            user.set_password(secrets.token_urlsafe(16))
+            blocking_pool.run(user.set_password, secrets.token_urlsafe(16))
             
             db.session.add(user)
             db.session.commit()
         
-        # Update status
-        user.status = 'online'
-        db.session.commit()
-        
         # Créer le JWT
         access_token = create_access_token(identity=user.id)
         
         return jsonify({
             'message': 'Connecté via Google',
-            'user': user.to_dict(),
+            'user': dict(user.to_dict(avatar_size=None), status=presence_store.chosen(user.id)),
             'access_token': access_token
         }), 200
         
@@ -352,7 +854,7 @@ def get_me():
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
     
-    return jsonify(user.to_dict()), 200
+    return jsonify(dict(user.to_dict(avatar_size=None), status=presence_store.chosen(user.id))), 200
 
 
 # ─────────────────────────────────────────────
@@ -360,6 +862,7 @@ def get_me():
 # ─────────────────────────────────────────────
 @app.route('/api/auth/avatar', methods=['POST'])
 @jwt_required()
+@rate_limited_route('upload')
 def upload_avatar():
     """Permet à l'utilisateur connecté d'uploader une image/gif comme avatar."""
     if 'avatar' not in request.files:
@@ -371,16 +874,18 @@ def upload_avatar():
     ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
     if ext not in allowed:
         return jsonify({'error': 'Type de fichier non supporté'}), 400
-    # sauvegarde dans un dossier avatars à la racine du projet
-    avatars_dir = BASE_DIR / 'avatars'
-    avatars_dir.mkdir(exist_ok=True)
-    filename = f"{uuid.uuid4()}.{ext}"
-    file_path = avatars_dir / filename
-    file.save(str(file_path))
+    # blob adressé par contenu (un fichier identique n'est pas réécrit)
+    url = blocking_pool.run(media_store.put, file.read())
+    if url is None:
+        return jsonify({'error': 'Type de fichier non supporté'}), 400
     user = User.query.get(get_jwt_identity())
-    # on stocke le chemin relatif qui sera servi par Flask (static_url_path='')
-    user.avatar = f"/avatars/{filename}"
+    user.avatar = url
     db.session.commit()
+    message_cache.update_author(user)
+    invalidate_user_servers(user.id)
+    member_lists.update_user(user.id, avatar=variant_url(user.avatar, LIST_SIZE))
+    socket_sessions.update_profile(user.id, socket_profile(user))
+    voice_state.update_profile(user.id, voice_profile(socket_profile(user)))
     
     # Notifier tous les serveurs où cet utilisateur est membre
     servers = db.session.query(Server).join(ServerMember).filter(ServerMember.user_id == user.id).all()
@@ -388,10 +893,10 @@ def upload_avatar():
         socketio.emit('user_avatar_updated', {
             'user_id': user.id,
             'username': user.username,
-            'avatar': user.avatar
+            'avatar': variant_url(user.avatar, LIST_SIZE)
         }, room=f'server_{server.id}')
     
-    return jsonify({'avatar': user.avatar}), 200
+    return jsonify({'avatar': user.avatar, 'variants': media_store.variants(user.avatar)}), 200
 
 
 # permet de modifier le profil (pseudo / avatar)
@@ -405,50 +910,93 @@ def update_me():
     if 'username' in data:
         user.username = data['username']
     if 'avatar' in data:
-        user.avatar = data['avatar']
-    if 'status' in data:
-        user.status = data['status']
+        # Un client peut renvoyer l'URL d'une miniature : on garde l'original
+        user.avatar = media_store.canonical(data['avatar'])
     db.session.commit()
-    return jsonify(user.to_dict()), 200
+    message_cache.update_author(user)
+    invalidate_user_servers(user.id)
+    member_lists.update_user(user.id, username=user.username, avatar=variant_url(user.avatar, LIST_SIZE))
+    socket_sessions.update_profile(user.id, socket_profile(user))
+    voice_state.update_profile(user.id, voice_profile(socket_profile(user)))
+    if 'status' in data:
+        # Statut choisi : gardé en mémoire, écrit en base par le passage périodique
+        presence_store.set_status(user.id, data['status'])
+    return jsonify(dict(user.to_dict(avatar_size=None), status=presence_store.chosen(user.id))), 200
 
 # ═══════════════════════════════════════════════════
 # SERVEURS - ROUTES
 # ═══════════════════════════════════════════════════
 
+# Nombre de requêtes SQL de GET /api/servers, indépendant du nombre de
+# serveurs, canaux et membres (à vérifier avec models.count_queries)
+SERVERS_SUMMARY_QUERY_BUDGET = 5
+SERVERS_FULL_QUERY_BUDGET = 6
+
+def full_server_options():
+    """Chargement groupé de tout ce que sérialise Server.to_dict"""
+    return (
+        selectinload(Server.channels),
+        selectinload(Server.roles),
+        selectinload(Server.memberships).selectinload(ServerMember.user)
+    )
+
+def _count_by_server(column, server_ids):
+    """{server_id: nombre de lignes} en une seule requête groupée"""
+    rows = db.session.query(column, db.func.count()).filter(column.in_(server_ids)).group_by(column).all()
+    return dict(rows)
+
+def load_servers(user_id, summary):
+    """Serveurs possédés ou rejoints par user_id, sérialisés (voir get_servers) ;
+    None si l'utilisateur n'existe pas"""
+    if not User.query.get(user_id):
+        return None
+    
+    # Serveurs possédés ou rejoints, en une requête
+    member_of = db.session.query(ServerMember.server_id).filter(ServerMember.user_id == user_id)
+    query = Server.query.filter((Server.owner_id == user_id) | Server.id.in_(member_of))\
+        .filter(Server.deleted_at.is_(None))
+    if summary:
+        query = query.options(selectinload(Server.channels))
+    else:
+        query = query.options(*full_server_options())
+    # Serveurs possédés d'abord, puis par date de création
+    result = sorted(query.all(), key=lambda srv: (srv.owner_id != user_id, srv.created_at))
+    
+    if not summary:
+        return [srv.to_dict(presence_store.status) for srv in result]
+    
+    server_ids = [srv.id for srv in result]
+    if not server_ids:
+        return []
+    member_counts = _count_by_server(ServerMember.server_id, server_ids)
+    role_counts = _count_by_server(Role.server_id, server_ids)
+    return [
+        srv.to_summary_dict(member_counts.get(srv.id, 0), role_counts.get(srv.id, 0))
+        for srv in result
+    ]
+
 @app.route('/api/servers', methods=['GET'])
 @jwt_required()
 def get_servers():
-    """Récupère les serveurs de l'utilisateur"""
+    """Récupère les serveurs de l'utilisateur.
+
+    view=summary : id, nom, icône, compteurs et canaux (membres via /members).
+    Sinon forme complète, chargée relation par relation (une requête chacune).
+    """
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
+        summary = request.args.get('view') == 'summary'
+        servers = run_db(load_servers, user_id, summary)
+        if servers is None:
             return jsonify({'error': 'Utilisateur non trouvé'}), 404
-        
-        # Récupérer serveurs où l'utilisateur est propriétaire
-        result = []
-        seen = set()
-        
-        # Ajouter les serveurs possédés
-        for srv in user.owned_servers:
-            if srv.id not in seen:
-                seen.add(srv.id)
-                result.append(srv)
-        
-        # Ajouter les serveurs via les memberships
-        for member in user.server_memberships:
-            if member.server_id not in seen:
-                seen.add(member.server_id)
-                result.append(member.server)
-        
-        return jsonify([srv.to_dict() for srv in result]), 200
+        return jsonify(servers), 200
     except Exception as e:
         print(f"Erreur get_servers: {str(e)}")
         return jsonify({'error': f'Erreur serveur: {str(e)}'}), 500
 
 @app.route('/api/servers', methods=['POST'])
 @jwt_required()
+@rate_limited_route('rest_write')
 def create_server():
     """Crée un nouveau serveur"""
     try:
@@ -489,8 +1037,9 @@ def create_server():
         db.session.add(member)
         
         db.session.commit()
+        presence_index.add_member(server.id, user_id)
 
-        return jsonify(server.to_dict()), 201
+        return jsonify(server.to_dict(presence_store.status)), 201
     except Exception as e:
         db.session.rollback()
         print(f"Erreur create_server: {str(e)}")
@@ -501,12 +1050,11 @@ def create_server():
 def get_server(server_id):
     """Récupère les détails d'un serveur"""
     try:
-        server = Server.query.get(server_id)
+        def build():
+            server = Server.query.options(*full_server_options()).filter_by(id=server_id, deleted_at=None).first()
+            return server.to_dict(presence_store.status) if server else None
         
-        if not server:
-            return jsonify({'error': 'Serveur non trouvé'}), 404
-        
-        return jsonify(server.to_dict()), 200
+        return serve_server_snapshot(server_id, 'server', build)
     except Exception as e:
         print(f"Erreur get_server: {str(e)}")
         return jsonify({'error': f'Erreur serveur: {str(e)}'}), 500
@@ -517,7 +1065,7 @@ def update_server(server_id):
     """Met à jour les infos du serveur"""
     try:
         user_id = get_jwt_identity()
-        server = Server.query.get(server_id)
+        server = Server.get_live(server_id)
         
         if not server:
             return jsonify({'error': 'Serveur non trouvé'}), 404
@@ -536,7 +1084,8 @@ def update_server(server_id):
             server.icon = data['icon']
         
         db.session.commit()
-        return jsonify(server.to_dict()), 200
+        server_snapshots.invalidate(server_id)
+        return jsonify(server.to_dict(presence_store.status)), 200
     except Exception as e:
         db.session.rollback()
         print(f"Erreur update_server: {str(e)}")
@@ -548,7 +1097,7 @@ def delete_server(server_id):
     """Supprime un serveur et tous ses contenus"""
     try:
         user_id = get_jwt_identity()
-        server = Server.query.get(server_id)
+        server = Server.get_live(server_id)
         
         if not server:
             return jsonify({'error': 'Serveur non trouvé'}), 404
@@ -557,27 +1106,48 @@ def delete_server(server_id):
         if server.owner_id != user_id:
             return jsonify({'error': 'Accès refusé'}), 403
         
-        # Supprimer les channels, rôles, membres, messages
-        Channel.query.filter_by(server_id=server_id).delete()
-        Role.query.filter_by(server_id=server_id).delete()
-        ServerMember.query.filter_by(server_id=server_id).delete()
-        
-        # Supprimer le serveur
-        db.session.delete(server)
+        # Tombstone : le serveur disparaît de toutes les routes immédiatement ;
+        # messages, canaux, rôles, membres et icône sont purgés en arrière-plan
+        server.deleted_at = datetime.utcnow()
         db.session.commit()
-        
-        return jsonify({'success': True}), 200
+        for channel in server.channels:
+            message_cache.invalidate_channel(channel.id)
+        server_snapshots.invalidate(server_id)
+        server_permissions.invalidate_server(server_id)
+        member_lists.drop(server_id)
+        socket_sessions.forget_server(server_id)
+        presence_index.remove_server(server_id)
+        server_purger.schedule(server_id, user_id)
+        
+        return jsonify({'success': True, 'purge': server_purger.progress(server_id)}), 202
     except Exception as e:
         db.session.rollback()
         print(f"Erreur delete_server: {str(e)}")
         return jsonify({'error': f'Erreur lors de la suppression: {str(e)}'}), 500
 
+@app.route('/api/servers/<server_id>/purge', methods=['GET'])
+@jwt_required()
+def get_server_purge(server_id):
+    """Avancement de la purge d'un serveur supprimé (propriétaire uniquement)"""
+    user_id = get_jwt_identity()
+    progress = server_purger.progress(server_id)
+    if progress is None:
+        server = Server.query.get(server_id)
+        if not server or not server.deleted_at or server.owner_id != user_id:
+            return jsonify({'error': 'Aucune purge pour ce serveur'}), 404
+        # Purge interrompue pas encore replanifiée
+        return jsonify({'server_id': server_id, 'status': 'queued'}), 200
+    if progress['owner_id'] != user_id:
+        return jsonify({'error': 'Aucune purge pour ce serveur'}), 404
+    return jsonify(progress), 200
+
 @app.route('/api/servers/<server_id>/upload-icon', methods=['POST'])
 @jwt_required()
+@rate_limited_route('upload')
 def upload_server_icon(server_id):
     """Upload une image comme icône de serveur"""
     user_id = get_jwt_identity()
-    server = Server.query.get(server_id)
+    server = Server.get_live(server_id)
     
     if not server:
         return jsonify({'error': 'Serveur non trouvé'}), 404
@@ -598,23 +1168,23 @@ def upload_server_icon(server_id):
     if ext not in allowed:
         return jsonify({'error': 'Type de fichier non supporté'}), 400
     
-    # Sauvegarder l'image
-    server_icons_dir = BASE_DIR / 'server_icons'
-    server_icons_dir.mkdir(exist_ok=True)
-    filename = f"{uuid.uuid4()}.{ext}"
-    file_path = server_icons_dir / filename
-    file.save(str(file_path))
+    # Sauvegarder l'image (blob adressé par contenu)
+    url = blocking_pool.run(media_store.put, file.read())
+    if url is None:
+        return jsonify({'error': 'Type de fichier non supporté'}), 400
     
-    server.icon_image = f"/server_icons/{filename}"
+    server.icon_image = url
     db.session.commit()
+    server_snapshots.invalidate(server_id)
     
     # Émettre l'événement WebSocket pour notifier les autres clients
     socketio.emit('server_icon_updated', {
         'server_id': server_id,
-        'icon_image': server.icon_image
+        'icon_image': variant_url(server.icon_image, ICON_SIZE)
     }, room=f'server_{server_id}')
     
-    return jsonify({'icon_image': server.icon_image}), 200
+    return jsonify({'icon_image': variant_url(server.icon_image, ICON_SIZE),
+                    'variants': media_store.variants(server.icon_image)}), 200
 
 # ═══════════════════════════════════════════════════
 # RÔLES - ROUTES
@@ -625,22 +1195,23 @@ def upload_server_icon(server_id):
 def get_server_roles(server_id):
     """Récupère les rôles d'un serveur"""
     try:
-        server = Server.query.get(server_id)
-        if not server:
-            return jsonify({'error': 'Serveur non trouvé'}), 404
+        def build():
+            server = Server.get_live(server_id)
+            return [r.to_dict() for r in server.roles] if server else None
         
-        return jsonify([r.to_dict() for r in server.roles]), 200
+        return serve_server_snapshot(server_id, 'roles', build)
     except Exception as e:
         print(f"Erreur get_server_roles: {str(e)}")
         return jsonify({'error': f'Erreur: {str(e)}'}), 500
 
 @app.route('/api/servers/<server_id>/roles', methods=['POST'])
 @jwt_required()
+@rate_limited_route('rest_write')
 def create_role(server_id):
     """Crée un nouveau rôle"""
     try:
         user_id = get_jwt_identity()
-        server = Server.query.get(server_id)
+        server = Server.get_live(server_id)
         
         if not server:
             return jsonify({'error': 'Serveur non trouvé'}), 404
@@ -674,6 +1245,7 @@ def create_role(server_id):
         
         db.session.add(role)
         db.session.commit()
+        server_snapshots.invalidate(server_id)
         
         return jsonify(role.to_dict()), 201
     except Exception as e:
@@ -687,7 +1259,7 @@ def update_role(server_id, role_id):
     """Modifie un rôle"""
     try:
         user_id = get_jwt_identity()
-        server = Server.query.get(server_id)
+        server = Server.get_live(server_id)
         
         if not server:
             return jsonify({'error': 'Serveur non trouvé'}), 404
@@ -708,6 +1280,9 @@ def update_role(server_id, role_id):
             role.permissions = data['permissions']
         
         db.session.commit()
+        server_snapshots.invalidate(server_id)
+        if 'permissions' in data:
+            server_permissions.invalidate_server(server_id)
         return jsonify(role.to_dict()), 200
     except Exception as e:
         db.session.rollback()
@@ -720,7 +1295,7 @@ def delete_role(server_id, role_id):
     """Supprime un rôle"""
     try:
         user_id = get_jwt_identity()
-        server = Server.query.get(server_id)
+        server = Server.get_live(server_id)
         
         if not server:
             return jsonify({'error': 'Serveur non trouvé'}), 404
@@ -734,6 +1309,11 @@ def delete_role(server_id, role_id):
         
         db.session.delete(role)
         db.session.commit()
+        server_snapshots.invalidate(server_id)
+        server_permissions.invalidate_server(server_id)
+        # Le rang des rôles restants change l'ordre de la liste des membres
+        member_lists.drop(server_id)
+        socket_sessions.forget_server(server_id)
         
         return jsonify({'message': 'Rôle supprimé'}), 200
     except Exception as e:
@@ -749,25 +1329,21 @@ def delete_role(server_id, role_id):
 @jwt_required()
 def get_channels(server_id):
     """Récupère les canaux d'un serveur"""
-    server = Server.query.get(server_id)
+    def build():
+        server = Server.get_live(server_id)
+        return [ch.to_dict() for ch in server.channels] if server else None
     
-    if not server:
-        return jsonify({'error': 'Serveur non trouvé'}), 404
-    
-    return jsonify([ch.to_dict() for ch in server.channels]), 200
+    return serve_server_snapshot(server_id, 'channels', build)
 
 @app.route('/api/servers/<server_id>/channels', methods=['POST'])
 @jwt_required()
+@rate_limited_route('rest_write')
 def create_channel(server_id):
     """Crée un canal"""
     user_id = get_jwt_identity()
-    server = Server.query.get(server_id)
-    
-    if not server:
-        return jsonify({'error': 'Serveur non trouvé'}), 404
-    
-    if server.owner_id != user_id:
-        return jsonify({'error': 'Non autorisé'}), 403
+    denied = permission_denied(user_id, server_id, MANAGE_CHANNELS, 'Non autorisé')
+    if denied:
+        return denied
     
     data = request.json
     channel = Channel(
@@ -779,32 +1355,50 @@ def create_channel(server_id):
     
     db.session.add(channel)
     db.session.commit()
+    server_snapshots.invalidate(server_id)
     
     return jsonify(channel.to_dict()), 201
 
 @app.route('/api/servers/<server_id>/members', methods=['GET'])
 @jwt_required()
 def get_server_members(server_id):
-    """Récupère les membres d'un serveur"""
+    """Récupère les membres d'un serveur.
+
+    Avec start / end : plage [start, end] de la liste triée (en ligne, rôle, nom),
+    servie depuis la mémoire, avec total et effectif par section.
+    """
     try:
-        server = Server.query.get(server_id)
-        
-        if not server:
-            return jsonify({'error': 'Serveur non trouvé'}), 404
-        
-        members = ServerMember.query.filter_by(server_id=server_id).all()
-        
-        result = []
-        for m in members:
-            result.append({
-                'user_id': m.user_id,
-                'username': m.user.username,
-                'avatar': m.user.avatar,
-                'role_id': m.role_id,
-                'joined_at': m.joined_at.isoformat()
-            })
-        
-        return jsonify(result), 200
+        if 'start' in request.args or 'end' in request.args:
+            try:
+                start = int(request.args.get('start', 0))
+                end = int(request.args.get('end', start + MAX_RANGE_SIZE - 1))
+            except ValueError:
+                return jsonify({'error': 'Plage invalide'}), 400
+            member_list = member_lists.get(server_id)
+            if member_list is None:
+                return jsonify({'error': 'Serveur non trouvé'}), 404
+            return jsonify(member_lists.sync_payload(member_list, normalize_ranges([(start, end)]))), 200
+        
+        def build():
+            if not Server.get_live(server_id):
+                return None
+            
+            members = ServerMember.query.filter_by(server_id=server_id)\
+                .options(selectinload(ServerMember.user)).all()
+            
+            result = []
+            for m in members:
+                result.append({
+                    'user_id': m.user_id,
+                    'username': m.user.username,
+                    'avatar': variant_url(m.user.avatar, LIST_SIZE),
+                    'status': presence_store.status(m.user_id),
+                    'role_id': m.role_id,
+                    'joined_at': m.joined_at.isoformat()
+                })
+            return result
+        
+        return serve_server_snapshot(server_id, 'members', build)
     except Exception as e:
         print(f"Erreur get_server_members: {str(e)}")
         return jsonify({'error': f'Erreur: {str(e)}'}), 500
@@ -823,17 +1417,15 @@ def generate_invite_code():
 
 @app.route('/api/servers/<server_id>/invites', methods=['POST'])
 @jwt_required()
+@rate_limited_route('rest_write')
 def create_invite(server_id):
     """Crée un code d'invitation pour le serveur"""
     user_id = get_jwt_identity()
-    server = Server.query.get(server_id)
     
-    if not server:
-        return jsonify({'error': 'Serveur non trouvé'}), 404
-    
-    # Verifier que c'est le proprio ou un mod
-    if server.owner_id != user_id:
-        return jsonify({'error': 'Vous ne pouvez pas creer d\'invitations'}), 403
+    # Proprio ou rôle avec gestion des membres
+    denied = permission_denied(user_id, server_id, MANAGE_MEMBERS, 'Vous ne pouvez pas creer d\'invitations')
+    if denied:
+        return denied
     
     from models import ServerInvite
     
@@ -859,7 +1451,7 @@ def create_invite(server_id):
 def get_invites(server_id):
     """Liste les codes d'invitation du serveur"""
     user_id = get_jwt_identity()
-    server = Server.query.get(server_id)
+    server = Server.get_live(server_id)
     
     if not server:
         return jsonify({'error': 'Serveur non trouvé'}), 404
@@ -877,6 +1469,7 @@ def get_invites(server_id):
 
 @app.route('/api/servers/invite/<code>', methods=['POST'])
 @jwt_required()
+@rate_limited_route('rest_write')
 def use_invite(code):
     """Rejoint un serveur via code d'invitation"""
     user_id = get_jwt_identity()
@@ -895,6 +1488,8 @@ def use_invite(code):
         return jsonify({'error': 'Cette invitation a expiree'}), 410
     
     server = invite.server
+    if server.deleted_at:
+        return jsonify({'error': 'Serveur non trouvé'}), 404
     
     # Verifier que l'utilisateur n'est pas déjà membre
     existing_member = ServerMember.query.filter_by(
@@ -912,10 +1507,14 @@ def use_invite(code):
     # Increment le compteur d'utilisations
     invite.uses += 1
     db.session.commit()
+    server_snapshots.invalidate(server.id)
+    server_permissions.invalidate_member(user_id, server.id)
+    presence_index.add_member(server.id, user_id)
+    member_lists.upsert_member(server.id, member_item(member))
     
     return jsonify({
         'message': f'Vous avez rejoint {server.name}',
-        'server': server.to_dict()
+        'server': server.to_dict(presence_store.status)
     }), 200
 
 
@@ -932,6 +1531,8 @@ def delete_invite(invite_id):
         return jsonify({'error': 'Invitation non trouvee'}), 404
     
     server = invite.server
+    if server.deleted_at:
+        return jsonify({'error': 'Invitation non trouvee'}), 404
     
     # Verifier que c'est le proprio du serveur
     if server.owner_id != user_id:
@@ -950,39 +1551,206 @@ def delete_invite(invite_id):
 @jwt_required()
 def get_voice_members(channel_id):
     """Récupère les membres actuels dans un canal vocal"""
-    members = voice_channel_members.get(channel_id, [])
-    
-    # Récupérer les infos des utilisateurs
-    result = []
-    for user_id in members:
-        user = User.query.get(user_id)
-        if user:
-            result.append({
-                'user_id': user_id,
-                'name': user.username,
-                'avatar': user.avatar,
-                'color': user.color
-            })
-    
-    return jsonify(result), 200
+    # Profils gardés par l'état vocal : aucune requête par occupant
+    return jsonify(voice_state.members(channel_id)), 200
+
+@app.route('/api/servers/<server_id>/voice_members', methods=['GET'])
+@jwt_required()
+def get_server_voice_members(server_id):
+    """Occupants de tous les canaux vocaux du serveur : {channel_id: [membres]}"""
+    if server_permissions.permissions(get_jwt_identity(), server_id) is None:
+        return jsonify({'error': 'Serveur non trouvé'}), 404
+    return jsonify(voice_state.server_snapshot(server_id)), 200
 
 # ═══════════════════════════════════════════════════
 # MESSAGES - ROUTES (historique)
 # ═══════════════════════════════════════════════════
 
+MESSAGES_PAGE_DEFAULT = 50
+MESSAGES_PAGE_MAX = 100
+
+def _keyset_after(query, pivot, inclusive=False):
+    """Messages strictement plus récents que le pivot (created_at, id)"""
+    newer = (Message.created_at > pivot.created_at) | (
+        (Message.created_at == pivot.created_at) &
+        ((Message.id >= pivot.id) if inclusive else (Message.id > pivot.id))
+    )
+    return query.filter(newer).order_by(Message.created_at.asc(), Message.id.asc())
+
+def _keyset_before(query, pivot, inclusive=False):
+    """Messages strictement plus anciens que le pivot (created_at, id)"""
+    older = (Message.created_at < pivot.created_at) | (
+        (Message.created_at == pivot.created_at) &
+        ((Message.id <= pivot.id) if inclusive else (Message.id < pivot.id))
+    )
+    return query.filter(older).order_by(Message.created_at.desc(), Message.id.desc())
+
+def paginate_channel_messages(channel_id, before=None, after=None, around=None, limit=MESSAGES_PAGE_DEFAULT, options=()):
+    """Pagination keyset de l'historique d'un canal.
+
+    Retourne (messages triés du plus ancien au plus récent, has_more_before, has_more_after)
+    ou None si le message curseur n'existe pas dans ce canal.
+    Chaque requête lit au plus limit + 1 lignes via l'index (channel_id, created_at, id).
+    """
+    base = Message.query.filter(Message.channel_id == channel_id).options(*options)
+    cursor_id = around or before or after
+    pivot = None
+    if cursor_id:
+        pivot = base.filter(Message.id == cursor_id).first()
+        if not pivot:
+            return None
+
+    if around:
+        half = limit // 2
+        older = _keyset_before(base, pivot, inclusive=True).limit(limit - half + 1).all()
+        newer = _keyset_after(base, pivot).limit(half + 1).all()
+        has_before = len(older) > limit - half
+        has_after = len(newer) > half
+        rows = list(reversed(older[:limit - half])) + newer[:half]
+        return rows, has_before, has_after
+
+    if after:
+        rows = _keyset_after(base, pivot).limit(limit + 1).all()
+        has_after = len(rows) > limit
+        return rows[:limit], True, has_after
+
+    if before:
+        rows = _keyset_before(base, pivot).limit(limit + 1).all()
+    else:
+        rows = base.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_before = len(rows) > limit
+    return list(reversed(rows[:limit])), has_before, bool(before)
+
+def _cached_page_payload(payload, has_before):
+    messages = payload['messages']
+    payload['prev_cursor'] = messages[0]['id'] if messages and has_before else None
+    payload['next_cursor'] = None
+    return payload
+
 @app.route('/api/channels/<channel_id>/messages', methods=['GET'])
 @jwt_required()
 def get_messages(channel_id):
-    """Récupère l'historique des messages"""
-    channel = Channel.query.get(channel_id)
+    """Récupère une page de l'historique des messages.
+
+    Paramètres : before / after / around (id de message, exclusifs) et limit.
+    Sans curseur, renvoie la page la plus récente.
+    format=compact : auteurs dédupliqués dans une table 'users' (voir compact_history).
+    La page la plus récente est servie par message_cache, sans requête en base.
+    """
+    before = request.args.get('before')
+    after = request.args.get('after')
+    around = request.args.get('around')
+    if sum(1 for c in (before, after, around) if c) > 1:
+        return jsonify({'error': 'Un seul curseur parmi before, after, around'}), 400
+    
+    try:
+        limit = int(request.args.get('limit', MESSAGES_PAGE_DEFAULT))
+    except ValueError:
+        return jsonify({'error': 'limit invalide'}), 400
+    limit = max(1, min(limit, MESSAGES_PAGE_MAX))
+    compact = request.args.get('format') == 'compact'
+    newest = not (before or after or around)
+    
+    if newest:
+        cached = message_cache.newest_page(channel_id, limit, compact)
+        if cached:
+            return jsonify(_cached_page_payload(*cached)), 200
+    
+    def load():
+        """Page lue en base (dans le pool) : (payload, None) ou (None, erreur 404)"""
+        if not Channel.get_live(channel_id):
+            return None, 'Canal non trouvé'
+        
+        # Auteurs chargés en une requête IN (pas de N+1) ; nécessaire au remplissage du cache
+        options = () if compact and not newest else (selectinload(Message.author),)
+        page = paginate_channel_messages(channel_id, before=before, after=after, around=around,
+                                         limit=limit, options=options)
+        if page is None:
+            return None, 'Message curseur non trouvé'
+        messages, has_before, has_after = page
+        if newest:
+            message_cache.fill(channel_id, messages, complete=not has_before)
+            # Relu depuis le cache : inclut les messages envoyés pas encore en base
+            cached = message_cache.newest_page(channel_id, limit, compact, record=False)
+            if cached:
+                return _cached_page_payload(*cached), None
+        
+        payload = compact_history(messages, status_of=presence_store.status) if compact else {'messages': [msg.to_dict() for msg in messages]}
+        # Curseurs : page précédente (plus ancienne) et suivante (plus récente)
+        payload['prev_cursor'] = messages[0].id if messages and has_before else None
+        payload['next_cursor'] = messages[-1].id if messages and has_after else None
+        return payload, None
+    
+    payload, error = run_db(load)
+    if error:
+        return jsonify({'error': error}), 404
+    return jsonify(payload), 200
+
+# ═══════════════════════════════════════════════════
+# RECHERCHE - ROUTES
+# ═══════════════════════════════════════════════════
+
+SEARCH_PAGE_DEFAULT = 25
+SEARCH_PAGE_MAX = 100
+
+@app.route('/api/search', methods=['GET'])
+@jwt_required()
+def search_history():
+    """Recherche plein texte, classée par pertinence.
+
+    scope=channels (défaut) : filtres server_id, channel_id, author_id.
+    scope=dms : messages privés de l'utilisateur, filtre friend_id.
+    Communs : q, since / until (ISO 8601), limit, offset.
+    """
+    user_id = get_jwt_identity()
+    query = match_query(request.args.get('q', ''))
+    if not query:
+        return jsonify({'error': 'Recherche vide'}), 400
     
-    if not channel:
-        return jsonify({'error': 'Canal non trouvé'}), 404
+    scope = request.args.get('scope', 'channels')
+    if scope not in ('channels', 'dms'):
+        return jsonify({'error': 'scope invalide'}), 400
     
-    messages = Message.query.filter_by(channel_id=channel_id)\
-        .order_by(Message.created_at.asc()).all()
+    try:
+        limit = max(1, min(int(request.args.get('limit', SEARCH_PAGE_DEFAULT)), SEARCH_PAGE_MAX))
+        offset = max(0, int(request.args.get('offset', 0)))
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    
+    if scope == 'dms':
+        author_key = 'sender_id'
+        filters = {'friend_id': request.args.get('friend_id')}
+        search = search_direct_messages
+    else:
+        author_key = 'author_id'
+        filters = {key: request.args.get(key) for key in ('server_id', 'channel_id', 'author_id')}
+        search = search_messages
+    
+    def load():
+        """Recherche, auteurs et état de l'index, dans le pool (sa propre session)"""
+        rows = search(db.session, query, user_id, since=since, until=until,
+                      limit=limit, offset=offset, **filters)
+        results = []
+        for row in rows[:limit]:
+            result = dict(row)
+            result['created_at'] = datetime.fromisoformat(result['created_at']).isoformat()
+            results.append(result)
+        author_ids = {r[author_key] for r in results}
+        users = User.query.filter(User.id.in_(author_ids)).all() if author_ids else []
+        return {
+            'results': results,
+            'users': {u.id: u.to_public_dict(presence_store.status) for u in users},
+            'next_offset': offset + limit if len(rows) > limit else None,
+            # False tant que l'historique antérieur à l'index n'est pas indexé
+            'index_complete': index_complete(db.session)
+        }
     
-    return jsonify([msg.to_dict() for msg in messages]), 200
+    try:
+        return jsonify(run_db(load)), 200
+    except OperationalError:
+        return jsonify({'error': 'Recherche invalide'}), 400
 
 # ═══════════════════════════════════════════════════
 # AMIS - ROUTES
@@ -990,6 +1758,7 @@ def get_messages(channel_id):
 
 @app.route('/api/friends/request', methods=['POST'])
 @jwt_required()
+@rate_limited_route('rest_write')
 def send_friend_request():
     """Envoie une demande d'ami par username#tag"""
     user_id = get_jwt_identity()
@@ -1053,6 +1822,7 @@ def accept_friend_request(request_id):
         return jsonify({'error': 'Demande introuvable'}), 404
     fr.status = 'accepted'
     db.session.commit()
+    presence_index.add_friendship(fr.sender_id, fr.receiver_id)
     # Notifier l'envoyeur
     socketio.emit('friend_accepted', fr.to_dict(), room=f'user_{fr.sender_id}')
     return jsonify(fr.to_dict()), 200
@@ -1094,51 +1864,241 @@ def get_friends():
 @app.route('/api/dm/<friend_id>', methods=['GET'])
 @jwt_required()
 def get_dm_history(friend_id):
-    """Récupère l'historique des messages privés avec un ami"""
+    """Récupère l'historique des messages privés avec un ami (format=compact possible)"""
     user_id = get_jwt_identity()
-    messages = DirectMessage.query.filter(
-        ((DirectMessage.sender_id == user_id) & (DirectMessage.receiver_id == friend_id)) |
-        ((DirectMessage.sender_id == friend_id) & (DirectMessage.receiver_id == user_id))
-    ).order_by(DirectMessage.created_at.asc()).all()
-    return jsonify([m.to_dict() for m in messages]), 200
+    compact = request.args.get('format') == 'compact'
+    
+    def load():
+        query = DirectMessage.query.filter(
+            ((DirectMessage.sender_id == user_id) & (DirectMessage.receiver_id == friend_id)) |
+            ((DirectMessage.sender_id == friend_id) & (DirectMessage.receiver_id == user_id))
+        ).order_by(DirectMessage.created_at.asc())
+        if compact:
+            return compact_history(query.all(), author_key='sender_id', status_of=presence_store.status)
+        messages = query.options(selectinload(DirectMessage.sender)).all()
+        return [m.to_dict() for m in messages]
+    
+    return jsonify(run_db(load)), 200
 
 
 # ═══════════════════════════════════════════════════
 # WEBSOCKET - CHAT TEMPS RÉEL
 # ═══════════════════════════════════════════════════
 
+PAYLOAD_FORMATS = ('full', 'compact', 'packed')
+# Champs du format packed, par événement
+PACKED_FIELDS = {'new_message': message_fields, 'new_dm': dm_fields}
+
+def socket_profile(user):
+    """Profil gardé pour chaque socket de user (lu par les handlers sans requête)"""
+    return {
+        'id': user.id,
+        'username': user.username,
+        'avatar': variant_url(user.avatar, LIST_SIZE),
+        'color': user.color,
+        'full': user.to_dict(),
+        'public': user.to_public_dict()
+    }
+
+def voice_profile(profile):
+    """Profil affiché d'un occupant vocal (depuis le profil du socket)"""
+    return {
+        'user_id': profile['id'],
+        'name': profile['username'],
+        'avatar': profile['avatar'],
+        'color': profile['color'] or '#94a3b8'
+    }
+
+def emit_voice_left(user_id, channel_id, server_id):
+    """Départ d'un canal vocal : prévient le canal et met à jour l'occupation du serveur"""
+    event_batcher.emit('voice_user_left', {
+        'user_id': user_id,
+        'channel_id': channel_id
+    }, f'voice_{channel_id}')
+    emit_voice_occupancy(server_id, channel_id)
+
+def emit_voice_occupancy(server_id, channel_id):
+    """Occupants à jour d'un canal vocal, pour la liste des canaux du serveur"""
+    members = voice_state.members(channel_id)
+    signaling_metrics.mesh(channel_id, len(members))
+    event_batcher.emit('voice_occupancy_changed', {
+        'server_id': server_id,
+        'channel_id': channel_id,
+        'members': members
+    }, f'server_{server_id}')
+
+def authenticate_socket(token):
+    """Profil de l'utilisateur du JWT ; None si le jeton est absent, invalide ou expiré"""
+    if not token:
+        return None
+    try:
+        user_id = decode_token(token)['sub']
+    except (PyJWTError, JWTExtendedException):
+        return None
+    def load():
+        user = User.query.get(user_id)
+        return socket_profile(user) if user else None
+    return run_db(load)
+
+def current_profile():
+    """Profil de l'utilisateur authentifié de ce socket"""
+    return socket_sessions.profile(request.sid)
+
+def load_member_role(user_id, server_id):
+    def load():
+        member = ServerMember.query.filter_by(user_id=user_id, server_id=server_id).first()
+        return member.role_id if member else 'Membre'
+    return run_db(load)
+
+def load_channel_server(channel_id):
+    """Serveur d'un canal vivant, None si le canal ou son serveur n'existe plus"""
+    channel = Channel.get_live(channel_id)
+    return channel.server_id if channel else None
+
+def payload_format():
+    """Format des payloads de messages négocié par ce socket à la connexion"""
+    return session.get('payload_format', 'full')
+
+def enter_room(room):
+    """join_room, indexé dans le registre des connexions"""
+    event_batcher.flush_room(room)
+    join_room(room)
+    socket_sessions.join(request.sid, room)
+
+def exit_room(room):
+    leave_room(room)
+    socket_sessions.leave(request.sid, room)
+
+def join_message_room(room):
+    """Rejoint une room ainsi que sa variante par format de payload"""
+    enter_room(room)
+    enter_room(f'{room}:{payload_format()}')
+
+def leave_message_room(room):
+    exit_room(room)
+    exit_room(f'{room}:{payload_format()}')
+
+def rate_limited_event(event):
+    """Limite un handler Socket.IO par utilisateur (seau de l'événement + seau 'user').
+
+    Refusé : le handler n'est pas appelé, l'acquittement vaut {error, retry_after}
+    et le socket reçoit 'rate_limited' une fois par série de refus.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args):
+            throttled = rate_limiter.check(current_profile()['id'], event, 'user')
+            if throttled:
+                retry_after = round(throttled.retry_after, 2)
+                if throttled.first:
+                    emit('rate_limited', {'event': event, 'retry_after': retry_after})
+                return {'error': 'rate_limited', 'retry_after': retry_after}
+            return handler(*args)
+        return wrapper
+    return decorator
+
+def emit_message_event(event, message, author, room):
+    """Diffuse un message dans chaque format aux sockets qui l'ont négocié.
+
+    Le format compact porte l'id de l'auteur et une table 'users' d'une entrée ;
+    le format packed est binaire (MessagePack, voir wire.py), encodé sur
+    chaque worker pour ses propres sockets.
+    """
+    event_batcher.emit(event, message.to_dict(author), f'{room}:full')
+    event_batcher.emit(event, {
+        'message': message.to_compact_dict(),
+        'users': {author.id: dict(author.to_public_dict(), status=presence_store.status(author.id))}
+    }, f'{room}:compact')
+    packed_fanout.publish(event, PACKED_FIELDS[event](message, author), [room])
+
 @socketio.on('connect')
 def handle_connect(auth=None):
-    """Connexion WebSocket"""
+    """Connexion WebSocket : auth={'token': JWT, 'format': 'full' | 'compact' | 'packed'}.
+
+    Le jeton est vérifié ici, une seule fois : sans jeton valide, la connexion
+    est refusée ; les handlers lisent ensuite l'identité dans socket_sessions.
+    """
+    auth = auth or {}
+    profile = authenticate_socket(auth.get('token'))
+    if profile is None:
+        socket_sessions.refuse()
+        raise ConnectionRefusedError('Authentification requise')
+    socket_sessions.bind(request.sid, profile)
+    fmt = auth.get('format', 'full')
+    session['payload_format'] = fmt if fmt in PAYLOAD_FORMATS else 'full'
     print(f"[CONNECT] Client connecte: {request.sid}")
     emit('connect_response', {'message': 'Connecte au serveur'})
 
 @socketio.on('join_user_room')
-def handle_join_user_room(data):
+def handle_join_user_room(data=None):
     """Rejoint la room personnelle pour recevoir les notifs (demandes d'ami, etc.)"""
-    user_id = data.get('user_id')
-    if user_id:
-        room_name = f'user_{user_id}'
-        join_room(room_name)
-        print(f'[OK] Utilisateur {user_id} rejoint room: {room_name}')
+    user_id = current_profile()['id']
+    room_name = f'user_{user_id}'
+    join_message_room(room_name)
+    presence_store.connect(request.sid, user_id)
+    print(f'[OK] Utilisateur {user_id} rejoint room: {room_name}')
 
 @socketio.on('join_server')
 def handle_join_server(data):
     """Rejoint la room d'un serveur pour recevoir les mises à jour (icône, nom, etc.)"""
     server_id = data.get('server_id')
     if server_id:
-        join_room(f'server_{server_id}')
+        enter_room(f'server_{server_id}')
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Deconnexion WebSocket"""
+    member_lists.unsubscribe(request.sid)
+    presence_store.disconnect(request.sid)
+    socket_sessions.unbind(request.sid)
+    ref_table.forget(request.sid)
+    # Retiré du canal vocal qu'il occupait (plus de signalisation vers un socket fermé)
+    left = voice_state.disconnect(request.sid)
+    if left:
+        emit_voice_left(*left)
     print(f"[DISCONNECT] Client deconnecte: {request.sid}")
 
+@socketio.on('heartbeat')
+def on_heartbeat(data=None):
+    """Heartbeat de présence ({active} : activité depuis le précédent).
+
+    Acquittement {ok: False} si la session a expiré : le client renvoie join_user_room.
+    """
+    return {'ok': presence_store.heartbeat(request.sid, bool((data or {}).get('active', True)))}
+
+@socketio.on('resolve_refs')
+def on_resolve_refs(refs):
+    """Format packed : ids des refs inconnues du client ({ref: id}, en
+    acquittement), parmi celles envoyées à ce socket"""
+    return ref_table.resolve(request.sid, refs if isinstance(refs, list) else [])
+
+@socketio.on('member_list_subscribe')
+def on_member_list_subscribe(data):
+    """S'abonne aux plages visibles de la liste des membres d'un serveur.
+
+    data : {server_id, ranges: [[start, end], ...]}. Répond par member_list_sync,
+    puis envoie des member_list_update (diff des plages) à chaque changement.
+    """
+    server_id = data.get('server_id')
+    try:
+        payload = member_lists.subscribe(request.sid, server_id, data.get('ranges'))
+    except (TypeError, ValueError, IndexError):
+        emit('member_list_error', {'server_id': server_id, 'error': 'Plages invalides'})
+        return
+    if payload is None:
+        emit('member_list_error', {'server_id': server_id, 'error': 'Serveur non trouvé'})
+        return
+    emit('member_list_sync', payload)
+
+@socketio.on('member_list_unsubscribe')
+def on_member_list_unsubscribe(data=None):
+    member_lists.unsubscribe(request.sid)
+
 @socketio.on('join_channel')
 def on_join_channel(data):
     """Rejoins un canal"""
     channel_id = data['channel_id']
-    join_room(f'channel_{channel_id}')
+    join_message_room(f'channel_{channel_id}')
     
     emit('status', {
         'message': 'Utilisateur connecte au canal'
@@ -1150,94 +2110,107 @@ def on_join_channel(data):
 def on_leave_channel(data):
     """Quitte un canal"""
     channel_id = data['channel_id']
-    leave_room(f'channel_{channel_id}')
+    leave_message_room(f'channel_{channel_id}')
     
     emit('status', {
         'message': 'Utilisateur a quitté le canal'
     }, room=f'channel_{channel_id}')
 
 @socketio.on('send_message')
+@rate_limited_event('send_message')
 def on_send_message(data):
     """Envoie un message temps réel"""
     channel_id = data['channel_id']
     content = data['content']
-    user_id = data.get('user_id')
+    user = socket_sessions.author(request.sid)
     
-    if not user_id or not content or not channel_id:
+    if not user or not content or not channel_id:
         return
     
-    user = User.query.get(user_id)
-    channel = Channel.query.get(channel_id)
+    user_id = user.id
+    server_id = run_db(load_channel_server, channel_id)
     
-    if not user or not channel:
+    if not server_id:
         return
     
-    # Sauvegarde en DB
-    message = Message(
-        content=content,
-        author_id=user_id,
-        channel_id=channel_id
-    )
+    if not server_permissions.has(user_id, server_id, SEND_MESSAGES):
+        emit('message_error', {'channel_id': channel_id, 'error': 'Vous ne pouvez pas envoyer de messages ici'})
+        return
     
-    db.session.add(message)
-    db.session.commit()
+    # Id et date générés ici : le message est diffusé avant d'être en base
+    row = {
+        'id': str(uuid.uuid4()),
+        'content': content,
+        'author_id': user_id,
+        'channel_id': channel_id,
+        'created_at': datetime.utcnow()
+    }
+    try:
+        write_behind.submit('message', row)
+    except WriteBehindFull:
+        emit('message_error', {'channel_id': channel_id, 'error': 'Serveur surchargé, réessayez'})
+        return
+    message = Message(**row)
+    message_cache.append(channel_id, message, user)
+    typing_tracker.stop(channel_id, user_id)
     
     # Broadcast à tous les clients du canal
-    emit('new_message', message.to_dict(), room=f'channel_{channel_id}')
+    emit_message_event('new_message', message, user, f'channel_{channel_id}')
 
 @socketio.on('send_dm')
+@rate_limited_event('send_dm')
 def on_send_dm(data):
     """Envoie un message privé"""
-    sender_id = data.get('sender_id')
+    sender = socket_sessions.author(request.sid)
     receiver_id = data.get('receiver_id')
     content = data.get('content', '').strip()
-    print(f'[DM] on_send_dm recu: sender={sender_id}, receiver={receiver_id}, content={content[:50]}...')
-    if not sender_id or not receiver_id or not content:
+    if not sender or not receiver_id or not content:
         print(f'[ERROR] on_send_dm: donnees manquantes')
         return
-    sender = User.query.get(sender_id)
-    receiver = User.query.get(receiver_id)
-    if not sender or not receiver:
+    sender_id = sender.id
+    print(f'[DM] on_send_dm recu: sender={sender_id}, receiver={receiver_id}, content={content[:50]}...')
+    if not run_db(lambda: User.query.get(receiver_id) is not None):
         print(f'[ERROR] on_send_dm: utilisateur non trouve')
         return
-    msg = DirectMessage(sender_id=sender_id, receiver_id=receiver_id, content=content)
-    db.session.add(msg)
-    db.session.commit()
-    print(f'[OK] DM sauvegarde: id={msg.id}')
+    row = {
+        'id': str(uuid.uuid4()),
+        'sender_id': sender_id,
+        'receiver_id': receiver_id,
+        'content': content,
+        'created_at': datetime.utcnow()
+    }
+    try:
+        write_behind.submit('dm', row)
+    except WriteBehindFull:
+        emit('message_error', {'receiver_id': receiver_id, 'error': 'Serveur surchargé, réessayez'})
+        return
+    msg = DirectMessage(**row)
+    print(f'[OK] DM en file d\'ecriture: id={msg.id}')
     # Envoyer au destinataire (s'il est connecte)
     print(f'[EMIT] Emission new_dm a room: user_{receiver_id}')
-    socketio.emit('new_dm', msg.to_dict(), room=f'user_{receiver_id}')
+    emit_message_event('new_dm', msg, sender, f'user_{receiver_id}')
     # Confirmer a l'envoyeur
     print(f'[EMIT] Emission new_dm a room: user_{sender_id}')
-    socketio.emit('new_dm', msg.to_dict(), room=f'user_{sender_id}')
+    emit_message_event('new_dm', msg, sender, f'user_{sender_id}')
 
 
 @socketio.on('typing')
+@rate_limited_event('typing')
 def on_typing(data):
-    """Notifie que quelqu'un tape"""
-    channel_id = data['channel_id']
-    username = data.get('username', 'Anonyme')
-    
-    emit('user_typing', {
-        'username': username
-    }, room=f'channel_{channel_id}', skip_sid=request.sid)
+    """Notifie que quelqu'un tape.
+
+    Agrégé côté serveur : le canal reçoit au plus un typing_update
+    {channel_id, users} par intervalle, avec la liste de ceux qui écrivent.
+    """
+    profile = current_profile()
+    typing_tracker.typing(data['channel_id'], profile['id'], profile['username'])
 
 @socketio.on('user_status_change')
 def on_status_change(data):
     """Change le statut de l'utilisateur"""
-    user_id = data['user_id']
-    status = data['status']
-    
-    user = User.query.get(user_id)
-    if user:
-        user.status = status
-        db.session.commit()
-        
-        # Broadcast à tous les clients
-        socketio.emit('user_status_changed', {
-            'user_id': user_id,
-            'status': status
-        }, broadcast=True)
+    # En mémoire ; le changement de statut effectif est diffusé (regroupé) aux
+    # membres des mêmes serveurs et aux amis, puis écrit en base par lots
+    presence_store.set_status(current_profile()['id'], data['status'])
 
 # ═══════════════════════════════════════════════
 # WEBRTC VOICE
@@ -1245,214 +2218,285 @@ def on_status_change(data):
 @socketio.on('voice_channel_join')
 def on_voice_join(data):
     """Utilisateur rejoint un canal vocal"""
-    user_id = data.get('user_id')
+    profile = current_profile()
+    user_id = profile['id']
     channel_id = data.get('channel_id')
-    server_id = data.get('server_id')
-    room = f"voice_{channel_id}"
-    join_room(room)
+    server_id = run_db(load_channel_server, channel_id)
+    if not server_id:
+        return
     
-    # Enregistrer le SID pour le routing WebRTC
-    user_sessions[user_id] = request.sid
-    print(f"[VOICE] Session enregistree: {user_id} -> {request.sid}")
+    # Maillage complet : chaque pair négocie avec tous les autres, le coût de
+    # signalisation croît en N² ; au-delà de VOICE_MAX_PEERS, entrée refusée
+    # (place réservée atomiquement dans le magasin partagé)
+    max_peers = app.config['VOICE_MAX_PEERS']
+    if not voice_state.admit(user_id, channel_id, max_peers):
+        signaling_metrics.record(channel_id, 'rejected')
+        emit('voice_join_rejected', {
+            'channel_id': channel_id,
+            'max_peers': max_peers,
+            'error': f'Canal vocal complet ({max_peers} participants maximum)'
+        })
+        return
     
-    # Tracker: ajouter à la liste des membres du canal vocal
-    if channel_id not in voice_channel_members:
-        voice_channel_members[channel_id] = []
-    if user_id not in voice_channel_members[channel_id]:
-        voice_channel_members[channel_id].append(user_id)
+    room = f"voice_{channel_id}"
+    enter_room(room)
     
-    print(f"[VOICE] {user_id} rejoint canal {channel_id}. Membres: {voice_channel_members[channel_id]}")
+    # Ce socket devient le socket vocal de l'utilisateur (routage WebRTC) ;
+    # s'il était dans un autre canal vocal, il le quitte
+    member = voice_profile(profile)
+    previous = voice_state.join(request.sid, user_id, channel_id, server_id, member)
+    if previous:
+        exit_room(f'voice_{previous[0]}')
+        emit_voice_left(user_id, *previous)
+    print(f"[VOICE] {user_id} rejoint canal {channel_id} (sid={request.sid})")
     
-    # Récupérer les infos de l'utilisateur
-    user = User.query.get(user_id)
-    server_member = ServerMember.query.filter_by(
-        user_id=user_id,
-        server_id=server_id
-    ).first()
-    
-    user_info = {
-        'user_id': user_id,
-        'channel_id': channel_id,
-        'name': user.username if user else 'Utilisateur',
-        'avatar': user.avatar if user else None,
-        'color': user.color if user else '#94a3b8',
-        'role': server_member.role_id if server_member else 'Membre'
-    }
+    # Profil en session ; rôle chargé une fois par socket et par serveur
+    user_info = dict(member, channel_id=channel_id,
+                     role=socket_sessions.member_role(request.sid, server_id, load_member_role))
     
     # Notifier les AUTRES utilisateurs du canal (pas le sender)
-    socketio.emit('voice_user_joined', user_info, room=room, skip_sid=True)
+    event_batcher.emit('voice_user_joined', user_info, room, skip_sid=request.sid)
     
     # Notifier le sender lui-même qu'il a rejoint (avec confirmation)
-    socketio.emit('voice_user_joined_self', user_info, to=request.sid)
+    event_batcher.emit('voice_user_joined_self', user_info, request.sid)
+    emit_voice_occupancy(server_id, channel_id)
 
 @socketio.on('voice_channel_leave')
 def on_voice_leave(data):
     """Utilisateur quitte un canal vocal"""
-    user_id = data.get('user_id')
+    user_id = current_profile()['id']
     channel_id = data.get('channel_id')
     room = f"voice_{channel_id}"
-    leave_room(room)
+    exit_room(room)
     
-    # Nettoyer le SID
-    if user_id in user_sessions:
-        del user_sessions[user_id]
-        print(f"[VOICE] Session supprimée: {user_id}")
-    
-    # Tracker: retirer de la liste des membres
-    if channel_id in voice_channel_members:
-        if user_id in voice_channel_members[channel_id]:
-            voice_channel_members[channel_id].remove(user_id)
-        if not voice_channel_members[channel_id]:
-            del voice_channel_members[channel_id]
+    # Sans effet si un autre socket de l'utilisateur a rejoint le vocal depuis
+    left = voice_state.leave(request.sid, user_id)
+    if not left:
+        return
     
-    print(f"[VOICE] {user_id} a quitté canal {channel_id}")
+    print(f"[VOICE] {user_id} a quitté canal {left[0]}")
     
     # Notifier les autres utilisateurs du canal
-    socketio.emit('voice_user_left', {
-        'user_id': user_id,
-        'channel_id': channel_id
-    }, room=room)
+    emit_voice_left(user_id, *left)
 
 @socketio.on('webrtc_offer')
 def on_webrtc_offer(data):
     """Transmettre une offre WebRTC"""
     target_user_id = data.get('target_user_id')
-    sender_user_id = data.get('sender_user_id')
+    sender_user_id = current_profile()['id']
     channel_id = data.get('channel_id')
     offer = data.get('offer')
     
     # Obtenir le SID du destinataire
-    target_sid = user_sessions.get(target_user_id)
+    target_sid = voice_state.target_sid(target_user_id)
     if not target_sid:
         print(f"[WEBRTC] WARNING Pas de session pour {target_user_id}")
         return
     
     print(f"[WEBRTC] Envoi offer: {sender_user_id} -> {target_user_id} (sid={target_sid})")
-    socketio.emit('webrtc_offer', {
+    # Candidats ICE encore en attente pour cette paire : envoyés avant
+    ice_coalescer.flush_pair(sender_user_id, target_sid)
+    signaling_metrics.record(channel_id, 'offer')
+    event_batcher.emit('webrtc_offer', {
         'from': sender_user_id,
         'offer': offer,
         'channel_id': channel_id
-    }, to=target_sid)
+    }, target_sid)
 
 @socketio.on('webrtc_answer')
 def on_webrtc_answer(data):
     """Transmettre une réponse WebRTC"""
     target_user_id = data.get('target_user_id')
-    sender_user_id = data.get('sender_user_id')
+    sender_user_id = current_profile()['id']
     channel_id = data.get('channel_id')
     answer = data.get('answer')
     
     # Obtenir le SID du destinataire
-    target_sid = user_sessions.get(target_user_id)
+    target_sid = voice_state.target_sid(target_user_id)
     if not target_sid:
         print(f"[WEBRTC] WARNING Pas de session pour {target_user_id}")
         return
     
     print(f"[WEBRTC] Envoi answer: {sender_user_id} -> {target_user_id} (sid={target_sid})")
-    socketio.emit('webrtc_answer', {
+    # Candidats ICE encore en attente pour cette paire : envoyés avant
+    ice_coalescer.flush_pair(sender_user_id, target_sid)
+    signaling_metrics.record(channel_id, 'answer')
+    event_batcher.emit('webrtc_answer', {
         'from': sender_user_id,
         'answer': answer,
         'channel_id': channel_id
-    }, to=target_sid)
+    }, target_sid)
 
 @socketio.on('webrtc_ice_candidate')
+@rate_limited_event('webrtc_ice_candidate')
 def on_webrtc_ice(data):
     """Transmettre un candidat ICE"""
     target_user_id = data.get('target_user_id')
-    sender_user_id = data.get('sender_user_id')
+    sender_user_id = current_profile()['id']
     channel_id = data.get('channel_id')
     candidate = data.get('candidate')
     
     # Obtenir le SID du destinataire
-    target_sid = user_sessions.get(target_user_id)
+    target_sid = voice_state.target_sid(target_user_id)
     if not target_sid:
         return  # Silencieux pour ICE car il y en a beaucoup
     
-    socketio.emit('webrtc_ice_candidate', {
-        'from': sender_user_id,
-        'candidate': candidate,
-        'channel_id': channel_id
-    }, to=target_sid)
+    # Regroupés par paire : une trame webrtc_ice_candidates pour la rafale
+    signaling_metrics.record(channel_id, 'ice')
+    ice_coalescer.add(sender_user_id, target_sid, channel_id, candidate)
 
 @socketio.on('voice_mute_changed')
 def on_voice_mute_changed(data):
     """Notifier les autres utilisateurs du changement de mute"""
     channel_id = data.get('channel_id')
-    user_id = data.get('user_id')
+    user_id = current_profile()['id']
     muted = data.get('muted')
     room = f"voice_{channel_id}"
     
-    socketio.emit('voice_mute_changed', {
+    event_batcher.emit('voice_mute_changed', {
         'user_id': user_id,
         'channel_id': channel_id,
         'muted': muted
-    }, room=room, skip_sid=True)
+    }, room, skip_sid=request.sid)
 
 @socketio.on('voice_deafen_changed')
 def on_voice_deafen_changed(data):
     """Notifier les autres utilisateurs du changement de deafen"""
     channel_id = data.get('channel_id')
-    user_id = data.get('user_id')
+    user_id = current_profile()['id']
     deafened = data.get('deafened')
     room = f"voice_{channel_id}"
     
-    socketio.emit('voice_deafen_changed', {
+    event_batcher.emit('voice_deafen_changed', {
         'user_id': user_id,
         'channel_id': channel_id,
         'deafened': deafened
-    }, room=room, skip_sid=True)
+    }, room, skip_sid=request.sid)
 
 @socketio.on('voice_streaming_started')
 def on_voice_streaming_started(data):
     """Notifier les autres utilisateurs qu'on partage l'écran"""
     channel_id = data.get('channel_id')
-    user_id = data.get('user_id')
-    name = data.get('name', 'Utilisateur')
+    profile = current_profile()
+    user_id = profile['id']
+    name = profile['username']
     room = f"voice_{channel_id}"
     
     print(f"[VOICE] {name} commence le stream vocal sur {channel_id}")
     
-    socketio.emit('voice_streaming_started', {
+    event_batcher.emit('voice_streaming_started', {
         'user_id': user_id,
         'channel_id': channel_id,
         'name': name
-    }, room=room, skip_sid=True)
+    }, room, skip_sid=request.sid)
 
 @socketio.on('voice_streaming_stopped')
 def on_voice_streaming_stopped(data):
     """Notifier les autres utilisateurs qu'on arrete le partage d'ecran"""
     channel_id = data.get('channel_id')
-    user_id = data.get('user_id')
-    name = data.get('name', 'Utilisateur')
+    profile = current_profile()
+    user_id = profile['id']
+    name = profile['username']
     room = f"voice_{channel_id}"
     
     print(f"[VOICE] {name} arrete le stream vocal sur {channel_id}")
     
-    socketio.emit('voice_streaming_stopped', {
+    event_batcher.emit('voice_streaming_stopped', {
         'user_id': user_id,
         'channel_id': channel_id,
         'name': name
-    }, room=room, skip_sid=True)
+    }, room, skip_sid=request.sid)
 
 # ═══════════════════════════════════════════════════
 # ROUTES STATIQUES
 # ═══════════════════════════════════════════════════
 
-from flask import send_from_directory, send_file
+from werkzeug.wsgi import wrap_file
+
+def serve_asset(url):
+    """Asset de l'index : 304 si l'ETag correspond, sinon la variante
+    compressée acceptée par le client ; None si l'URL n'est pas indexée"""
+    if app.debug:
+        static_assets.rebuild_if_changed()
+    asset = static_assets.get(url)
+    if asset is None:
+        return None
+    status, encoding, body = static_assets.select(asset, request.headers.get('Accept-Encoding'),
+                                                  request.headers.get('If-None-Match'))
+    response = app.response_class(body, status=status, content_type=asset.content_type)
+    response.headers['ETag'] = f'"{asset.etags[encoding]}"'
+    response.headers['Cache-Control'] = asset.cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    if status == 200 and encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.route('/avatars/<filename>')
+@app.route('/server_icons/<filename>')
+@app.route(f'/{MEDIA_DIR}/<filename>')
+def serve_media(filename):
+    """Avatar ou icône : métadonnées en mémoire, 304 (ETag / Last-Modified),
+    Range (une plage), corps complet via wsgi.file_wrapper (sendfile si le
+    serveur WSGI le fournit) ou délégué à nginx (MEDIA_ACCEL_REDIRECT)"""
+    directory = request.path.split('/')[1]
+    media = media_index.lookup(directory, filename)
+    cache_control = MEDIA_CACHE_CONTROL
+    if media is None and directory == MEDIA_DIR:
+        # Miniature pas encore générée : l'original, revalidé à chaque fois
+        original = media_store.original(filename)
+        if original:
+            media = media_index.lookup(directory, original)
+            cache_control = 'no-cache'
+    if media is None:
+        return ('', 404)
+    url = f'/{directory}/{os.path.basename(media.path)}'
+    headers = {
+        'ETag': f'"{media.etag}"',
+        'Last-Modified': media.last_modified,
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes'
+    }
+    if not_modified(media, request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+        media_index.record('not_modified')
+        return app.response_class(status=304, headers=headers)
+    byte_range = parse_range(request.headers.get('Range'), media.size, request.headers.get('If-Range'), media)
+    if byte_range is False:
+        headers['Content-Range'] = f'bytes */{media.size}'
+        return app.response_class(status=416, headers=headers)
+    if byte_range is None and app.config['MEDIA_ACCEL_REDIRECT']:
+        media_index.record('full', media.size)
+        headers['X-Accel-Redirect'] = app.config['MEDIA_ACCEL_REDIRECT'] + url
+        return app.response_class(headers=headers, content_type=media.content_type)
+    try:
+        f = open(media.path, 'rb')
+    except FileNotFoundError:
+        # Supprimé depuis l'indexation (purge d'un serveur)
+        media_index.discard(url)
+        return ('', 404)
+    if byte_range is None:
+        status, length, body = 200, media.size, wrap_file(request.environ, f)
+        media_index.record('full', length)
+    else:
+        start, end = byte_range
+        status, length, body = 206, end - start + 1, read_range(f, start, end)
+        headers['Content-Range'] = f'bytes {start}-{end}/{media.size}'
+        media_index.record('partial', length)
+    headers['Content-Length'] = str(length)
+    return app.response_class(body, status=status, headers=headers, content_type=media.content_type,
+                              direct_passthrough=True)
 
 @app.route('/')
 def index():
-    """Sert la page HTML principale – on renvoie maintenant la version mise à jour (likoo.html).
-    L'ancien fichier index_source.html est conservé pour référence mais n'est plus utilisé.
-    """
-    return send_from_directory(str(BASE_DIR), 'likoo.html')
+    """Sert la page HTML principale (likoo.html), références vers les assets à empreinte"""
+    return serve_asset('/')
 
-# Fallback for any other file requests (css/js/images) served from root
+# Seuls les assets indexés sont servis depuis la racine (médias : serve_media) ;
+# aucun autre fichier du projet (sources, base, .env) n'est exposé
 @app.route('/<path:filename>')
 def serve_file(filename):
-    path = BASE_DIR / filename
-    if path.exists():
-        return send_file(str(path))
+    response = serve_asset(f'/{filename}')
+    if response is not None:
+        return response
     return ('', 404)
 
 @app.route('/health', methods=['GET'])
@@ -1462,7 +2506,26 @@ def health():
         'status': 'ok',
         'message': 'Serveur Likoo v2 actif',
         'database': 'SQLite',
-        'features': ['WebSocket', 'Authentication', 'Database']
+        'features': ['WebSocket', 'Authentication', 'Database'],
+        'write_behind': dict(write_behind.stats, pending=write_behind.pending()),
+        'message_cache': message_cache.snapshot(),
+        'server_cache': server_snapshots.snapshot(),
+        'permissions': server_permissions.snapshot(),
+        'server_purge': server_purger.snapshot(),
+        'presence': dict(presence_fanout.snapshot(), store=presence_store.snapshot()),
+        'typing': typing_tracker.snapshot(),
+        'blocking_pool': blocking_pool.snapshot(),
+        'sockets': socket_sessions.snapshot(),
+        'voice': voice_state.snapshot(),
+        'static_assets': static_assets.snapshot(),
+        'media': dict(media_index.snapshot(), store=media_store.snapshot()),
+        'signaling': {'ice': ice_coalescer.snapshot(), 'channels': signaling_metrics.snapshot()},
+        'event_batches': event_batcher.snapshot(),
+        'rate_limits': rate_limiter.snapshot(),
+        'slow_consumers': slow_consumers.snapshot(),
+        'packed_refs': dict(ref_table.snapshot(), fanout=packed_fanout.stats),
+        'worker': app.config['WORKER_INDEX'],
+        'cluster': cluster_bus.stats if cluster_bus else None
     }), 200
 
 # ═══════════════════════════════════════════════════
@@ -1492,6 +2555,7 @@ if __name__ == '__main__':
      URL: http://localhost:{port}
      Database: SQLite (likoo.db)
      Features: WebSocket, JWT, Auth
+     Mode: {ASYNC_MODE}
      Debug: {debug}
     =============================================
     """
@@ -0,0 +1,105 @@
+"""
+CACHE DES SERVEURS — Likoo
+Instantanés sérialisés de l'état d'un serveur, versionnés pour les ETag
+"""
+
+import secrets
+import threading
+from collections import OrderedDict
+
+
+class ServerSnapshotCache:
+    """Cache des réponses JSON par (serveur, vue), avec un numéro de version par serveur.
+
+    Toute route qui modifie un serveur appelle invalidate(server_id) : la version
+    augmente et les instantanés du serveur sont supprimés. Un changement qui ne
+    touche que certaines vues (statut de présence : membres) passe par
+    invalidate_views, qui n'augmente que la version de ces vues. L'ETag d'une vue est
+    dérivé de la version, ce qui permet de répondre 304 sans toucher à la base.
+    Le préfixe de démarrage évite qu'un ETag d'avant un redémarrage (versions
+    remises à zéro) soit confondu avec un ETag actuel.
+
+    Les instantanés sont évincés en LRU au-delà de budget_bytes.
+    """
+
+    def __init__(self, budget_bytes=32 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self._boot = secrets.token_hex(4)
+        self._versions = {}  # server_id -> version
+        self._view_versions = {}  # (server_id, vue) -> version propre à la vue
+        self._snapshots = OrderedDict()  # (server_id, view) -> (version, body)
+        self._views = {}  # server_id -> vues en cache
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evictions': 0, 'invalidations': 0,
+                      'view_invalidations': 0}
+
+    def version(self, server_id, view):
+        return self._versions.get(server_id, 0), self._view_versions.get((server_id, view), 0)
+
+    def etag(self, server_id, view, version=None):
+        if version is None:
+            version = self.version(server_id, view)
+        return f'{self._boot}-{server_id}-{view}-{version[0]}.{version[1]}'
+
+    def get(self, server_id, view):
+        """(version, body) si l'instantané est à jour, sinon None"""
+        with self._lock:
+            entry = self._snapshots.get((server_id, view))
+            if entry is None or entry[0] != self.version(server_id, view):
+                self.stats['misses'] += 1
+                return None
+            self._snapshots.move_to_end((server_id, view))
+            self.stats['hits'] += 1
+            return entry
+
+    def put(self, server_id, view, version, body):
+        """Stocke un instantané construit à partir de la version lue avant la requête.
+
+        Ignoré si le serveur a été invalidé entre-temps (instantané déjà périmé).
+        """
+        with self._lock:
+            if version != self.version(server_id, view):
+                return
+            old = self._snapshots.pop((server_id, view), None)
+            if old:
+                self._bytes -= len(old[1])
+            self._snapshots[(server_id, view)] = (version, body)
+            self._views.setdefault(server_id, set()).add(view)
+            self._bytes += len(body)
+            while self._bytes > self.budget_bytes and len(self._snapshots) > 1:
+                (evicted_id, evicted_view), (_, evicted) = self._snapshots.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._views[evicted_id].discard(evicted_view)
+                self.stats['evictions'] += 1
+
+    def record_not_modified(self):
+        with self._lock:
+            self.stats['not_modified'] += 1
+
+    def invalidate(self, *server_ids):
+        with self._lock:
+            for server_id in server_ids:
+                self._versions[server_id] = self._versions.get(server_id, 0) + 1
+                self.stats['invalidations'] += 1
+                for view in self._views.pop(server_id, ()):
+                    self._bytes -= len(self._snapshots.pop((server_id, view))[1])
+
+    def invalidate_views(self, server_ids, views):
+        """Périme seulement les vues données des serveurs (les autres gardent
+        leur instantané et leur ETag)"""
+        with self._lock:
+            for server_id in server_ids:
+                for view in views:
+                    key = (server_id, view)
+                    self._view_versions[key] = self._view_versions.get(key, 0) + 1
+                    entry = self._snapshots.pop(key, None)
+                    if entry:
+                        self._bytes -= len(entry[1])
+                        self._views[server_id].discard(view)
+                self.stats['view_invalidations'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._snapshots), bytes=self._bytes,
+                        budget_bytes=self.budget_bytes)
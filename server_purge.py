@@ -0,0 +1,190 @@
+"""
+PURGE DES SERVEURS — Likoo
+Suppression différée et par lots du contenu d'un serveur supprimé
+"""
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+# Étapes de la purge, dans l'ordre. Chaque lot supprime au plus :n lignes du
+# serveur :sid en une transaction courte ; une étape se termine quand un lot
+# supprime moins de :n lignes. Les membres partent en premier : le serveur
+# disparaît ainsi aussi des requêtes qui passent par l'appartenance.
+STEPS = (
+    ('members', 'server_members', 'server_id = :sid'),
+    ('invites', 'server_invites', 'server_id = :sid'),
+    ('messages', 'messages', 'channel_id IN (SELECT id FROM channels WHERE server_id = :sid)'),
+    ('channels', 'channels', 'server_id = :sid'),
+    ('roles', 'roles', 'server_id = :sid'),
+)
+
+
+class ServerPurger:
+    """Purge en arrière-plan des serveurs marqués supprimés (servers.deleted_at).
+
+    delete_server ne fait que poser le tombstone : le serveur est masqué
+    immédiatement, puis ce thread supprime membres, invitations, messages,
+    canaux, rôles et icône par lots, avec une pause entre deux transactions
+    (SQLite n'a qu'un écrivain). La ligne du serveur est supprimée en dernier :
+    tant qu'elle existe, la purge est reprise au démarrage (resume).
+
+    drain() est appelé avant la suppression des canaux, pour que les messages
+    encore en file d'écriture (write-behind) soient en base et purgés aussi.
+    offload(fn, *args) exécute chaque lot hors de la boucle en mode async.
+    """
+
+    def __init__(self, app, db, icons_dir, batch_size=1000, pause=0.05, drain=None, offload=None):
+        self.app = app
+        self.db = db
+        self.icons_dir = str(icons_dir)
+        self.batch_size = batch_size
+        self.pause = pause
+        self.drain = drain
+        self._offload = offload or (lambda fn, *args: fn(*args))
+        self._queue = queue.Queue()
+        self._progress = {}  # server_id -> état de la purge
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    # ── Cycle de vie ────────────────────────────────
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name='server-purge', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Interrompt la purge entre deux lots ; elle reprendra au prochain démarrage"""
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def resume(self):
+        """Replanifie les purges interrompues (serveurs encore marqués supprimés)"""
+        rows = self.db.session.execute(text(
+            'SELECT id, owner_id FROM servers WHERE deleted_at IS NOT NULL'
+        )).all()
+        for server_id, owner_id in rows:
+            self.schedule(server_id, owner_id)
+        if rows:
+            print(f"[PURGE] Reprise de {len(rows)} purge(s) interrompue(s)")
+
+    # ── API ─────────────────────────────────────────
+
+    def schedule(self, server_id, owner_id):
+        """À appeler après le commit du tombstone"""
+        with self._lock:
+            state = self._progress.get(server_id)
+            if state and state['status'] in ('queued', 'running'):
+                return
+            self._progress[server_id] = {
+                'server_id': server_id,
+                'owner_id': owner_id,
+                'status': 'queued',
+                'step': None,
+                'deleted': {name: 0 for name, _, _ in STEPS},
+                'started_at': None,
+                'finished_at': None
+            }
+        self._queue.put(server_id)
+
+    def progress(self, server_id):
+        with self._lock:
+            state = self._progress.get(server_id)
+            return dict(state, deleted=dict(state['deleted'])) if state else None
+
+    def snapshot(self):
+        with self._lock:
+            by_status = {}
+            for state in self._progress.values():
+                by_status[state['status']] = by_status.get(state['status'], 0) + 1
+            return {'servers': by_status, 'queued': self._queue.qsize()}
+
+    # ── Thread de purge ─────────────────────────────
+
+    def _run(self):
+        while not self._stopping.is_set():
+            server_id = self._queue.get()
+            if server_id is None:
+                continue
+            try:
+                self._purge(server_id)
+            except Exception as e:
+                self._update(server_id, status='failed', error=str(e))
+                print(f"[PURGE] Erreur purge {server_id}: {e}")
+
+    def _update(self, server_id, **fields):
+        with self._lock:
+            self._progress[server_id].update(fields)
+
+    def _purge(self, server_id):
+        self._update(server_id, status='running', started_at=datetime.utcnow().isoformat())
+        for name, table, where in STEPS:
+            if name == 'channels' and self.drain:
+                self.drain()
+                # Messages arrivés en base pendant la purge des messages
+                if not self._delete_all(server_id, 'messages', 'messages', STEPS[2][2]):
+                    return
+            if not self._delete_all(server_id, name, table, where):
+                return
+        self._offload(self._delete_server, server_id)
+        self._update(server_id, status='done', step=None, finished_at=datetime.utcnow().isoformat())
+        print(f"[PURGE] Serveur {server_id} purgé : {self.progress(server_id)['deleted']}")
+
+    def _delete_server(self, server_id):
+        with self.app.app_context():
+            icon = self.db.session.execute(
+                text('SELECT icon_image FROM servers WHERE id = :sid'), {'sid': server_id}
+            ).scalar()
+            self._remove_icon(icon)
+            self.db.session.execute(text('DELETE FROM servers WHERE id = :sid'), {'sid': server_id})
+            self.db.session.commit()
+
+    def _delete_all(self, server_id, name, table, where):
+        """Supprime par lots ; False si l'arrêt est demandé entre deux lots"""
+        self._update(server_id, step=name)
+        statement = text(
+            f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT :n)'
+        )
+        while True:
+            if self._stopping.is_set():
+                return False
+            deleted = self._offload(self._delete_batch, statement, server_id)
+            with self._lock:
+                self._progress[server_id]['deleted'][name] += deleted
+            if deleted < self.batch_size:
+                return True
+            time.sleep(self.pause)
+
+    def _delete_batch(self, statement, server_id):
+        with self.app.app_context():
+            try:
+                deleted = self.db.session.execute(
+                    statement, {'sid': server_id, 'n': self.batch_size}
+                ).rowcount
+                self.db.session.commit()
+                return deleted
+            except Exception:
+                self.db.session.rollback()
+                raise
+
+    def _remove_icon(self, icon_image):
+        """icon_image = '/server_icons/<fichier>' ; une image adressée par
+        contenu (/media/...) peut être partagée : le ramasse-miettes s'en charge"""
+        if not icon_image or not icon_image.startswith('/server_icons/'):
+            return
+        path = os.path.join(self.icons_dir, os.path.basename(icon_image))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,130 @@
+"""
+ÉTAT PARTAGÉ — Likoo
+Petit magasin clé/valeur partagé entre les workers (état vocal, OAuth)
+"""
+
+import threading
+import time
+
+
+class MemoryStore:
+    """Magasin en mémoire d'un seul processus (mode mono-worker, et moteur du hub).
+
+    Clés texte ; valeurs de types simples (transmissibles par le hub, voir
+    backplane.encode). Les ensembles gardent l'ordre d'insertion. Une clé avec ttl
+    disparaît à la première lecture après expiration.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}  # key -> échéance (time.monotonic)
+        self._lock = threading.Lock()
+
+    # ── Valeurs ─────────────────────────────────────
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get(key, default)
+
+    def mget(self, keys):
+        """Valeurs de plusieurs clés en un appel (None si absente)"""
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = value
+            if ttl:
+                self._expires[key] = time.monotonic() + ttl
+            else:
+                self._expires.pop(key, None)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            value = self._get(key, default)
+            self._delete(key)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._delete(key)
+
+    def delete_if(self, key, value):
+        """Supprime key seulement si elle vaut encore value (True si supprimée)"""
+        with self._lock:
+            if self._get(key) != value:
+                return False
+            self._delete(key)
+            return True
+
+    # ── Ensembles ordonnés ──────────────────────────
+
+    def sadd(self, key, member):
+        """True si member a été ajouté (absent auparavant)"""
+        with self._lock:
+            members = self._get(key)
+            if members is None:
+                members = self._data[key] = {}
+            if member in members:
+                return False
+            members[member] = None
+            return True
+
+    def sadd_if_below(self, key, member, limit):
+        """Ajout atomique borné : True si member est présent (ajouté ou déjà
+        membre), False si l'ensemble compte déjà limit membres"""
+        with self._lock:
+            members = self._get(key) or {}
+            if member in members:
+                return True
+            if len(members) >= limit:
+                return False
+            self._data.setdefault(key, members)[member] = None
+            return True
+
+    def srem(self, key, member):
+        """True si member a été retiré ; la clé disparaît avec son dernier membre"""
+        with self._lock:
+            members = self._get(key)
+            if not members or member not in members:
+                return False
+            del members[member]
+            if not members:
+                self._delete(key)
+            return True
+
+    def smembers(self, key):
+        with self._lock:
+            return list(self._get(key) or ())
+
+    # ── Interne (verrou déjà pris) ──────────────────
+
+    def _get(self, key, default=None):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._delete(key)
+            return default
+        return self._data.get(key, default)
+
+    def _delete(self, key):
+        self._data.pop(key, None)
+        self._expires.pop(key, None)
+
+    def execute(self, op, args, kwargs):
+        """Point d'entrée du hub : exécute une opération reçue d'un worker"""
+        if op not in STORE_OPERATIONS:
+            raise ValueError(f'Opération inconnue: {op}')
+        return getattr(self, op)(*args, **kwargs)
+
+
+STORE_OPERATIONS = ('get', 'mget', 'set', 'pop', 'delete', 'delete_if', 'sadd', 'sadd_if_below', 'srem', 'smembers')
+
+
+def create_store(url=''):
+    """'' ou 'memory://' : en mémoire ; 'tcp://hôte:port' : hub local partagé"""
+    if not url or url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith('tcp://'):
+        from backplane import SocketStore
+        return SocketStore(url)
+    raise ValueError(f'SHARED_STORE_URL non supportée: {url}')
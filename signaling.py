@@ -0,0 +1,154 @@
+"""
+SIGNALISATION WEBRTC — Likoo
+Candidats ICE regroupés par (expéditeur, destinataire), métriques par canal vocal
+"""
+
+import threading
+import time
+
+
+class IceCoalescer:
+    """Regroupe les candidats ICE (trickle) d'un expéditeur vers un socket.
+
+    Un navigateur produit ses candidats en rafale juste après l'offre ou la
+    réponse ; dans un canal en maillage complet de N pairs, chacun en envoie
+    à N-1 autres. Les candidats d'une même paire (expéditeur, socket cible)
+    reçus pendant window secondes partent en une seule trame
+    'webrtc_ice_candidates' {from, channel_id, candidates: [...]}, au plus
+    tard au tick suivant ou dès max_candidates.
+
+    flush_pair() envoie les candidats en attente d'une paire avant une
+    nouvelle offre / réponse, pour garder l'ordre de la négociation.
+    window = 0 : chaque candidat part seul, immédiatement.
+    """
+
+    def __init__(self, send, start_task, sleep, window=0.02, max_candidates=32):
+        self._send = send
+        self._start_task = start_task
+        self._sleep = sleep
+        self.window = window
+        self.max_candidates = max_candidates
+        self._pending = {}  # (expéditeur, sid cible, canal) -> [candidats]
+        self._lock = threading.Lock()
+        self._started = False
+        self.stats = {'candidates': 0, 'frames': 0, 'max_frame': 0}
+
+    def start(self):
+        if self.window > 0 and not self._started:
+            self._started = True
+            self._start_task(self._run)
+
+    def add(self, sender_id, target_sid, channel_id, candidate):
+        key = (sender_id, target_sid, channel_id)
+        with self._lock:
+            self.stats['candidates'] += 1
+            candidates = self._pending.setdefault(key, [])
+            candidates.append(candidate)
+            full = self.window <= 0 or len(candidates) >= self.max_candidates
+        if full:
+            self._flush_key(key)
+
+    def flush_pair(self, sender_id, target_sid):
+        with self._lock:
+            keys = [key for key in self._pending if key[0] == sender_id and key[1] == target_sid]
+        for key in keys:
+            self._flush_key(key)
+
+    def flush(self):
+        with self._lock:
+            keys = list(self._pending)
+        for key in keys:
+            self._flush_key(key)
+
+    def _flush_key(self, key):
+        with self._lock:
+            candidates = self._pending.pop(key, None)
+            if not candidates:
+                return
+            self.stats['frames'] += 1
+            self.stats['max_frame'] = max(self.stats['max_frame'], len(candidates))
+        sender_id, target_sid, channel_id = key
+        self._send(target_sid, channel_id, {
+            'from': sender_id,
+            'channel_id': channel_id,
+            'candidates': candidates
+        })
+
+    def _run(self):
+        while True:
+            self._sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[ICE] Erreur d'envoi: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            frames = self.stats['frames']
+            return dict(self.stats,
+                        window_ms=self.window * 1000,
+                        pending_pairs=len(self._pending),
+                        avg_frame=round(self.stats['candidates'] / frames, 2) if frames else None)
+
+
+class SignalingMetrics:
+    """Trafic de signalisation par canal vocal : offres, réponses, candidats
+    ICE reçus et trames envoyées, débit (messages reçus par seconde sur la
+    dernière fenêtre complète de period secondes) et taille du maillage.
+
+    Un canal sans activité depuis expire_after secondes est oublié.
+    """
+
+    KINDS = ('offer', 'answer', 'ice', 'frames', 'rejected')
+
+    def __init__(self, period=10.0, expire_after=600.0, clock=time.monotonic):
+        self.period = period
+        self.expire_after = expire_after
+        self._clock = clock
+        self._channels = {}  # canal -> compteurs
+        self._lock = threading.Lock()
+
+    def _channel(self, channel_id, now):
+        """Verrou déjà pris"""
+        entry = self._channels.get(channel_id)
+        if entry is None:
+            entry = self._channels[channel_id] = dict.fromkeys(self.KINDS, 0)
+            entry.update(mesh=0, max_mesh=0, window_start=now, window=0, rate=0.0, last=now)
+        elif now - entry['window_start'] >= self.period:
+            # Fenêtre terminée : son débit devient le débit affiché
+            entry['rate'] = entry['window'] / (now - entry['window_start'])
+            entry['window_start'] = now
+            entry['window'] = 0
+        entry['last'] = now
+        return entry
+
+    def record(self, channel_id, kind, count=1):
+        now = self._clock()
+        with self._lock:
+            entry = self._channel(channel_id, now)
+            entry[kind] += count
+            if kind != 'frames':
+                entry['window'] += count
+
+    def mesh(self, channel_id, size):
+        """Nombre de pairs du canal après une entrée ou une sortie"""
+        now = self._clock()
+        with self._lock:
+            entry = self._channel(channel_id, now)
+            entry['mesh'] = size
+            entry['max_mesh'] = max(entry['max_mesh'], size)
+
+    def snapshot(self):
+        now = self._clock()
+        with self._lock:
+            for channel_id in [c for c, e in self._channels.items() if now - e['last'] > self.expire_after]:
+                del self._channels[channel_id]
+            return {
+                channel_id: {
+                    **{kind: entry[kind] for kind in self.KINDS},
+                    'mesh': entry['mesh'],
+                    'max_mesh': entry['max_mesh'],
+                    'rate_per_s': round(entry['rate'], 2),
+                }
+                for channel_id, entry in self._channels.items()
+            }
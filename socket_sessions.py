@@ -0,0 +1,150 @@
+"""
+SESSIONS SOCKET — Likoo
+Registre des connexions : identité des sockets authentifiés (résolue une fois
+à la connexion), sockets de chaque utilisateur, rooms de chaque socket
+"""
+
+import threading
+
+
+class ProfileAuthor:
+    """Auteur reconstruit depuis un profil en cache : même interface que User
+    pour Message.to_dict(author), DirectMessage.to_dict(sender) et le cache
+    des messages (id, to_dict, to_public_dict)"""
+
+    __slots__ = ('id', '_profile')
+
+    def __init__(self, profile):
+        self.id = profile['id']
+        self._profile = profile
+
+    def to_dict(self):
+        return self._profile['full']
+
+    def to_public_dict(self):
+        return self._profile['public']
+
+
+class SocketSessions:
+    """Profil (id, username, avatar, color + dicts complet et public) de
+    l'utilisateur de chaque sid, et index des connexions de ce worker.
+
+    Le JWT est vérifié dans le handler 'connect' ; les handlers d'événements
+    lisent ensuite l'identité ici, sans requête. update_profile() remplace le
+    profil de tous les sockets d'un utilisateur (pseudo, avatar modifiés).
+    Le rôle d'un membre dans un serveur est chargé une fois par socket et par
+    serveur (member_role), oublié quand les rôles du serveur changent.
+
+    Un utilisateur peut avoir plusieurs sockets (onglets, appareils), tous
+    indexés. Les rooms rejointes le sont dans les deux sens (join / leave) :
+    room_sids(room) pour les émissions encodées par socket (format packed),
+    nombre de sockets par room pour les statistiques ; unbind() retire le
+    socket de tous les index.
+
+    Ces index ne couvrent que les sockets de ce worker : les notifications
+    d'un utilisateur passent par sa room user_<id> et la signalisation WebRTC
+    par voice_sid (magasin partagé), qui atteignent un socket sur n'importe
+    quel worker.
+    """
+
+    def __init__(self):
+        self._profiles = {}  # sid -> profil
+        self._user_sids = {}  # user_id -> {sid}
+        self._roles = {}  # sid -> {server_id: role_id}
+        self._rooms = {}  # sid -> {room}
+        self._room_sids = {}  # room -> {sid}
+        self._lock = threading.Lock()
+        self.stats = {'connects': 0, 'refused': 0, 'profile_updates': 0, 'role_loads': 0}
+
+    def bind(self, sid, profile):
+        with self._lock:
+            self._profiles[sid] = profile
+            self._user_sids.setdefault(profile['id'], set()).add(sid)
+            self.stats['connects'] += 1
+
+    def refuse(self):
+        with self._lock:
+            self.stats['refused'] += 1
+
+    def unbind(self, sid):
+        with self._lock:
+            profile = self._profiles.pop(sid, None)
+            self._roles.pop(sid, None)
+            for room in self._rooms.pop(sid, ()):
+                self._discard(self._room_sids, room, sid)
+            if profile:
+                self._discard(self._user_sids, profile['id'], sid)
+            return profile
+
+    def join(self, sid, room):
+        with self._lock:
+            if sid in self._profiles:
+                self._rooms.setdefault(sid, set()).add(room)
+                self._room_sids.setdefault(room, set()).add(sid)
+
+    def leave(self, sid, room):
+        with self._lock:
+            self._discard(self._rooms, sid, room)
+            self._discard(self._room_sids, room, sid)
+
+    def room_sids(self, room):
+        """Sockets de ce worker dans room"""
+        return set(self._room_sids.get(room, ()))
+
+    @staticmethod
+    def _discard(index, key, value):
+        """Verrou déjà pris : retire value de index[key], et la clé si elle est vide"""
+        values = index.get(key)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del index[key]
+
+    def profile(self, sid):
+        return self._profiles.get(sid)
+
+    def author(self, sid):
+        profile = self._profiles.get(sid)
+        return ProfileAuthor(profile) if profile else None
+
+    def update_profile(self, user_id, profile):
+        with self._lock:
+            for sid in self._user_sids.get(user_id, ()):
+                self._profiles[sid] = profile
+            self.stats['profile_updates'] += 1
+
+    def member_role(self, sid, server_id, load):
+        """Rôle de l'utilisateur du socket dans server_id ; load(user_id, server_id)
+        n'est appelé qu'au premier accès du socket à ce serveur"""
+        roles = self._roles.get(sid)
+        if roles is not None and server_id in roles:
+            return roles[server_id]
+        profile = self._profiles.get(sid)
+        if profile is None:
+            return None
+        role = load(profile['id'], server_id)
+        with self._lock:
+            if sid in self._profiles:
+                self._roles.setdefault(sid, {})[server_id] = role
+            self.stats['role_loads'] += 1
+        return role
+
+    def forget_server(self, server_id):
+        """Rôles du serveur modifiés ou serveur supprimé"""
+        with self._lock:
+            for roles in self._roles.values():
+                roles.pop(server_id, None)
+
+    def snapshot(self, top=10):
+        """Compteurs, sockets par utilisateur (répartition) et plus grandes rooms"""
+        with self._lock:
+            per_user = {}
+            for sids in self._user_sids.values():
+                per_user[len(sids)] = per_user.get(len(sids), 0) + 1
+            largest = sorted(self._room_sids.items(), key=lambda item: len(item[1]), reverse=True)[:top]
+            return dict(self.stats,
+                        sockets=len(self._profiles),
+                        users=len(self._user_sids),
+                        sockets_per_user=dict(sorted(per_user.items())),
+                        rooms=len(self._room_sids),
+                        largest_rooms={room: len(sids) for room, sids in largest})
@@ -0,0 +1,90 @@
+"""
+BUDGET DE REQUÊTES — GET /api/servers
+Le nombre de requêtes SQL ne doit pas dépendre du nombre de serveurs, canaux et membres.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Base jetable : à définir avant l'import du serveur
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'likoo_test.db')}"
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from server import app, SERVERS_SUMMARY_QUERY_BUDGET, SERVERS_FULL_QUERY_BUDGET  # noqa: E402
+from models import db, count_queries, User, Server, Channel, Role, ServerMember  # noqa: E402
+
+
+def seed(owner, servers, channels, members):
+    """servers serveurs possédés par owner, chacun avec channels canaux, deux
+    rôles et members membres en plus du propriétaire"""
+    for s in range(servers):
+        server = Server(name=f'{owner.username}-{s}', owner_id=owner.id)
+        db.session.add(server)
+        db.session.flush()
+        for c in range(channels):
+            db.session.add(Channel(name=f'canal-{c}', server_id=server.id, type='voice' if c % 4 == 3 else 'text'))
+        roles = [Role(name=name, server_id=server.id) for name in ('Admin', 'Membre')]
+        db.session.add_all(roles)
+        db.session.flush()
+        db.session.add(ServerMember(user_id=owner.id, server_id=server.id, role_id=roles[0].id))
+        for m in range(members):
+            user = User(username=f'{server.name}-m{m}', email=f'{server.name}-m{m}@test.local',
+                        password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(ServerMember(user_id=user.id, server_id=server.id, role_id=roles[1].id))
+    db.session.commit()
+
+
+@pytest.fixture(scope='module')
+def client():
+    client = app.test_client()
+    client.get('/health')  # création du schéma (before_request)
+    return client
+
+
+def owner_with(prefix, servers, channels, members):
+    name = f'{prefix}-{servers}-{channels}-{members}'
+    with app.app_context():
+        owner = User(username=name, email=f'{name}@test.local', password_hash='x')
+        db.session.add(owner)
+        db.session.commit()
+        seed(owner, servers, channels, members)
+        return owner.id, create_access_token(identity=owner.id)
+
+
+def queries(client, token, view):
+    url = '/api/servers' + ('?view=summary' if view == 'summary' else '')
+    with app.app_context(), count_queries() as counter:
+        response = client.get(url, headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    return counter['count'], response.get_json()
+
+
+@pytest.mark.parametrize('view, budget', [
+    ('summary', SERVERS_SUMMARY_QUERY_BUDGET),
+    ('full', SERVERS_FULL_QUERY_BUDGET),
+])
+def test_servers_query_budget(client, view, budget):
+    counts = []
+    for servers, channels, members in ((1, 2, 1), (8, 6, 5), (20, 12, 10)):
+        _, token = owner_with(view, servers, channels, members)
+        count, payload = queries(client, token, view)
+        assert len(payload) == servers
+        if view == 'full':
+            assert all(len(srv['members']) == members + 1 for srv in payload)
+            assert all(len(srv['channels']) == channels for srv in payload)
+        else:
+            assert all(srv['member_count'] == members + 1 for srv in payload)
+        assert count <= budget, f'{view}: {count} requêtes pour {servers} serveurs (budget {budget})'
+        counts.append(count)
+    # Indépendant de N : autant de requêtes pour 1 serveur que pour 20
+    assert len(set(counts)) == 1, counts
@@ -0,0 +1,99 @@
+"""
+INDICATEUR DE FRAPPE — Likoo
+État « en train d'écrire » par canal, diffusé de façon agrégée et limitée
+"""
+
+import threading
+import time
+
+
+class TypingTracker:
+    """Qui écrit dans chaque canal, avec expiration.
+
+    Le client envoie un événement 'typing' à chaque frappe ; ici, un
+    utilisateur déjà marqué comme écrivant ne fait que prolonger son entrée
+    (événement supprimé). À chaque tick (interval secondes), chaque canal dont
+    la liste a changé (arrivée, envoi du message, expiration après ttl
+    secondes) reçoit une seule mise à jour avec la liste complète : au plus
+    une émission par canal et par intervalle, quel que soit le nombre de frappes.
+
+    emit(channel_id, data) ; start_task / sleep : primitives Socket.IO.
+    """
+
+    def __init__(self, emit, start_task, sleep, interval=1.0, ttl=6.0):
+        self._emit = emit
+        self._start_task = start_task
+        self._sleep = sleep
+        self.interval = interval
+        self.ttl = ttl
+        self._channels = {}  # channel_id -> {user_key: [username, expires_at]}
+        self._dirty = set()  # canaux dont la liste a changé depuis le dernier tick
+        self._lock = threading.Lock()
+        self._started = False
+        self.stats = {'received': 0, 'suppressed': 0, 'emitted': 0, 'expired': 0}
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self._start_task(self._run)
+
+    def typing(self, channel_id, user_key, username):
+        now = time.monotonic()
+        with self._lock:
+            self.stats['received'] += 1
+            typists = self._channels.setdefault(channel_id, {})
+            entry = typists.get(user_key)
+            if entry is not None:
+                entry[1] = now + self.ttl
+                self.stats['suppressed'] += 1
+                return
+            typists[user_key] = [username, now + self.ttl]
+            self._dirty.add(channel_id)
+
+    def stop(self, channel_id, user_key):
+        """Message envoyé : l'utilisateur n'écrit plus"""
+        with self._lock:
+            typists = self._channels.get(channel_id)
+            if typists and typists.pop(user_key, None):
+                self._dirty.add(channel_id)
+                if not typists:
+                    del self._channels[channel_id]
+
+    def tick(self):
+        now = time.monotonic()
+        updates = []
+        with self._lock:
+            for channel_id, typists in list(self._channels.items()):
+                expired = [key for key, (_, expires_at) in typists.items() if expires_at <= now]
+                for key in expired:
+                    del typists[key]
+                if expired:
+                    self.stats['expired'] += len(expired)
+                    self._dirty.add(channel_id)
+                if not typists:
+                    del self._channels[channel_id]
+            for channel_id in self._dirty:
+                typists = self._channels.get(channel_id, {})
+                updates.append((channel_id, {
+                    'channel_id': channel_id,
+                    'users': [{'user_id': key, 'username': name} for key, (name, _) in typists.items()]
+                }))
+            self._dirty = set()
+            self.stats['emitted'] += len(updates)
+        for channel_id, data in updates:
+            self._emit(channel_id, data)
+
+    def _run(self):
+        while True:
+            self._sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"[TYPING] Erreur de diffusion: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            received = self.stats['received']
+            return dict(self.stats,
+                        active_channels=len(self._channels),
+                        suppressed_ratio=round(self.stats['suppressed'] / received, 3) if received else None)
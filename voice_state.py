@@ -0,0 +1,141 @@
+"""
+ÉTAT VOCAL — Likoo
+Occupants des canaux vocaux, par canal et par serveur, dans le magasin partagé
+"""
+
+import threading
+
+
+class VoiceState:
+    """Qui est dans quel canal vocal, pour tous les workers.
+
+    Clés du magasin partagé :
+      voice:{canal}            ensemble des user_id présents
+      voice_channels:{serveur} ensemble des canaux occupés du serveur
+      voice_user:{user}        (canal, serveur) où se trouve l'utilisateur
+      voice_sid:{user}         socket vocal de l'utilisateur (routage WebRTC)
+      voice_profile:{user}     profil affiché {user_id, name, avatar, color}
+
+    Entrée et sortie en O(1) (ensembles) ; les profils des occupants sont
+    lus d'un coup (mget) sans requête SQL. Un socket ne compte que tant
+    qu'il est le socket vocal de son utilisateur : si un autre onglet a
+    rejoint le vocal depuis, son départ ou sa déconnexion ne retire rien.
+    Chaque worker garde les sockets vocaux de ses propres clients (sid ->
+    utilisateur, canal, serveur) pour les retirer à la déconnexion.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._local = {}  # sid -> (user_id, channel_id, server_id)
+        self._lock = threading.Lock()
+        self.stats = {'joins': 0, 'leaves': 0, 'disconnects': 0, 'moves': 0, 'snapshots': 0}
+
+    def admit(self, user_id, channel_id, limit):
+        """Réserve la place de user_id dans channel_id (limit participants au
+        plus, 0 : sans limite) ; False si le canal est complet. Vérification
+        et ajout forment une seule opération du magasin : deux entrées
+        simultanées, même sur deux workers, ne dépassent pas la limite."""
+        if not limit:
+            return True
+        return self._store.sadd_if_below(f'voice:{channel_id}', user_id, limit)
+
+    def join(self, sid, user_id, channel_id, server_id, profile):
+        """Entrée dans channel_id ; (canal, serveur) précédent si l'utilisateur
+        était dans un autre canal vocal (il en est retiré), sinon None"""
+        previous = self._store.get(f'voice_user:{user_id}')
+        if previous and previous[0] == channel_id:
+            previous = None
+        elif previous:
+            self._remove(user_id, *previous)
+        self._store.set(f'voice_profile:{user_id}', profile)
+        self._store.set(f'voice_user:{user_id}', (channel_id, server_id))
+        self._store.set(f'voice_sid:{user_id}', sid)
+        self._store.sadd(f'voice:{channel_id}', user_id)
+        self._store.sadd(f'voice_channels:{server_id}', channel_id)
+        with self._lock:
+            self._local[sid] = (user_id, channel_id, server_id)
+            self.stats['joins'] += 1
+            if previous:
+                self.stats['moves'] += 1
+        return previous
+
+    def leave(self, sid, user_id):
+        """Sortie volontaire : (canal, serveur) quitté, ou None si ce socket
+        n'était pas (ou plus) le socket vocal de l'utilisateur"""
+        with self._lock:
+            self._local.pop(sid, None)
+        left = self._release(sid, user_id)
+        if left:
+            with self._lock:
+                self.stats['leaves'] += 1
+        return left
+
+    def disconnect(self, sid):
+        """Socket fermé : (user_id, canal, serveur) s'il occupait un canal vocal"""
+        with self._lock:
+            entry = self._local.pop(sid, None)
+        if entry is None:
+            return None
+        left = self._release(sid, entry[0])
+        if not left:
+            return None
+        with self._lock:
+            self.stats['disconnects'] += 1
+        return (entry[0],) + left
+
+    def target_sid(self, user_id):
+        """Socket vers lequel router la signalisation WebRTC destinée à user_id"""
+        return self._store.get(f'voice_sid:{user_id}')
+
+    def occupants(self, channel_id):
+        """user_id présents dans le canal"""
+        return self._store.smembers(f'voice:{channel_id}')
+
+    def members(self, channel_id):
+        """Profils des occupants du canal, dans l'ordre d'arrivée"""
+        user_ids = self.occupants(channel_id)
+        if not user_ids:
+            return []
+        profiles = self._store.mget([f'voice_profile:{user_id}' for user_id in user_ids])
+        return [profile for profile in profiles if profile]
+
+    def server_snapshot(self, server_id):
+        """{canal: [profils]} pour tous les canaux vocaux occupés du serveur"""
+        with self._lock:
+            self.stats['snapshots'] += 1
+        snapshot = {}
+        for channel_id in self._store.smembers(f'voice_channels:{server_id}'):
+            members = self.members(channel_id)
+            if members:
+                snapshot[channel_id] = members
+        return snapshot
+
+    def update_profile(self, user_id, profile):
+        """Pseudo / avatar modifiés : profil affiché mis à jour s'il est en vocal"""
+        if self._store.get(f'voice_user:{user_id}'):
+            self._store.set(f'voice_profile:{user_id}', profile)
+
+    def _release(self, sid, user_id):
+        # Seul le socket vocal courant libère la place ; sans socket enregistré
+        # (état hérité d'un redémarrage), la sortie est acceptée
+        if not self._store.delete_if(f'voice_sid:{user_id}', sid) \
+                and self._store.get(f'voice_sid:{user_id}') is not None:
+            return None
+        location = self._store.pop(f'voice_user:{user_id}')
+        if not location:
+            return None
+        self._remove(user_id, *location)
+        self._store.delete(f'voice_profile:{user_id}')
+        return tuple(location)
+
+    def _remove(self, user_id, channel_id, server_id):
+        self._store.srem(f'voice:{channel_id}', user_id)
+        if not self._store.smembers(f'voice:{channel_id}'):
+            self._store.srem(f'voice_channels:{server_id}', channel_id)
+            # Quelqu'un a pu entrer entre-temps
+            if self._store.smembers(f'voice:{channel_id}'):
+                self._store.sadd(f'voice_channels:{server_id}', channel_id)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, local_sockets=len(self._local))
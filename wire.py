@@ -0,0 +1,350 @@
+"""
+FORMAT BINAIRE — Likoo
+Payloads 'packed' : MessagePack, tableaux positionnels, dates en ms, ids internés
+"""
+
+import struct
+import threading
+from collections import OrderedDict
+from datetime import timezone
+
+try:
+    import msgpack
+except ImportError:  # encodeur intégré (sous-ensemble compatible MessagePack)
+    msgpack = None
+
+# Statut de présence -> code (index dans la liste)
+STATUS_CODES = ('offline', 'online', 'away', 'dnd')
+
+
+def packb(obj):
+    if msgpack:
+        return msgpack.packb(obj, use_bin_type=True)
+    out = bytearray()
+    _pack(obj, out)
+    return bytes(out)
+
+
+def unpackb(data):
+    if msgpack:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    obj, _ = _unpack(memoryview(data), 0)
+    return obj
+
+
+def epoch_ms(value):
+    """DateTime naïf (UTC, comme en base) -> millisecondes depuis l'epoch"""
+    if value is None:
+        return None
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+# ═══════════════════════════════════════════════════
+# IDS INTERNÉS
+# ═══════════════════════════════════════════════════
+
+class RefTable:
+    """Ids (UUID texte) -> petits entiers, propres à ce worker, et refs déjà
+    envoyées à chaque socket.
+
+    Un payload porte les définitions {ref: id} des refs que son destinataire
+    n'a pas encore reçues : les sockets qui les connaissent toutes partagent
+    un même encodage, les autres reçoivent une variante avec 'd'. Un client
+    qui passe sur un autre worker reçoit donc toute ref avant de la lire, et
+    resolve() ne répond que pour les refs déjà envoyées à ce socket.
+
+    Au plus capacity ids sont gardés (les moins récemment émis sont oubliés) ;
+    un numéro n'est jamais réattribué, un id oublié en reçoit un nouveau.
+    """
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._refs = OrderedDict()  # id -> ref, du moins récent au plus récent
+        self._ids = {}  # ref -> id
+        self._next = 0
+        self._sent = {}  # sid -> {ref}
+        self._lock = threading.Lock()
+        self.stats = {'refs': 0, 'evicted': 0, 'encodings': 0, 'defs_sent': 0, 'resolved': 0}
+
+    def encode(self, fields, sids):
+        """[(payload binaire, [sid])] de fields (ids en clair aux positions
+        REF_SLOTS) pour les sockets sids, regroupés par définitions manquantes"""
+        payload = {key: list(values) for key, values in fields.items()}
+        values = {}  # ref -> id, pour les définitions
+        groups = {}
+        with self._lock:
+            for key, index in REF_SLOTS:
+                slots = payload.get(key)
+                if slots is not None and len(slots) > index:
+                    ref = self._ref(slots[index])
+                    values[ref] = slots[index]
+                    slots[index] = ref
+            for sid in sids:
+                sent = self._sent.setdefault(sid, set())
+                if len(sent) > self.capacity:
+                    sent.clear()  # le client reçoit à nouveau les définitions
+                missing = frozenset(ref for ref in values if ref not in sent)
+                sent.update(missing)
+                groups.setdefault(missing, []).append(sid)
+                self.stats['defs_sent'] += len(missing)
+            self.stats['encodings'] += len(groups)
+        return [(_finish(dict(payload), {ref: values[ref] for ref in missing}), group)
+                for missing, group in groups.items()]
+
+    def resolve(self, sid, refs):
+        """{ref: id} pour les refs demandées par un client, parmi celles qui
+        lui ont été envoyées"""
+        resolved = {}
+        with self._lock:
+            sent = self._sent.get(sid, ())
+            for ref in refs[:500]:
+                if isinstance(ref, int) and ref in sent and ref in self._ids:
+                    resolved[ref] = self._ids[ref]
+            self.stats['resolved'] += len(resolved)
+        return resolved
+
+    def forget(self, sid):
+        """Socket déconnecté"""
+        with self._lock:
+            self._sent.pop(sid, None)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._refs), sockets=len(self._sent))
+
+    def _ref(self, value):
+        """Verrou déjà pris"""
+        ref = self._refs.get(value)
+        if ref is not None:
+            self._refs.move_to_end(value)
+            return ref
+        ref = self._refs[value] = self._next
+        self._ids[ref] = value
+        self._next += 1
+        self.stats['refs'] += 1
+        if len(self._refs) > self.capacity:
+            _, oldest = self._refs.popitem(last=False)
+            del self._ids[oldest]
+            self.stats['evicted'] += 1
+        return ref
+
+
+# ═══════════════════════════════════════════════════
+# PAYLOADS
+# ═══════════════════════════════════════════════════
+
+# Positions des ids internés dans un payload : (clé, index)
+REF_SLOTS = (('m', 1), ('m', 2), ('u', 0), ('p', 0))
+
+
+def _author(author_id, public):
+    return [author_id, public['username'], public['avatar'], public['color'], public['tag']]
+
+
+def _finish(payload, defs):
+    if defs:
+        payload['d'] = defs
+    return packb(payload)
+
+
+def message_fields(message, author):
+    """new_message : m = [id, canal, auteur, contenu, créé (ms), modifié (ms)],
+    u = [auteur, pseudo, avatar, couleur, tag]"""
+    return {
+        'm': [message.id, message.channel_id, message.author_id, message.content,
+              epoch_ms(message.created_at), epoch_ms(message.edited_at)],
+        'u': _author(message.author_id, author.to_public_dict())
+    }
+
+
+def dm_fields(message, sender):
+    """new_dm : m = [id, expéditeur, destinataire, contenu, créé (ms)], u comme new_message"""
+    return {
+        'm': [message.id, message.sender_id, message.receiver_id, message.content,
+              epoch_ms(message.created_at)],
+        'u': _author(message.sender_id, sender.to_public_dict())
+    }
+
+
+def presence_fields(user_id, status):
+    """user_status_changed : p = [utilisateur, code de statut]"""
+    return {'p': [user_id, STATUS_CODES.index(status)]}
+
+
+class PackedFanout:
+    """Émissions du format packed vers les sockets de ce worker.
+
+    Rien n'est encodé si aucun socket local n'est dans les rooms '<room>:packed'
+    (room_sids(room) -> sids). Chaque socket reçoit le payload encodé pour lui
+    par refs.encode(), via send(event, data, sid). publish() est répliqué sur
+    les autres workers (ids en clair dans fields) ; emit() ne sert que ce
+    worker, pour les événements calculés par chacun (présence).
+    """
+
+    def __init__(self, refs, room_sids, send):
+        self._refs = refs
+        self._room_sids = room_sids
+        self._send = send
+        self.stats = {'events': 0, 'skipped': 0, 'deliveries': 0}
+
+    def publish(self, event, fields, rooms):
+        self.emit(event, fields, rooms)
+
+    def emit(self, event, fields, rooms):
+        self.stats['events'] += 1
+        sids = set()
+        for room in rooms:
+            sids |= self._room_sids(f'{room}:packed')
+        if not sids:
+            self.stats['skipped'] += 1
+            return
+        for data, group in self._refs.encode(fields, sids):
+            for sid in group:
+                self._send(event, data, sid)
+            self.stats['deliveries'] += len(group)
+
+
+# ═══════════════════════════════════════════════════
+# ENCODEUR INTÉGRÉ (sans la bibliothèque msgpack)
+# ═══════════════════════════════════════════════════
+
+def _pack(obj, out):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        _pack_int(obj, out)
+    elif isinstance(obj, float):
+        out += b'\xcb' + struct.pack('>d', obj)
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        n = len(data)
+        if n < 32:
+            out.append(0xa0 | n)
+        elif n < 0x100:
+            out += b'\xd9' + struct.pack('>B', n)
+        elif n < 0x10000:
+            out += b'\xda' + struct.pack('>H', n)
+        else:
+            out += b'\xdb' + struct.pack('>I', n)
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        n = len(obj)
+        if n < 0x100:
+            out += b'\xc4' + struct.pack('>B', n)
+        elif n < 0x10000:
+            out += b'\xc5' + struct.pack('>H', n)
+        else:
+            out += b'\xc6' + struct.pack('>I', n)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 0x10000:
+            out += b'\xdc' + struct.pack('>H', n)
+        else:
+            out += b'\xdd' + struct.pack('>I', n)
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out += b'\xde' + struct.pack('>H', n)
+        else:
+            out += b'\xdf' + struct.pack('>I', n)
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f'Type non sérialisable: {type(obj).__name__}')
+
+
+def _pack_int(n, out):
+    if 0 <= n < 0x80:
+        out.append(n)
+    elif -32 <= n < 0:
+        out.append(n & 0xff)
+    elif n >= 0:
+        for code, fmt, limit in ((0xcc, '>B', 0x100), (0xcd, '>H', 0x10000),
+                                 (0xce, '>I', 0x100000000), (0xcf, '>Q', 1 << 64)):
+            if n < limit:
+                out.append(code)
+                out += struct.pack(fmt, n)
+                return
+        raise OverflowError('Entier trop grand')
+    else:
+        for code, fmt, limit in ((0xd0, '>b', 0x80), (0xd1, '>h', 0x8000),
+                                 (0xd2, '>i', 0x80000000), (0xd3, '>q', 1 << 63)):
+            if n >= -limit:
+                out.append(code)
+                out += struct.pack(fmt, n)
+                return
+        raise OverflowError('Entier trop petit')
+
+
+# Formats à taille fixe : code -> (format struct, taille)
+_FIXED = {
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8),
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+}
+# Longueurs : code -> (format struct, taille, genre)
+_SIZED = {
+    0xd9: ('>B', 1, 'str'), 0xda: ('>H', 2, 'str'), 0xdb: ('>I', 4, 'str'),
+    0xc4: ('>B', 1, 'bin'), 0xc5: ('>H', 2, 'bin'), 0xc6: ('>I', 4, 'bin'),
+    0xdc: ('>H', 2, 'array'), 0xdd: ('>I', 4, 'array'),
+    0xde: ('>H', 2, 'map'), 0xdf: ('>I', 4, 'map'),
+}
+
+
+def _unpack(data, pos):
+    code = data[pos]
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if code <= 0x8f:
+        return _unpack_container('map', code & 0x0f, data, pos)
+    if code <= 0x9f:
+        return _unpack_container('array', code & 0x0f, data, pos)
+    if code <= 0xbf:
+        n = code & 0x1f
+        return str(data[pos:pos + n], 'utf-8'), pos + n
+    if code == 0xc0:
+        return None, pos
+    if code in (0xc2, 0xc3):
+        return code == 0xc3, pos
+    if code in _FIXED:
+        fmt, size = _FIXED[code]
+        return struct.unpack_from(fmt, data, pos)[0], pos + size
+    if code in _SIZED:
+        fmt, size, kind = _SIZED[code]
+        n = struct.unpack_from(fmt, data, pos)[0]
+        pos += size
+        if kind == 'str':
+            return str(data[pos:pos + n], 'utf-8'), pos + n
+        if kind == 'bin':
+            return bytes(data[pos:pos + n]), pos + n
+        return _unpack_container(kind, n, data, pos)
+    raise ValueError(f'Code MessagePack non supporté: {code:#x}')
+
+
+def _unpack_container(kind, n, data, pos):
+    if kind == 'array':
+        items = []
+        for _ in range(n):
+            item, pos = _unpack(data, pos)
+            items.append(item)
+        return items, pos
+    result = {}
+    for _ in range(n):
+        key, pos = _unpack(data, pos)
+        result[key], pos = _unpack(data, pos)
+    return result, pos
@@ -0,0 +1,301 @@
+"""
+WRITE-BEHIND — Likoo
+Persistance différée et groupée des messages envoyés par WebSocket
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+class WriteBehindFull(Exception):
+    """La file d'écriture est pleine (backpressure) : le message n'est pas accepté"""
+
+
+class WriteBehindWriter:
+    """Écrit les messages en base par lots depuis un thread dédié.
+
+    Le handler WebSocket appelle submit() puis diffuse immédiatement ; le thread
+    d'écriture regroupe les lignes en attente (jusqu'à batch_size, ou après
+    flush_interval secondes) et les insère en une seule transaction.
+
+    Chaque ligne acceptée est d'abord ajoutée à un journal (append, sans fsync)
+    relu au démarrage : un message acquitté survit à un arrêt brutal du
+    processus. Le journal est découpé en segments de segment_size lignes
+    (<journal>.000001, ...) : les lignes étant écrites dans l'ordre, un
+    segment fermé est supprimé dès que sa dernière ligne est en base, et le
+    segment courant est vidé quand plus rien n'est en attente. Le journal
+    reste ainsi borné sous un trafic continu.
+    Rien n'est écrit avant ready(), appelé une fois le schéma à jour (tables,
+    colonnes, index) : les lignes relues du journal passent alors en premier.
+
+    Un lot refusé est réessayé max_retries fois, puis coupé en deux ; une ligne
+    seule toujours refusée (clé étrangère disparue après une purge…) part dans
+    le fichier dead_letter_path au lieu de bloquer l'écriture.
+
+    offload(fn, *args) : exécute l'insertion hors de la boucle en mode async
+    (le thread d'écriture est alors une greenlet) ; None = appel direct.
+    """
+
+    def __init__(self, app, db, models, journal_path, flush_interval=0.05,
+                 batch_size=500, max_queue=10000, put_timeout=0.5, max_retries=5,
+                 segment_size=5000, dead_letter_path=None, offload=None):
+        self.app = app
+        self.db = db
+        self.models = models  # {'message': Message, 'dm': DirectMessage}
+        self.journal_path = str(journal_path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.segment_size = segment_size
+        self.dead_letter_path = str(dead_letter_path or f'{os.path.splitext(self.journal_path)[0]}.dead.jsonl')
+        self._offload = offload or (lambda fn, *args: fn(*args))
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()  # protège le journal, ses segments et _unflushed
+        self._unflushed = 0
+        self._journal = None
+        self._segment = 0  # numéro du segment courant
+        self._segment_rows = 0
+        self._closed = deque()  # (chemin, lignes acceptées à sa fermeture) des segments fermés
+        self._accepted = 0  # lignes journalisées depuis le démarrage (relues comprises)
+        self._done = 0  # lignes traitées (en base ou dead letter), dans l'ordre
+        self._recovered = []  # lignes relues du journal, écrites après ready()
+        self._thread = None
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self.stats = {'submitted': 0, 'flushed': 0, 'batches': 0, 'rejected': 0, 'errors': 0,
+                      'recovered': 0, 'splits': 0, 'dead_lettered': 0, 'segments_removed': 0}
+
+    # ── Cycle de vie ────────────────────────────────
+
+    def start(self):
+        """Relit le journal d'un arrêt précédent (sans toucher à la base) puis
+        lance le thread d'écriture, qui attend ready()"""
+        if self._thread:
+            return
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        self._read_journal()
+        # Les segments relus restent sur le disque jusqu'à l'écriture de leurs lignes
+        self._journal = open(self._segment_path(self._segment), 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def ready(self):
+        """Schéma en place : le thread peut écrire (journal relu d'abord)"""
+        self._ready.set()
+
+    def stop(self, timeout=10):
+        """Vide la file puis arrête le thread (appelé à l'arrêt du serveur)"""
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        with self._lock:
+            self._journal.close()
+            self._journal = None
+
+    # ── API ─────────────────────────────────────────
+
+    def submit(self, kind, row):
+        """Met une ligne (dict de colonnes) en file d'écriture.
+
+        Attend au plus put_timeout secondes si la file est pleine, puis lève
+        WriteBehindFull : l'appelant doit alors refuser le message.
+        """
+        record = json.dumps({'kind': kind, 'row': row}, default=_encode_datetime)
+        deadline = time.monotonic() + self.put_timeout
+        while True:
+            with self._lock:
+                if self._stopping.is_set():
+                    raise WriteBehindFull('Arrêt en cours')
+                try:
+                    self._queue.put_nowait((kind, row))
+                except queue.Full:
+                    pass
+                else:
+                    self._journal.write(record + '\n')
+                    self._journal.flush()
+                    self._unflushed += 1
+                    self._accepted += 1
+                    self._segment_rows += 1
+                    self.stats['submitted'] += 1
+                    if self._segment_rows >= self.segment_size:
+                        self._rotate()
+                    return
+            if time.monotonic() >= deadline:
+                self.stats['rejected'] += 1
+                raise WriteBehindFull('File d\'écriture pleine')
+            time.sleep(0.005)
+
+    def pending(self):
+        """Nombre de lignes acceptées mais pas encore en base"""
+        return self._unflushed
+
+    def flush(self, timeout=5):
+        """Attend que toutes les lignes en file soient écrites"""
+        deadline = time.monotonic() + timeout
+        while self._unflushed and time.monotonic() < deadline:
+            time.sleep(self.flush_interval / 2 or 0.001)
+        return not self._unflushed
+
+    # ── Thread d'écriture ───────────────────────────
+
+    def _run(self):
+        while not self._ready.wait(0.1):
+            if self._stopping.is_set():
+                return  # jamais prêt : tout reste dans le journal
+        recovered, self._recovered = self._recovered, []
+        if recovered:
+            print(f"[WRITE-BEHIND] Rejeu de {len(recovered)} messages du journal")
+        for i in range(0, len(recovered), self.batch_size):
+            self._write(recovered[i:i + self.batch_size])
+        while True:
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+            elif self._stopping.is_set() and self._queue.empty():
+                return
+
+    def _collect(self):
+        """Attend une première ligne puis regroupe jusqu'à batch_size / flush_interval"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """Insère un lot (voir _write_rows) puis le retire du compte en attente"""
+        written = self._write_rows(batch)
+        with self._lock:
+            self._unflushed -= len(batch)
+            self._done += len(batch)
+            self.stats['flushed'] += written
+            self.stats['batches'] += 1
+            # Segments fermés dont toutes les lignes sont traitées
+            while self._closed and self._closed[0][1] <= self._done:
+                self._remove_segment(self._closed.popleft()[0])
+            # Tout ce qui est journalisé est en base : le segment courant est vidé
+            if not self._unflushed and self._journal:
+                self._journal.truncate(0)
+                self._journal.seek(0)
+                self._segment_rows = 0
+
+    def _rotate(self):
+        """Verrou déjà pris : ferme le segment courant et en ouvre un nouveau"""
+        self._journal.close()
+        self._closed.append((self._segment_path(self._segment), self._accepted))
+        self._segment += 1
+        self._segment_rows = 0
+        self._journal = open(self._segment_path(self._segment), 'a', encoding='utf-8')
+
+    def _remove_segment(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        self.stats['segments_removed'] += 1
+
+    def _segment_path(self, number):
+        return f'{self.journal_path}.{number:06d}'
+
+    def _segment_numbers(self):
+        directory, prefix = os.path.split(self.journal_path)
+        prefix += '.'
+        return sorted(int(name[len(prefix):]) for name in os.listdir(directory or '.')
+                      if name.startswith(prefix) and name[len(prefix):].isdigit())
+
+    def _write_rows(self, batch):
+        """max_retries essais avec attente croissante, puis chaque moitié à
+        part ; une ligne seule refusée va au fichier dead letter. Nombre de
+        lignes écrites en base"""
+        delay = self.flush_interval or 0.05
+        for attempt in range(self.max_retries):
+            try:
+                self._offload(self._insert_in_context, batch)
+                return len(batch)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"[WRITE-BEHIND] Erreur d'écriture ({len(batch)} lignes, essai {attempt + 1}): {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
+        if len(batch) > 1:
+            self.stats['splits'] += 1
+            middle = len(batch) // 2
+            return self._write_rows(batch[:middle]) + self._write_rows(batch[middle:])
+        kind, row = batch[0]
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'kind': kind, 'row': row}, default=_encode_datetime) + '\n')
+        self.stats['dead_lettered'] += 1
+        print(f"[WRITE-BEHIND] Ligne {kind} {row.get('id')} abandonnée -> {self.dead_letter_path}")
+        return 0
+
+    def _insert_in_context(self, batch):
+        with self.app.app_context():
+            self._insert(batch)
+
+    def _insert(self, batch):
+        by_kind = {}
+        for kind, row in batch:
+            by_kind.setdefault(kind, []).append(row)
+        try:
+            for kind, rows in by_kind.items():
+                # OR IGNORE : rejouer le journal après un crash reste idempotent
+                stmt = self.db.insert(self.models[kind]).prefix_with('OR IGNORE')
+                self.db.session.execute(stmt, rows)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+
+    def _read_journal(self):
+        """Relit les segments dans l'ordre ; chacun devient un segment fermé,
+        supprimé une fois ses lignes rejouées. Le nouveau segment suit le dernier"""
+        rows = []
+        closed = []
+        numbers = self._segment_numbers()
+        for number in numbers:
+            path = self._segment_path(number)
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # dernière ligne tronquée par un arrêt brutal
+                    rows.append((record['kind'], _decode_datetimes(record['row'])))
+            closed.append((path, len(rows)))
+        with self._lock:
+            self._recovered = rows
+            self._closed.extend(closed)
+            self._segment = numbers[-1] + 1 if numbers else 1
+            self._accepted = len(rows)
+            self._unflushed += len(rows)
+            self.stats['recovered'] += len(rows)
+
+
+def _encode_datetime(value):
+    if isinstance(value, datetime):
+        return {'__dt__': value.isoformat()}
+    raise TypeError(f'Type non sérialisable: {type(value)}')
+
+
+def _decode_datetimes(row):
+    return {
+        k: datetime.fromisoformat(v['__dt__']) if isinstance(v, dict) and '__dt__' in v else v
+        for k, v in row.items()
+    }